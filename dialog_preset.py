@@ -1,52 +1,129 @@
 import os
 import json
+import sqlite3
 import datetime
 from qgis.PyQt.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QListWidget, QPushButton, QLineEdit, QLabel, QFormLayout,
                              QMessageBox, QCheckBox, QDialogButtonBox, QGroupBox, QComboBox, QWidget, QListWidgetItem)
 
 
 class PresetManager:
-    def __init__(self, plugin_dir):
-        self.plugin_dir = plugin_dir
-        self.presets_file = os.path.join(plugin_dir, "grd2stream_presets.json")
-        self.presets = self.load_presets()
-
-    def load_presets(self):
-        if os.path.exists(self.presets_file):
-            try:
-                with open(self.presets_file, 'r') as f:
-                    return json.load(f)
-            except json.JSONDecodeError:
-                return {}
-        return {}
+    """Stores presets in an SQLite database, importing the legacy JSON presets file on first use."""
+
+    def __init__(self, profile_dir, legacy_dir=None):
+        self.database_path = os.path.join(profile_dir, "grd2stream", "presets.sqlite")
+        self.presets_file = os.path.join(legacy_dir, "grd2stream_presets.json") if legacy_dir else None
+        os.makedirs(os.path.dirname(self.database_path), exist_ok=True)
+        self.connection = sqlite3.connect(self.database_path, timeout=10)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.create_tables()
+        self.import_json_presets()
+
+    def create_tables(self):
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS presets ("
+                "name TEXT PRIMARY KEY, "
+                "raster_1_name TEXT, "
+                "raster_2_name TEXT, "
+                "last_edited TEXT, "
+                "data TEXT NOT NULL)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS presets_raster_1 ON presets (raster_1_name)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS presets_raster_2 ON presets (raster_2_name)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
 
-    def save_presets(self):
-        with open(self.presets_file, 'w') as f:
-            json.dump(self.presets, f, indent=4)
+    def import_json_presets(self):
+        if not self.presets_file or not os.path.exists(self.presets_file):
+            return
+        if self.connection.execute("SELECT 1 FROM meta WHERE key = 'json_imported'").fetchone():
+            return
+        try:
+            with open(self.presets_file, 'r') as f:
+                presets = json.load(f)
+            if not isinstance(presets, dict):
+                raise ValueError("expected an object of presets")
+        except (OSError, ValueError) as e:
+            # not marked as imported, so the migration is retried once the file is readable
+            print(f"Could not import presets from {self.presets_file}: {e}")
+            QMessageBox.warning(
+                None, "Preset Import",
+                f"Presets from '{self.presets_file}' could not be imported:\n{e}\n\n"
+                "They will be imported on the next start once the file can be read."
+            )
+            return
+        with self.connection:
+            for name, data in presets.items():
+                self.connection.execute(
+                    "INSERT OR IGNORE INTO presets (name, raster_1_name, raster_2_name, last_edited, data) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    self.preset_row(name, data)
+                )
+            self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_imported', ?)",
+                                    (self.presets_file,))
+        print(f"Imported {len(presets)} preset(s) from {self.presets_file}")
+
+    def preset_row(self, name, data):
+        return name, data.get('raster_1_name'), data.get('raster_2_name'), data.get('last_edited'), json.dumps(data)
 
     def add_preset(self, name, data):
-        self.presets[name] = data
-        self.save_presets()
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO presets (name, raster_1_name, raster_2_name, last_edited, data) "
+                "VALUES (?, ?, ?, ?, ?)",
+                self.preset_row(name, data)
+            )
 
     def update_preset(self, name, data):
-        if name in self.presets:
-            self.presets[name] = data
-            self.save_presets()
-            return True
-        return False
+        with self.connection:
+            cursor = self.connection.execute(
+                "UPDATE presets SET name = ?, raster_1_name = ?, raster_2_name = ?, last_edited = ?, data = ? "
+                "WHERE name = ?",
+                self.preset_row(name, data) + (name,)
+            )
+        return cursor.rowcount > 0
+
+    def rename_preset(self, old_name, new_name, data):
+        with self.connection:
+            self.connection.execute("DELETE FROM presets WHERE name = ?", (new_name,))
+            cursor = self.connection.execute(
+                "UPDATE presets SET name = ?, raster_1_name = ?, raster_2_name = ?, last_edited = ?, data = ? "
+                "WHERE name = ?",
+                self.preset_row(new_name, data) + (old_name,)
+            )
+        return cursor.rowcount > 0
 
     def delete_preset(self, name):
-        if name in self.presets:
-            del self.presets[name]
-            self.save_presets()
-            return True
-        return False
+        with self.connection:
+            cursor = self.connection.execute("DELETE FROM presets WHERE name = ?", (name,))
+        return cursor.rowcount > 0
 
     def get_preset(self, name):
-        return self.presets.get(name)
+        row = self.connection.execute("SELECT data FROM presets WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def has_preset(self, name):
+        return self.connection.execute("SELECT 1 FROM presets WHERE name = ?", (name,)).fetchone() is not None
 
     def get_preset_names(self):
-        return list(self.presets.keys())
+        return [row[0] for row in self.connection.execute("SELECT name FROM presets ORDER BY name")]
+
+    def get_presets(self, search_text=None):
+        """Returns (name, data) pairs, optionally filtered by preset or raster name."""
+        if search_text:
+            escaped = search_text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            pattern = f"%{escaped}%"
+            rows = self.connection.execute(
+                "SELECT name, data FROM presets WHERE name LIKE ? ESCAPE '\\' OR raster_1_name LIKE ? ESCAPE '\\' "
+                "OR raster_2_name LIKE ? ESCAPE '\\' ORDER BY name",
+                (pattern, pattern, pattern)
+            )
+        else:
+            rows = self.connection.execute("SELECT name, data FROM presets ORDER BY name")
+        return [(name, json.loads(data)) for name, data in rows]
+
+    def close(self):
+        self.connection.close()
 
 
 class PresetItemWidget(QWidget):
@@ -75,6 +152,8 @@ class PresetItemWidget(QWidget):
         tooltip = f"<b>Raster 1:</b> {self.preset_data.get('raster_1_name', 'Unknown')} (Band {self.preset_data.get('band_1', 1)})<br>"
         tooltip += f"<b>Raster 2:</b> {self.preset_data.get('raster_2_name', 'Unknown')} (Band {self.preset_data.get('band_2', 1)})<br>"
         tooltip += f"<b>Backward Steps:</b> {'Yes' if self.preset_data.get('backward_steps', False) else 'No'}<br>"
+        if self.preset_data.get('bidirectional', False):
+            tooltip += "<b>Both Directions:</b> Yes<br>"
         if self.preset_data.get('step_size') is not None:
             tooltip += f"<b>Step Size:</b> {self.preset_data.get('step_size')}<br>"
         else:
@@ -95,6 +174,26 @@ class PresetItemWidget(QWidget):
         else:
             format_str = "x y dist [default]"
         tooltip += f"<b>Output Format:</b> {format_str}"
+        if self.preset_data.get('aoi_mode') == "steps":
+            tooltip += "<br><b>Area of Interest:</b> max. steps × step size"
+        elif self.preset_data.get('aoi_mode') == "canvas":
+            tooltip += "<br><b>Area of Interest:</b> map canvas extent"
+        if self.preset_data.get('merge_tolerance') is not None:
+            tooltip += f"<br><b>Merge Tolerance:</b> {self.preset_data.get('merge_tolerance')}"
+        if self.preset_data.get('adaptive_mode', False):
+            tooltip += "<br><b>Adaptive Step Size:</b> Yes"
+        if self.preset_data.get('derived_attributes', False):
+            tooltip += "<br><b>Derived Attributes:</b> Yes"
+        if self.preset_data.get('sample_rasters'):
+            tooltip += ("<br><b>Sampled Rasters:</b> "
+                        + ", ".join(raster['field'] for raster in self.preset_data.get('sample_rasters')))
+        if self.preset_data.get('compact_grids', False):
+            tooltip += "<br><b>Compact Grids:</b> float32"
+        if self.preset_data.get('export_path'):
+            tooltip += f"<br><b>Export:</b> {self.preset_data.get('export_path')}"
+        if self.preset_data.get('simplify_tolerance') is not None:
+            tooltip += (f"<br><b>Simplification:</b> {self.preset_data.get('simplify_tolerance')} "
+                        f"({self.preset_data.get('simplify_method', 'douglas-peucker')})")
         return tooltip
 
 
@@ -106,10 +205,14 @@ class PresetDialog(QDialog):
         self.setWindowTitle("Preset Manager")
         self.resize(400, 300)
         layout = QVBoxLayout(self)
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("Search presets or raster names...")
+        self.search_edit.textChanged.connect(lambda _: self.populate_preset_list())
         self.preset_list = QListWidget()
         self.preset_list.setMouseTracking(True)
         self.populate_preset_list()
         layout.addWidget(QLabel("Select a preset:"))
+        layout.addWidget(self.search_edit)
         layout.addWidget(self.preset_list)
 
         button_layout = QHBoxLayout()
@@ -129,8 +232,7 @@ class PresetDialog(QDialog):
 
     def populate_preset_list(self):
         self.preset_list.clear()
-        for preset_name in self.preset_manager.get_preset_names():
-            preset_data = self.preset_manager.get_preset(preset_name)
+        for preset_name, preset_data in self.preset_manager.get_presets(self.search_edit.text().strip()):
             list_item = QListWidgetItem(self.preset_list)
             item_widget = PresetItemWidget(preset_name, preset_data)
             list_item.setSizeHint(item_widget.sizeHint())
@@ -203,6 +305,9 @@ class EditPresetDialog(QDialog):
         self.backward_checkbox = QCheckBox()
         self.backward_checkbox.setChecked(preset_data.get('backward_steps', False))
         param_layout.addRow("Backward Steps:", self.backward_checkbox)
+        self.bidirectional_checkbox = QCheckBox()
+        self.bidirectional_checkbox.setChecked(preset_data.get('bidirectional', False))
+        param_layout.addRow("Both Directions:", self.bidirectional_checkbox)
         self.step_size_edit = QLineEdit()
         if preset_data.get('step_size') is not None:
             self.step_size_edit.setText(str(preset_data.get('step_size')))
@@ -236,7 +341,7 @@ class EditPresetDialog(QDialog):
         if not new_name:
             QMessageBox.warning(self, "Invalid Name", "Preset name cannot be empty.")
             return
-        if new_name != self.preset_name and new_name in self.preset_manager.get_preset_names():
+        if new_name != self.preset_name and self.preset_manager.has_preset(new_name):
             reply = QMessageBox.question(
                 self,
                 "Preset Name Exists",
@@ -249,6 +354,7 @@ class EditPresetDialog(QDialog):
 
         updated_data = self.preset_data.copy()
         updated_data['backward_steps'] = self.backward_checkbox.isChecked()
+        updated_data['bidirectional'] = self.bidirectional_checkbox.isChecked()
 
         error_message = None
 
@@ -288,8 +394,7 @@ class EditPresetDialog(QDialog):
         updated_data['last_edited'] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
         if new_name != self.preset_name:
-            self.preset_manager.delete_preset(self.preset_name)
-            self.preset_manager.add_preset(new_name, updated_data)
+            self.preset_manager.rename_preset(self.preset_name, new_name, updated_data)
         else:
             self.preset_manager.update_preset(self.preset_name, updated_data)
         QMessageBox.information(self, "Success", "Preset updated successfully.")
@@ -314,6 +419,8 @@ class SavePresetDialog(QDialog):
         summary_text = f"Raster 1: {raster1_name} (Band {preset_data.get('band_1', 1)})\n"
         summary_text += f"Raster 2: {raster2_name} (Band {preset_data.get('band_2', 1)})\n"
         summary_text += f"Backward Steps: {'Yes' if preset_data.get('backward_steps', False) else 'No'}\n"
+        if preset_data.get('bidirectional', False):
+            summary_text += "Both Directions: Yes\n"
 
         if preset_data.get('step_size') is not None:
             summary_text += f"Step Size: {preset_data.get('step_size')}\n"
@@ -336,6 +443,26 @@ class SavePresetDialog(QDialog):
             format_str = "x y dist [default]"
 
         summary_text += f"Output Format: {format_str}"
+        if preset_data.get('aoi_mode') == "steps":
+            summary_text += "\nArea of Interest: max. steps × step size"
+        elif preset_data.get('aoi_mode') == "canvas":
+            summary_text += "\nArea of Interest: map canvas extent"
+        if preset_data.get('merge_tolerance') is not None:
+            summary_text += f"\nMerge Tolerance: {preset_data.get('merge_tolerance')}"
+        if preset_data.get('adaptive_mode', False):
+            summary_text += "\nAdaptive Step Size: Yes"
+        if preset_data.get('derived_attributes', False):
+            summary_text += "\nDerived Attributes: Yes"
+        if preset_data.get('sample_rasters'):
+            summary_text += ("\nSampled Rasters: "
+                             + ", ".join(raster['field'] for raster in preset_data.get('sample_rasters')))
+        if preset_data.get('compact_grids', False):
+            summary_text += "\nCompact Grids: float32"
+        if preset_data.get('export_path'):
+            summary_text += f"\nExport: {preset_data.get('export_path')}"
+        if preset_data.get('simplify_tolerance') is not None:
+            summary_text += (f"\nSimplification: {preset_data.get('simplify_tolerance')} "
+                             f"({preset_data.get('simplify_method', 'douglas-peucker')})")
         summary_label = QLabel(summary_text)
         summary_layout.addWidget(summary_label)
         layout.addWidget(summary_group)
@@ -353,7 +480,7 @@ class SavePresetDialog(QDialog):
         if not preset_name:
             QMessageBox.warning(self, "Invalid Name", "Please enter a valid preset name.")
             return
-        if preset_name in self.preset_manager.get_preset_names():
+        if self.preset_manager.has_preset(preset_name):
             reply = QMessageBox.question(
                 self,
                 "Preset Already Exists",
@@ -0,0 +1,114 @@
+import numpy as np
+from qgis.core import QgsCoordinateTransform, QgsMapLayerProxyModel, QgsProject, QgsWkbTypes
+from qgis.gui import QgsMapLayerComboBox
+from qgis.PyQt.QtWidgets import (QCheckBox, QComboBox, QDialog, QFormLayout, QHBoxLayout, QLabel, QLineEdit,
+                                 QMessageBox, QPushButton, QVBoxLayout)
+
+from .seed_generators import seeds_along_line, seeds_in_polygon, stratified_random_seeds
+
+SEED_METHODS = [
+    ("Evenly spaced along lines", "line"),
+    ("Regular lattice inside polygons", "regular"),
+    ("Hexagonal lattice inside polygons", "hex"),
+    ("Stratified random inside polygons", "random"),
+]
+
+
+def geometry_parts(geometry):
+    """Returns the vertex arrays of a line geometry, or the ring lists of a polygon geometry, one per part."""
+    if geometry.type() == QgsWkbTypes.LineGeometry:
+        lines = geometry.asMultiPolyline() if geometry.isMultipart() else [geometry.asPolyline()]
+        return [np.array([(p.x(), p.y()) for p in line]) for line in lines]
+    polygons = geometry.asMultiPolygon() if geometry.isMultipart() else [geometry.asPolygon()]
+    return [[np.array([(p.x(), p.y()) for p in ring]) for ring in polygon] for polygon in polygons]
+
+
+class SeedGeneratorDialog(QDialog):
+    """Generates many seed points at once from the features of a line or polygon layer."""
+
+    def __init__(self, parent=None, crs=None):
+        super(SeedGeneratorDialog, self).__init__(parent)
+        self.crs = crs
+        self.seeds = None
+        self.setWindowTitle("Generate Seed Points")
+        layout = QVBoxLayout()
+
+        form_layout = QFormLayout()
+        self.layer_box = QgsMapLayerComboBox()
+        self.layer_box.setFilters(QgsMapLayerProxyModel.LineLayer | QgsMapLayerProxyModel.PolygonLayer)
+        form_layout.addRow("Layer:", self.layer_box)
+        self.selected_only_checkbox = QCheckBox("Selected features only")
+        form_layout.addRow("", self.selected_only_checkbox)
+        self.method_box = QComboBox()
+        for label, method in SEED_METHODS:
+            self.method_box.addItem(label, method)
+        form_layout.addRow("Method:", self.method_box)
+        self.spacing_input = QLineEdit()
+        self.spacing_input.setPlaceholderText("in map units of the grids")
+        form_layout.addRow("Spacing:", self.spacing_input)
+        layout.addLayout(form_layout)
+
+        note_label = QLabel("All seeds are traced in a single grd2stream run.")
+        note_label.setWordWrap(True)
+        layout.addWidget(note_label)
+
+        button_layout = QHBoxLayout()
+        self.ok_button = QPushButton("OK")
+        self.ok_button.clicked.connect(self.validate_and_accept)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.reject)
+        button_layout.addWidget(self.ok_button)
+        button_layout.addWidget(self.cancel_button)
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+
+    def validate_and_accept(self):
+        layer = self.layer_box.currentLayer()
+        if layer is None:
+            QMessageBox.warning(self, "Invalid Input", "Please select a line or polygon layer.")
+            return
+        try:
+            spacing = float(self.spacing_input.text())
+            if spacing <= 0:
+                raise ValueError
+        except ValueError:
+            QMessageBox.warning(self, "Invalid Input", "Please enter a positive numeric spacing.")
+            return
+
+        method = self.method_box.currentData()
+        is_line_layer = layer.geometryType() == QgsWkbTypes.LineGeometry
+        if (method == "line") != is_line_layer:
+            QMessageBox.warning(
+                self, "Invalid Input",
+                "Seeds along lines need a line layer, lattice and random seeds need a polygon layer."
+            )
+            return
+
+        seeds = self.generate(layer, method, spacing)
+        if not len(seeds):
+            QMessageBox.warning(self, "No Seeds", "No seed points were generated. Try a smaller spacing.")
+            return
+        self.seeds = seeds
+        self.accept()
+
+    def generate(self, layer, method, spacing):
+        """Generates the seeds of all (selected) features, in the target CRS."""
+        transform = None
+        if self.crs and self.crs.isValid() and layer.crs() != self.crs:
+            transform = QgsCoordinateTransform(layer.crs(), self.crs, QgsProject.instance())
+        features = layer.selectedFeatures() if self.selected_only_checkbox.isChecked() else layer.getFeatures()
+        seeds = [np.empty((0, 2))]
+        for feature in features:
+            geometry = feature.geometry()
+            if geometry.isEmpty():
+                continue
+            if transform:
+                geometry.transform(transform)
+            for part in geometry_parts(geometry):
+                if method == "line":
+                    seeds.append(seeds_along_line(part, spacing))
+                elif method == "random":
+                    seeds.append(stratified_random_seeds(part, spacing))
+                else:
+                    seeds.append(seeds_in_polygon(part, spacing, hexagonal=method == "hex"))
+        return np.concatenate(seeds)
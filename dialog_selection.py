@@ -1,11 +1,72 @@
+import bisect
+
 from qgis.PyQt.QtGui import QIcon
-from qgis.PyQt.QtWidgets import (QDialog, QVBoxLayout, QLabel, QComboBox, QPushButton, QLineEdit, QCheckBox, QHBoxLayout,
-                             QMessageBox)
-from qgis.PyQt.QtCore import Qt
-from qgis.core import QgsProject, Qgis, QgsRasterLayer
+from qgis.PyQt.QtWidgets import (QAbstractItemView, QDialog, QVBoxLayout, QLabel, QComboBox, QCompleter, QPushButton,
+                             QLineEdit, QCheckBox, QFileDialog, QFormLayout, QHBoxLayout, QListView, QMessageBox,
+                             QWidget)
+from qgis.PyQt.QtCore import QAbstractListModel, QItemSelectionModel, QModelIndex, Qt
+from qgis.core import QgsProject, Qgis, QgsRasterLayer, QgsSettings
 
 from .dialog_preset import PresetDialog
+from .flowline_attributes import DERIVED_FIELDS
+from .flowline_export import EXPORT_FILTER, export_available
+from .flowline_layer import RUN_FIELDS
+from .flowline_simplify import SIMPLIFY_METHODS
 from .help_widget import show_help
+from .raster_sampling import sample_field_name
+
+ADAPTIVE_OPTIONS = [
+    ("rtol", "Relative Tolerance", "default: 0.001"),
+    ("atol", "Absolute Tolerance", "default: cell size / 1000"),
+    ("min_step", "Min. Step Size", "default: cell size / 50"),
+    ("max_step", "Max. Step Size", "default: 2 × cell size"),
+]
+
+
+class RasterBandModel(QAbstractListModel):
+    """One row per band of every project raster; rows are resolved on demand instead of being created upfront."""
+
+    def __init__(self, project=None, parent=None):
+        super().__init__(parent)
+        project = project or QgsProject.instance()
+        self.layers = [layer for layer in project.mapLayers().values() if isinstance(layer, QgsRasterLayer)]
+        self.offsets = []
+        total = 0
+        for layer in self.layers:
+            self.offsets.append(total)
+            total += max(layer.bandCount(), 1)
+        self.total = total
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.total
+
+    def layer_band(self, row):
+        layer_index = bisect.bisect_right(self.offsets, row) - 1
+        return self.layers[layer_index], row - self.offsets[layer_index] + 1
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or not 0 <= index.row() < self.total:
+            return None
+        layer, band = self.layer_band(index.row())
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return f"{layer.name()} - Band {band}"
+        if role == Qt.ToolTipRole:
+            return layer.source()
+        if role == Qt.UserRole:
+            return layer, band
+        return None
+
+    def row_for_layer(self, layer, band=1):
+        for layer_index, candidate in enumerate(self.layers):
+            if candidate.id() == layer.id():
+                return self.offsets[layer_index] + band - 1 if band <= max(candidate.bandCount(), 1) else -1
+        return -1
+
+    def row_for_name(self, layer_name, band=1):
+        for layer_index, candidate in enumerate(self.layers):
+            if candidate.name() == layer_name and band <= max(candidate.bandCount(), 1):
+                return self.offsets[layer_index] + band - 1
+        return -1
 
 
 class SelectionDialog(QDialog):
@@ -20,10 +81,24 @@ class SelectionDialog(QDialog):
         self.selected_raster_1 = None
         self.selected_raster_2 = None
         self.backward_steps = False
+        self.bidirectional = False
         self.step_size = None
         self.max_integration_time = None
         self.max_steps = None
         self.output_format = None
+        self.aoi_mode = None
+        self.append_mode = True
+        self.preview_mode = False
+        self.merge_tolerance = None
+        self.adaptive_mode = False
+        self.adaptive_options = {}
+        self.simplify_tolerance = None
+        self.simplify_method = "douglas-peucker"
+        self.derived_attributes = False
+        self.sample_rasters = []
+        self.export_path = None
+        self.export_only = False
+        self.compact_grids = False
 
         layout = QVBoxLayout()
         self.setLayout(layout)
@@ -62,6 +137,11 @@ class SelectionDialog(QDialog):
 
             self.backward_checkbox = QCheckBox("Backward Steps?")
             layout.addWidget(self.backward_checkbox)
+            self.bidirectional_checkbox = QCheckBox("Both Directions (joined at the seed)")
+            self.bidirectional_checkbox.setToolTip("Traces upstream and downstream from one grid load and stores "
+                                                   "one flowline per seed, with negative dist/time upstream.")
+            self.bidirectional_checkbox.toggled.connect(lambda checked: self.backward_checkbox.setEnabled(not checked))
+            layout.addWidget(self.bidirectional_checkbox)
 
             layout.addWidget(QLabel("Output Format:"))
             self.output_format_box = QComboBox()
@@ -70,6 +150,11 @@ class SelectionDialog(QDialog):
             self.output_format_box.addItem("x  y  dist  v_x  v_y  time", "-t")
             layout.addWidget(self.output_format_box)
 
+            self.derived_checkbox = QCheckBox("Add derived attributes (speed, heading, curvature, strain rate)")
+            self.derived_checkbox.setToolTip("Computes the attributes along each flowline from the output columns; "
+                                             "speed and strain rate need the v_x/v_y columns.")
+            layout.addWidget(self.derived_checkbox)
+
             layout.addWidget(QLabel("<b>Parameters:</b>"))
 
             self.manual_step_checkbox = QCheckBox("Manually set Step Size (in m)")
@@ -90,6 +175,92 @@ class SelectionDialog(QDialog):
             layout.addWidget(QLabel("Maximum Integration Time (in s):"))
             layout.addWidget(self.max_time_input)
 
+            self.adaptive_checkbox = QCheckBox("Adaptive Step Size (RK45)")
+            self.adaptive_checkbox.setToolTip("Chooses the step size per flowline from an error estimate instead of "
+                                              "using a fixed step, which needs far fewer steps in smooth flow.")
+            layout.addWidget(self.adaptive_checkbox)
+            self.adaptive_widget = QWidget()
+            adaptive_layout = QFormLayout(self.adaptive_widget)
+            adaptive_layout.setContentsMargins(20, 0, 0, 0)
+            self.adaptive_inputs = {}
+            for key, label, placeholder in ADAPTIVE_OPTIONS:
+                self.adaptive_inputs[key] = QLineEdit()
+                self.adaptive_inputs[key].setPlaceholderText(placeholder)
+                adaptive_layout.addRow(f"{label}:", self.adaptive_inputs[key])
+            self.adaptive_widget.setEnabled(False)
+            self.adaptive_checkbox.toggled.connect(self.adaptive_widget.setEnabled)
+            layout.addWidget(self.adaptive_widget)
+
+            self.merge_tolerance_input = QLineEdit()
+            self.merge_tolerance_input.setPlaceholderText("default: / (trace every seed to its end)")
+            self.merge_tolerance_input.setToolTip("For runs with several seeds: stop a flowline once it comes this close "
+                                                  "to another one and reference the shared path instead.")
+            layout.addWidget(QLabel("Merge Tolerance for Batch Runs (in map units):"))
+            layout.addWidget(self.merge_tolerance_input)
+
+            layout.addWidget(QLabel("Sample Rasters Along Flowlines (e.g. thickness, surface, SMB):"))
+            self.sample_list = QListView()
+            self.sample_list.setModel(self.layer_model)
+            self.sample_list.setSelectionMode(QAbstractItemView.MultiSelection)
+            self.sample_list.setUniformItemSizes(True)
+            self.sample_list.setMaximumHeight(90)
+            self.sample_list.setToolTip("Each selected band is sampled bilinearly at every flowline vertex "
+                                        "and stored as an extra attribute.")
+            layout.addWidget(self.sample_list)
+
+            self.simplify_tolerance_input = QLineEdit()
+            self.simplify_tolerance_input.setPlaceholderText("default: / (keep every vertex)")
+            self.simplify_tolerance_input.setToolTip("Drops nearly collinear vertices before the layer is created; "
+                                                     "dist and time are kept at the remaining vertices.")
+            layout.addWidget(QLabel("Simplification Tolerance (in map units):"))
+            simplify_layout = QHBoxLayout()
+            simplify_layout.addWidget(self.simplify_tolerance_input)
+            self.simplify_method_box = QComboBox()
+            for method, label in SIMPLIFY_METHODS:
+                self.simplify_method_box.addItem(label, method)
+            simplify_layout.addWidget(self.simplify_method_box)
+            layout.addLayout(simplify_layout)
+
+            self.aoi_checkbox = QCheckBox("Restrict to Area of Interest")
+            self.aoi_checkbox.setToolTip("Only read the part of the grids the flowline can reach. "
+                                         "Flowlines leaving this area are re-run on the full grids.")
+            layout.addWidget(self.aoi_checkbox)
+            self.aoi_mode_box = QComboBox()
+            self.aoi_mode_box.addItem("Margin: max. steps × step size", "steps")
+            self.aoi_mode_box.addItem("Margin: map canvas extent", "canvas")
+            self.aoi_mode_box.setEnabled(False)
+            self.aoi_checkbox.stateChanged.connect(lambda state: self.aoi_mode_box.setEnabled(state == Qt.Checked))
+            layout.addWidget(self.aoi_mode_box)
+
+            self.append_checkbox = QCheckBox("Append to one flowline layer per grid pair / preset")
+            self.append_checkbox.setToolTip("Adds each run with its run_id and seed_id to a single layer "
+                                            "instead of creating a new layer per run.")
+            self.append_checkbox.setChecked(True)
+            layout.addWidget(self.append_checkbox)
+
+            layout.addWidget(QLabel("Export Flowlines to GeoParquet / Arrow (optional):"))
+            export_layout = QHBoxLayout()
+            self.export_path_input = QLineEdit()
+            self.export_path_input.setPlaceholderText("default: / (no export)")
+            export_layout.addWidget(self.export_path_input)
+            self.export_browse_button = QPushButton("Browse...")
+            self.export_browse_button.clicked.connect(self.browse_export_path)
+            export_layout.addWidget(self.export_browse_button)
+            layout.addLayout(export_layout)
+            self.export_only_checkbox = QCheckBox("Export only (do not create map features)")
+            self.export_only_checkbox.setToolTip("Skips the flowline layer, which is much faster for large batches.")
+            layout.addWidget(self.export_only_checkbox)
+
+            self.compact_grids_checkbox = QCheckBox("Compact grids (float32) for in-process tracing")
+            self.compact_grids_checkbox.setToolTip("Keeps v_x/v_y as float32, halving the memory of cached grids; "
+                                                   "positions, dist and time are still accumulated in float64.")
+            layout.addWidget(self.compact_grids_checkbox)
+
+            self.preview_checkbox = QCheckBox("Show low-resolution preview first")
+            self.preview_checkbox.setToolTip("Traces on a decimated copy of the grids and draws the result at once, "
+                                             "until the full-resolution flowline replaces it.")
+            layout.addWidget(self.preview_checkbox)
+
             self.ok_button = QPushButton("OK")
             self.ok_button.clicked.connect(self.accept)
             self.save_preset_button = QPushButton("Save as Preset")
@@ -149,15 +320,18 @@ class SelectionDialog(QDialog):
         self.select_raster_in_combobox(
             self.layer_box_1,
             preset_data.get('raster_1_name'),
-            preset_data.get('band_1', 1)
+            preset_data.get('band_1', 1),
+            preset_data.get('raster_1_source')
         )
         self.select_raster_in_combobox(
             self.layer_box_2,
             preset_data.get('raster_2_name'),
-            preset_data.get('band_2', 1)
+            preset_data.get('band_2', 1),
+            preset_data.get('raster_2_source')
         )
 
         self.backward_checkbox.setChecked(preset_data.get('backward_steps', False))
+        self.bidirectional_checkbox.setChecked(preset_data.get('bidirectional', False))
 
         output_format = preset_data.get('output_format')
         for i in range(self.output_format_box.count()):
@@ -183,14 +357,104 @@ class SelectionDialog(QDialog):
         else:
             self.max_time_input.clear()
 
-    def select_raster_in_combobox(self, combobox, layer_name, band=1):
-        """Find and select the specified raster and band in a combobox"""
-        for i in range(combobox.count()):
-            item_text = combobox.itemText(i)
-            if item_text.startswith(f"{layer_name} - Band {band}"):
-                combobox.setCurrentIndex(i)
-                return True
-        return False
+        if preset_data.get('merge_tolerance') is not None:
+            self.merge_tolerance_input.setText(str(preset_data.get('merge_tolerance')))
+        else:
+            self.merge_tolerance_input.clear()
+
+        self.derived_checkbox.setChecked(preset_data.get('derived_attributes', False))
+
+        self.compact_grids_checkbox.setChecked(preset_data.get('compact_grids', False))
+        self.export_path_input.setText(preset_data.get('export_path') or "")
+        self.export_only_checkbox.setChecked(preset_data.get('export_only', False))
+
+        self.sample_list.clearSelection()
+        for raster in preset_data.get('sample_rasters') or []:
+            layer = self.flowline_module.layer_index.find(raster['source'], raster['band']) if self.flowline_module else None
+            row = self.layer_model.row_for_layer(layer, raster['band']) if layer is not None else -1
+            if row < 0:
+                row = self.layer_model.row_for_name(raster['name'], raster['band'])
+            if row >= 0:
+                self.sample_list.selectionModel().select(self.layer_model.index(row), QItemSelectionModel.Select)
+
+        if preset_data.get('simplify_tolerance') is not None:
+            self.simplify_tolerance_input.setText(str(preset_data.get('simplify_tolerance')))
+        else:
+            self.simplify_tolerance_input.clear()
+        simplify_index = self.simplify_method_box.findData(preset_data.get('simplify_method', "douglas-peucker"))
+        self.simplify_method_box.setCurrentIndex(max(simplify_index, 0))
+
+        self.adaptive_checkbox.setChecked(preset_data.get('adaptive_mode', False))
+        adaptive_options = preset_data.get('adaptive_options') or {}
+        for key, line_edit in self.adaptive_inputs.items():
+            if adaptive_options.get(key) is not None:
+                line_edit.setText(str(adaptive_options[key]))
+            else:
+                line_edit.clear()
+
+        aoi_mode = preset_data.get('aoi_mode')
+        self.aoi_checkbox.setChecked(aoi_mode is not None)
+        if aoi_mode is not None:
+            self.aoi_mode_box.setCurrentIndex(max(self.aoi_mode_box.findData(aoi_mode), 0))
+        self.append_checkbox.setChecked(preset_data.get('append_mode', True))
+        self.preview_checkbox.setChecked(preset_data.get('preview_mode', False))
+
+    def read_adaptive_options(self):
+        """Parses the adaptive step size fields; returns the options (empty fields omitted) and an error message."""
+        options = {}
+        for key, label, _ in ADAPTIVE_OPTIONS:
+            text = self.adaptive_inputs[key].text()
+            if not text:
+                continue
+            if ',' in text:
+                return options, f"Please use a period (.) instead of a comma (,) as decimal separator in '{label}'."
+            try:
+                options[key] = float(text)
+                if options[key] <= 0:
+                    raise ValueError
+            except ValueError:
+                return options, f"Invalid '{label}'. Please enter a positive number."
+        if options.get('min_step') and options.get('max_step') and options['min_step'] > options['max_step']:
+            return options, "'Min. Step Size' must not exceed 'Max. Step Size'."
+        return options, None
+
+    def browse_export_path(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export Flowlines", self.export_path_input.text(), EXPORT_FILTER)
+        if path:
+            self.export_path_input.setText(path)
+
+    def read_export_options(self):
+        """Returns the export path (None if empty), the export-only flag and an error message."""
+        path = self.export_path_input.text().strip() or None
+        if path is None:
+            return None, False, None
+        if not export_available():
+            return path, False, "Exporting flowlines requires the 'pyarrow' package in the QGIS Python environment."
+        if not path.lower().endswith((".parquet", ".arrow", ".feather")):
+            return path, False, "The export file must end in .parquet, .arrow or .feather."
+        return path, self.export_only_checkbox.isChecked(), None
+
+    def read_sample_rasters(self):
+        """Returns the bands selected for sampling as dicts with source, name, band and attribute name."""
+        taken = {"x", "y", "dist", "v_x", "v_y", "time"} | set(DERIVED_FIELDS) | {name for name, _ in RUN_FIELDS}
+        sample_rasters = []
+        for index in sorted(self.sample_list.selectionModel().selectedRows(), key=lambda index: index.row()):
+            layer, band = self.layer_model.layer_band(index.row())
+            field = sample_field_name(layer.name(), band, taken)
+            taken.add(field)
+            sample_rasters.append({'source': layer.source(), 'name': layer.name(), 'band': band, 'field': field})
+        return sample_rasters
+
+    def select_raster_in_combobox(self, combobox, layer_name, band=1, source=None):
+        """Find and select the specified raster and band in a combobox, matching by source before name"""
+        layer = self.flowline_module.layer_index.find(source, band) if source and self.flowline_module else None
+        row = self.layer_model.row_for_layer(layer, band) if layer is not None else -1
+        if row < 0 and layer_name:
+            row = self.layer_model.row_for_name(layer_name, band)
+        if row < 0:
+            return False
+        combobox.setCurrentIndex(row)
+        return True
 
     def use_last_settings(self):
         if self.flowline_module:
@@ -226,6 +490,7 @@ class SelectionDialog(QDialog):
             self.selected_band_2 = 1
 
         self.backward_steps = self.backward_checkbox.isChecked()
+        self.bidirectional = self.bidirectional_checkbox.isChecked()
 
         self.step_size = None
         self.max_steps = None
@@ -256,6 +521,42 @@ class SelectionDialog(QDialog):
                 except ValueError:
                     error_message = "Invalid 'Maximum Integration Time'. Please enter a valid number."
 
+        self.merge_tolerance = None
+        if self.merge_tolerance_input.text():
+            if ',' in self.merge_tolerance_input.text():
+                error_message = "Please use a period (.) instead of a comma (,) as decimal separator in 'Merge Tolerance'."
+            else:
+                try:
+                    self.merge_tolerance = float(self.merge_tolerance_input.text())
+                    if self.merge_tolerance <= 0:
+                        raise ValueError
+                except ValueError:
+                    error_message = "Invalid 'Merge Tolerance'. Please enter a positive number."
+
+        self.adaptive_mode = self.adaptive_checkbox.isChecked()
+        self.adaptive_options, adaptive_error = self.read_adaptive_options()
+        if adaptive_error:
+            error_message = adaptive_error
+
+        self.derived_attributes = self.derived_checkbox.isChecked()
+        self.sample_rasters = self.read_sample_rasters()
+        self.export_path, self.export_only, export_error = self.read_export_options()
+        if export_error:
+            error_message = export_error
+        self.simplify_tolerance = None
+        self.simplify_method = self.simplify_method_box.currentData()
+        if self.simplify_tolerance_input.text():
+            if ',' in self.simplify_tolerance_input.text():
+                error_message = ("Please use a period (.) instead of a comma (,) as decimal separator in "
+                                 "'Simplification Tolerance'.")
+            else:
+                try:
+                    self.simplify_tolerance = float(self.simplify_tolerance_input.text())
+                    if self.simplify_tolerance <= 0:
+                        raise ValueError
+                except ValueError:
+                    error_message = "Invalid 'Simplification Tolerance'. Please enter a positive number."
+
         if error_message:
             QMessageBox.warning(
                 self,
@@ -265,6 +566,10 @@ class SelectionDialog(QDialog):
             return False
 
         self.output_format = self.output_format_box.currentData()
+        self.aoi_mode = self.aoi_mode_box.currentData() if self.aoi_checkbox.isChecked() else None
+        self.append_mode = self.append_checkbox.isChecked()
+        self.preview_mode = self.preview_checkbox.isChecked()
+        self.compact_grids = self.compact_grids_checkbox.isChecked()
 
         if self.flowline_module:
             self.flowline_module.selected_raster_1 = self.selected_raster_1
@@ -272,10 +577,24 @@ class SelectionDialog(QDialog):
             self.flowline_module.selected_band_1 = self.selected_band_1
             self.flowline_module.selected_band_2 = self.selected_band_2
             self.flowline_module.backward_steps = self.backward_steps
+            self.flowline_module.bidirectional = self.bidirectional
             self.flowline_module.step_size = self.step_size
             self.flowline_module.max_integration_time = self.max_integration_time
             self.flowline_module.max_steps = self.max_steps
             self.flowline_module.output_format = self.output_format
+            self.flowline_module.aoi_mode = self.aoi_mode
+            self.flowline_module.append_mode = self.append_mode
+            self.flowline_module.preview_mode = self.preview_mode
+            self.flowline_module.merge_tolerance = self.merge_tolerance
+            self.flowline_module.adaptive_mode = self.adaptive_mode
+            self.flowline_module.adaptive_options = self.adaptive_options
+            self.flowline_module.simplify_tolerance = self.simplify_tolerance
+            self.flowline_module.simplify_method = self.simplify_method
+            self.flowline_module.derived_attributes = self.derived_attributes
+            self.flowline_module.sample_rasters = self.sample_rasters
+            self.flowline_module.export_path = self.export_path
+            self.flowline_module.export_only = self.export_only
+            self.flowline_module.compact_grids = self.compact_grids
 
         return True
 
@@ -289,17 +608,34 @@ class SelectionDialog(QDialog):
             self.step_size_input.setStyleSheet("color: gray;")
 
     def populate_layers(self):
-        layers = QgsProject.instance().mapLayers().values()
-        raster_layers = [layer for layer in layers if isinstance(layer, QgsRasterLayer)]
-        for layer in raster_layers:
-            band_count = layer.bandCount()
-            if band_count > 1:
-                for band in range(1, band_count + 1):
-                    self.layer_box_1.addItem(f"{layer.name()} - Band {band}", (layer, band))
-                    self.layer_box_2.addItem(f"{layer.name()} - Band {band}", (layer, band))
-            else:
-                self.layer_box_1.addItem(f"{layer.name()} - Band 1", (layer, 1))
-                self.layer_box_2.addItem(f"{layer.name()} - Band 1", (layer, 1))
+        self.layer_model = RasterBandModel(QgsProject.instance(), self)
+        for combobox in (self.layer_box_1, self.layer_box_2):
+            combobox.setModel(self.layer_model)
+            combobox.setEditable(True)
+            combobox.setInsertPolicy(QComboBox.NoInsert)
+            combobox.view().setUniformItemSizes(True)
+            completer = QCompleter(self.layer_model, combobox)
+            completer.setCaseSensitivity(Qt.CaseInsensitive)
+            completer.setFilterMode(Qt.MatchContains)
+            completer.setCompletionMode(QCompleter.PopupCompletion)
+            combobox.setCompleter(completer)
+        self.restore_last_pairing()
+
+    def restore_last_pairing(self):
+        settings = QgsSettings()
+        for combobox, key in ((self.layer_box_1, "v_x"), (self.layer_box_2, "v_y")):
+            source = settings.value(f"grd2stream/last_pairing/{key}_source", "")
+            band = settings.value(f"grd2stream/last_pairing/{key}_band", 1, type=int)
+            if source:
+                self.select_raster_in_combobox(combobox, None, band, source)
+
+    def save_last_pairing(self):
+        settings = QgsSettings()
+        for layer, band, key in ((self.selected_raster_1, self.selected_band_1, "v_x"),
+                                 (self.selected_raster_2, self.selected_band_2, "v_y")):
+            if layer is not None:
+                settings.setValue(f"grd2stream/last_pairing/{key}_source", layer.source())
+                settings.setValue(f"grd2stream/last_pairing/{key}_band", band)
 
     def accept(self):
         index_1 = self.layer_box_1.currentIndex()
@@ -330,6 +666,7 @@ class SelectionDialog(QDialog):
             return
 
         self.backward_steps = self.backward_checkbox.isChecked()
+        self.bidirectional = self.bidirectional_checkbox.isChecked()
 
         validation_failed = False
 
@@ -382,9 +719,71 @@ class SelectionDialog(QDialog):
                     )
                     validation_failed = True
 
+        self.merge_tolerance = None
+        if self.merge_tolerance_input.text():
+            if ',' in self.merge_tolerance_input.text():
+                QMessageBox.warning(
+                    self,
+                    "Invalid Input",
+                    "Please use a period (.) instead of a comma (,) as decimal separator in 'Merge Tolerance'."
+                )
+                validation_failed = True
+            else:
+                try:
+                    self.merge_tolerance = float(self.merge_tolerance_input.text())
+                    if self.merge_tolerance <= 0:
+                        raise ValueError
+                except ValueError:
+                    QMessageBox.warning(
+                        self,
+                        "Invalid Input",
+                        "Invalid 'Merge Tolerance'. Please enter a positive number."
+                    )
+                    validation_failed = True
+
+        self.adaptive_mode = self.adaptive_checkbox.isChecked()
+        self.adaptive_options, adaptive_error = self.read_adaptive_options()
+        if adaptive_error:
+            QMessageBox.warning(self, "Invalid Input", adaptive_error)
+            validation_failed = True
+
+        self.derived_attributes = self.derived_checkbox.isChecked()
+        self.sample_rasters = self.read_sample_rasters()
+        self.export_path, self.export_only, export_error = self.read_export_options()
+        if export_error:
+            QMessageBox.warning(self, "Invalid Input", export_error)
+            validation_failed = True
+        self.simplify_tolerance = None
+        self.simplify_method = self.simplify_method_box.currentData()
+        if self.simplify_tolerance_input.text():
+            if ',' in self.simplify_tolerance_input.text():
+                QMessageBox.warning(
+                    self,
+                    "Invalid Input",
+                    "Please use a period (.) instead of a comma (,) as decimal separator in 'Simplification Tolerance'."
+                )
+                validation_failed = True
+            else:
+                try:
+                    self.simplify_tolerance = float(self.simplify_tolerance_input.text())
+                    if self.simplify_tolerance <= 0:
+                        raise ValueError
+                except ValueError:
+                    QMessageBox.warning(
+                        self,
+                        "Invalid Input",
+                        "Invalid 'Simplification Tolerance'. Please enter a positive number."
+                    )
+                    validation_failed = True
+
         if validation_failed:
             return
 
         self.output_format = self.output_format_box.currentData()
+        self.aoi_mode = self.aoi_mode_box.currentData() if self.aoi_checkbox.isChecked() else None
+        self.append_mode = self.append_checkbox.isChecked()
+        self.preview_mode = self.preview_checkbox.isChecked()
+        self.compact_grids = self.compact_grids_checkbox.isChecked()
+        self.save_last_pairing()
 
         super().accept()
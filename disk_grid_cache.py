@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+import numpy as np
+
+DEFAULT_DISK_BUDGET = 4 << 30
+
+
+def source_file(source):
+    """Local file behind a GDAL source such as 'NETCDF:"/data/vel.nc":vx', or None if there is none."""
+    if os.path.isfile(source):
+        return source
+    quoted = re.search(r'"([^"]+)"', source)
+    if quoted and os.path.isfile(quoted.group(1)):
+        return quoted.group(1)
+    parts = source.split(":")
+    for start in range(len(parts)):
+        for end in range(len(parts), start, -1):
+            candidate = ":".join(parts[start:end])
+            if os.path.isfile(candidate):
+                return candidate
+    return None
+
+
+def source_signature(sources):
+    """(path, mtime, size) of the file behind each source, or None if a source is not a local file."""
+    signature = []
+    for source in sources:
+        path = source_file(source)
+        if path is None:
+            return None
+        stat = os.stat(path)
+        signature.append([path, stat.st_mtime, stat.st_size])
+    return signature
+
+
+class DiskGridCache:
+    """Decoded grids kept as memory-mappable .npy files, so later sessions skip decoding their sources.
+
+    Each entry is valid while the files behind its sources keep their modification time and size.
+    Entries are evicted least recently used first once they take more than budget bytes.
+    """
+
+    def __init__(self, directory, budget=DEFAULT_DISK_BUDGET):
+        self.directory = directory
+        self.budget = budget
+
+    def paths(self, key):
+        name = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{name}.npy"), os.path.join(self.directory, f"{name}.json")
+
+    def load(self, key, sources):
+        """Returns (read-only memory-mapped array, grid metadata) of a valid entry, or None."""
+        array_path, meta_path = self.paths(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as meta_file:
+                meta = json.load(meta_file)
+            signature = source_signature(sources)
+            if signature is None or meta.get("key") != repr(key) or meta.get("sources") != signature:
+                return None
+            values = np.load(array_path, mmap_mode="r")
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            return None
+        return values, meta["grid"]
+
+    def store(self, key, sources, values, grid):
+        """Writes an entry for the sources' current state; grid holds the JSON metadata to rebuild the grid."""
+        signature = source_signature(sources)
+        if signature is None or values.nbytes > self.budget:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        array_path, meta_path = self.paths(key)
+        try:
+            descriptor, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".npy.part")
+            with os.fdopen(descriptor, "wb") as array_file:
+                np.save(array_file, np.ascontiguousarray(values))
+            os.replace(temp_path, array_path)
+            with open(meta_path, "w", encoding="utf-8") as meta_file:
+                json.dump({"key": repr(key), "sources": signature, "grid": grid}, meta_file)
+        except OSError as e:
+            print(f"Could not write grid cache entry: {e}")
+            return
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            meta_path = os.path.join(self.directory, name)
+            array_path = meta_path[:-len(".json")] + ".npy"
+            size = os.path.getsize(array_path) if os.path.exists(array_path) else 0
+            entries.append((os.path.getmtime(meta_path), size, meta_path, array_path))
+        total = sum(size for _, size, _, _ in entries)
+        for _, size, meta_path, array_path in sorted(entries):
+            if total <= self.budget:
+                break
+            for path in (meta_path, array_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
@@ -0,0 +1,264 @@
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+import numpy as np
+
+from .flowline_backends import GridPair, Grd2streamEngine, JitEngine, NumpyEngine, warm_up
+from .flowline_engine import OUTPUT_COLUMNS, VelocityGrid
+
+VALIDATION_ARCHIVE = os.path.join(os.path.dirname(__file__), "lib", "grd2stream-0.2.14.tar.gz")
+VALIDATION_SCRIPT = "grd2stream-0.2.14/example/validation.gmt4"
+VALIDATION_REFERENCE = os.path.join(os.path.dirname(__file__), "lib", "validation_reference.npz")
+# grd2stream prints x, y, dist and time with three decimals
+TOLERANCES = {"x": 1e-3, "y": 1e-3, "dist": 1e-3, "time": 1e-3}
+STORED_TOLERANCE = 1e-9
+REFERENCE_STRIDE = 250
+# NoData nodes (xmin, ymin, xmax, ymax) of the nodata case, crossed by the circles of radius ~0.5 to ~1.3
+NODATA_BLOCK = (0.5, -1.0, 1.25, 0.25)
+# seeds inside the block, next to its edges and upstream of it
+NODATA_SEEDS = [(1.0, -0.5), (1.26, -0.5), (0.49, -0.5), (0.875, 0.26), (0.875, -1.01), (0.0, 1.0), (-1.0, 0.0),
+                (0.0, -0.75), (1.5, 1.5)]
+
+
+def validation_case(archive=VALIDATION_ARCHIVE):
+    """Grid and seeds of grd2stream's circular flow validation, set up as validation.gmt4 does.
+
+    The script's region (dreg), node spacing (inc) and seed spacing (inc * dens) are read from the
+    bundled archive; u = Y and v = -X on gridline-registered nodes, with the seeds in grd2xyz order.
+    """
+    with tarfile.open(archive) as tar:
+        script = tar.extractfile(VALIDATION_SCRIPT).read().decode("utf-8")
+    settings = dict(re.findall(r"^(dreg|inc|dens)=(\S+)", script, re.MULTILINE))
+    if (len(settings) != 3 or not re.search(r"grdmath \$dreg -I\$inc Y = \S*/u\.grd", script)
+            or not re.search(r"grdmath \$dreg -I\$inc X -1 MUL = \S*/v\.grd", script)):
+        raise ValueError(f"'{VALIDATION_SCRIPT}' does not set up the circular flow field this suite expects.")
+    xmin, xmax, ymin, ymax = map(float, settings["dreg"][2:].split("/"))
+    inc = float(settings["inc"])
+    seed_inc = inc * float(settings["dens"])
+
+    x = xmin + np.arange(round((xmax - xmin) / inc) + 1) * inc
+    y = ymin + np.arange(round((ymax - ymin) / inc) + 1) * inc
+    x_nodes, y_nodes = np.meshgrid(x, y)
+    grid = VelocityGrid(y_nodes, -x_nodes, xmin, ymin, inc, inc)
+
+    seed_x = xmin + np.arange(round((xmax - xmin) / seed_inc) + 1) * seed_inc
+    seed_y = ymax - np.arange(round((ymax - ymin) / seed_inc) + 1) * seed_inc
+    seeds = np.column_stack([values.ravel() for values in np.meshgrid(seed_x, seed_y)])
+    return grid, seeds
+
+
+def binary_runner(executable):
+    """run() for a Grd2streamEngine calling the binary directly, the way validation.gmt4 pipes seeds into it."""
+
+    def run(paths, seeds, params):
+        cmd = [executable, paths[0], paths[1], "-t"]
+        if params["backward"]:
+            cmd.append("-b")
+        if params["step_size"]:
+            cmd += ["-d", str(params["step_size"])]
+        if params["max_time"]:
+            cmd += ["-T", str(params["max_time"])]
+        if params["max_steps"]:
+            cmd += ["-n", str(params["max_steps"])]
+        seed_text = "".join(f"{x!r} {y!r}\n" for x, y in seeds)
+        result = subprocess.run(cmd, input=seed_text, text=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise RuntimeError(f"grd2stream failed: {result.stderr}")
+        streamlines = []
+        for line in result.stdout.splitlines():
+            if line.startswith(">"):
+                streamlines.append([])
+            elif line.strip() and not line.startswith("#"):
+                streamlines[-1].append([float(value) for value in line.split()])
+        return streamlines
+
+    return run
+
+
+def default_engines():
+    """All engines, with grd2stream taken from the PATH or the plugin's GMT6 conda environment."""
+    executable = shutil.which("grd2stream") or os.path.expanduser("~/miniconda3/envs/GMT6/bin/grd2stream")
+    return [Grd2streamEngine(executable, binary_runner(executable)), JitEngine(), NumpyEngine()]
+
+
+def nodata_case(grid):
+    """The validation field with a NoData block across several circles, and seeds inside and next to it."""
+    x = grid.xmin + np.arange(grid.nx) * grid.x_inc
+    y = grid.ymin + np.arange(grid.ny) * grid.y_inc
+    x_nodes, y_nodes = np.meshgrid(x, y)
+    block = (x_nodes >= NODATA_BLOCK[0]) & (x_nodes <= NODATA_BLOCK[2]) & \
+            (y_nodes >= NODATA_BLOCK[1]) & (y_nodes <= NODATA_BLOCK[3])
+    vx, vy = grid.vx.copy(), grid.vy.copy()
+    vx[block] = np.nan
+    vy[block] = np.nan
+    return VelocityGrid(vx, vy, grid.xmin, grid.ymin, grid.x_inc, grid.y_inc), np.array(NODATA_SEEDS)
+
+
+def validation_cases(archive=VALIDATION_ARCHIVE):
+    """(name, grid, seeds) of the circular flow validation and of its variant with NoData."""
+    grid, seeds = validation_case(archive)
+    return [("circular", grid, seeds), ("nodata", *nodata_case(grid))]
+
+
+def reference_sample(streamlines, stride=1):
+    """Vertex count of every flowline and its x, y, dist and time at every stride-th and at the last vertex."""
+    columns = [OUTPUT_COLUMNS.index(name) for name in TOLERANCES]
+    lengths = np.array([len(streamline) for streamline in streamlines], dtype=np.int64)
+    rows = [np.asarray(streamline)[np.unique(np.append(np.arange(0, len(streamline), stride), len(streamline) - 1))]
+            [:, columns] for streamline in streamlines if len(streamline)]
+    return lengths, (np.concatenate(rows) if rows else np.empty((0, len(columns))))
+
+
+def deviations(sample, reference):
+    """Largest absolute difference per TOLERANCES column of two samples, or None if any vertex count differs."""
+    (lengths, rows), (reference_lengths, reference_rows) = sample, reference
+    if not np.array_equal(lengths, reference_lengths) or rows.shape != reference_rows.shape:
+        return None
+    if not len(rows):
+        return dict.fromkeys(TOLERANCES, 0.0)
+    differences = np.abs(rows - reference_rows)
+    # a NaN in only one of both counts as a mismatch
+    differences[np.isnan(rows) != np.isnan(reference_rows)] = np.inf
+    differences[np.isnan(rows) & np.isnan(reference_rows)] = 0.0
+    return dict(zip(TOLERANCES, differences.max(axis=0).tolist()))
+
+
+def load_reference(path=VALIDATION_REFERENCE):
+    """Stored samples by "<case>_<direction>" with the name of the engine that produced them, or None."""
+    try:
+        with np.load(path) as stored:
+            samples = {key[:-len("_lengths")]: (stored[key], stored[key[:-len("_lengths")] + "_rows"])
+                       for key in stored.files if key.endswith("_lengths")}
+            return str(stored["source"]), samples
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def stored_label(source):
+    """How the report names stored samples: only those of the grd2stream binary are a reference."""
+    if source == Grd2streamEngine.name:
+        return f"stored {source} reference"
+    return f"unvalidated {source} snapshot"
+
+
+def write_reference(path=VALIDATION_REFERENCE, engine=None, archive=VALIDATION_ARCHIVE):
+    """Stores samples of every validation case for later runs without the binary; grd2stream is used if available."""
+    if engine is None:
+        engine = next((engine for engine in default_engines() if engine.available()), NumpyEngine())
+    arrays = {"source": np.array(engine.name)}
+    directory = tempfile.mkdtemp(prefix="grd2stream_validation_")
+    try:
+        for case, grid, seeds in validation_cases(archive):
+            grids = GridPair.in_memory(grid, tempfile.mkdtemp(dir=directory))
+            for backward in (False, True):
+                params = {"step_size": None, "max_steps": None, "max_time": None, "backward": backward}
+                key = f"{case}_{'backward' if backward else 'forward'}"
+                lengths, rows = reference_sample(engine.trace(grids, seeds, params), REFERENCE_STRIDE)
+                arrays[f"{key}_lengths"], arrays[f"{key}_rows"] = lengths, rows
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    np.savez_compressed(path, **arrays)
+
+
+def validate_engines(engines=None, repeat=3, archive=VALIDATION_ARCHIVE, reference_path=VALIDATION_REFERENCE):
+    """Runs every available engine on the validation cases, forward and backward like validation.gmt4.
+
+    Each engine is checked against the grd2stream binary, if it is available, and against the
+    stored samples unless it produced them itself. Samples not produced by the binary are only
+    a snapshot for catching regressions between the in-process engines, not a grd2stream parity
+    check. Returns one result per engine, case and direction with its best-of-repeat throughput
+    and its checks; an engine without anything to compare with does not pass.
+    """
+    engines = [engine for engine in (engines or default_engines()) if engine.available()]
+    binary = next((engine for engine in engines if isinstance(engine, Grd2streamEngine)), None)
+    stored = load_reference(reference_path)
+    directory = tempfile.mkdtemp(prefix="grd2stream_validation_")
+    results = []
+    try:
+        for case, grid, seeds in validation_cases(archive):
+            grids = GridPair.in_memory(grid, tempfile.mkdtemp(dir=directory))
+            for backward in (False, True):
+                direction = "backward" if backward else "forward"
+                params = {"step_size": None, "max_steps": None, "max_time": None, "backward": backward}
+                references = []
+                if binary is not None:
+                    references.append((binary.name, binary.name, 1,
+                                       reference_sample(binary.trace(grids, seeds, params))))
+                if stored is not None and f"{case}_{direction}" in stored[1]:
+                    references.append((stored_label(stored[0]), stored[0], REFERENCE_STRIDE,
+                                       stored[1][f"{case}_{direction}"]))
+                for engine in engines:
+                    warm_up(engine, grids, seeds, params)
+                    seconds = float("inf")
+                    for _ in range(repeat):
+                        start = time.perf_counter()
+                        streamlines = engine.trace(grids, seeds, params)
+                        seconds = min(seconds, time.perf_counter() - start)
+                    checks = []
+                    for label, source, stride, reference in references:
+                        if source == engine.name:
+                            continue
+                        deviation = deviations(reference_sample(streamlines, stride), reference)
+                        # grd2stream prints three decimals; samples of the in-process engines keep full precision
+                        binary_involved = Grd2streamEngine.name in (source, engine.name)
+                        tolerances = TOLERANCES if binary_involved else dict.fromkeys(TOLERANCES, STORED_TOLERANCE)
+                        checks.append({
+                            "reference": label,
+                            "grd2stream": binary_involved,
+                            "deviation": deviation,
+                            "passed": deviation is not None and all(deviation[column] <= tolerance
+                                                                    for column, tolerance in tolerances.items()),
+                        })
+                    vertices = sum(len(streamline) for streamline in streamlines)
+                    results.append({
+                        "engine": engine.name,
+                        "case": case,
+                        "direction": direction,
+                        "seeds": len(seeds),
+                        "vertices": vertices,
+                        "seconds": seconds,
+                        "vertices_per_second": vertices / seconds if seconds else float("inf"),
+                        "seeds_per_second": len(seeds) / seconds if seconds else float("inf"),
+                        "checks": checks,
+                        "passed": bool(checks) and all(check["passed"] for check in checks),
+                    })
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def format_report(results):
+    lines = []
+    for result in results:
+        checks = []
+        for check in result["checks"]:
+            if check["deviation"] is None:
+                deviation = "vertex counts differ"
+            else:
+                deviation = " ".join(f"{name}={value:.2g}" for name, value in check["deviation"].items())
+            checks.append(f"vs. {check['reference']}: {deviation} {'OK' if check['passed'] else 'FAILED'}")
+        lines.append(
+            f"{result['engine']:<10} {result['case']:<8} {result['direction']:<8} {result['seeds']} seeds "
+            f"{result['vertices']} vertices {result['vertices_per_second']:.3g} vertices/s "
+            f"{result['seeds_per_second']:.3g} seeds/s {'; '.join(checks) or 'no reference, NOT VALIDATED'}"
+        )
+    if not any(check["grd2stream"] for result in results for check in result["checks"]):
+        lines.append("grd2stream parity NOT CHECKED: no binary installed and no stored grd2stream reference")
+    return "\n".join(lines)
+
+
+def main():
+    results = validate_engines()
+    print(format_report(results))
+    return 0 if all(result["passed"] for result in results) else 1
+
+
+# the relative imports need the package: run "python -m grd2stream.engine_validation" from the plugins folder
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+from collections import deque
+
+import numpy as np
+
+from .flowline_engine import default_step_size, join_halves, trace_flowlines
+from .spatial_hash import SpatialHash
+
+BATCH_SIZE = 64
+SEED_TOLERANCE = 0.99
+MIN_STEPS_PER_SEPARATION = 20
+
+
+def resample(rows, spacing):
+    """Samples a traced flowline every spacing units of arc length, returns (points, arc_length, row_index)."""
+    arc = np.abs(rows[:, 2])
+    positions = np.arange(0.0, arc[-1] + 1e-9 * spacing, spacing)
+    index = np.minimum(np.searchsorted(arc, positions), len(rows) - 1)
+    points = np.column_stack((np.interp(positions, arc, rows[:, 0]), np.interp(positions, arc, rows[:, 1])))
+    return points, positions, index
+
+
+def truncate(rows, spacing, d_test, accepted, own, direction, lag):
+    """Cuts a flowline half at the first sample within d_test of accepted lines or of itself further than lag away.
+
+    own holds the samples of the other half of the same line with their signed arc length and is
+    extended with the samples of this half.
+    """
+    if len(rows) < 2:
+        return rows[:1]
+    points, positions, index = resample(rows, spacing)
+    for (x, y), s, i in zip(points, positions * direction, index):
+        if accepted.near(x, y, d_test) or own.near(x, y, d_test, lambda other: abs(other - s) > lag):
+            return rows[:max(i, 1)]
+        own.insert(x, y, s)
+    return rows
+
+
+def spawn_candidates(points, d_sep, spacing):
+    """Seed candidates offset by d_sep to both sides of a line sampled every spacing, one pair about every d_sep."""
+    if len(points) < 2:
+        return np.empty((0, 2))
+    tangent = np.gradient(points, axis=0)
+    norm = np.hypot(tangent[:, 0], tangent[:, 1])
+    norm[norm == 0] = 1.0
+    normal = np.column_stack((-tangent[:, 1], tangent[:, 0])) / norm[:, None]
+    stride = max(int(round(d_sep / spacing)), 1)
+    base, normal = points[::stride], normal[::stride]
+    return np.concatenate((base + d_sep * normal, base - d_sep * normal))
+
+
+def evenly_spaced_flowlines(grid, d_sep, d_test_ratio=0.5, step_size=None, max_steps=None, max_time=None,
+                            seeds=None, min_length=None):
+    """Jobard-Lefer placement of flowlines that stay about d_sep apart over the whole grid.
+
+    Candidate seeds are traced in batches in both directions; each line is then accepted in turn,
+    cut where it comes within d_test_ratio * d_sep of an accepted line (or of itself), and spawns new
+    candidates at d_sep on both sides. A coarse lattice of fallback seeds, used one at a time once no
+    candidates are left, fills disconnected regions.
+    Without a step_size, steps are at most d_sep / MIN_STEPS_PER_SEPARATION long, which is finer
+    than the spacing used for proximity tests. Returns one (n, 6) array per accepted flowline,
+    joined at its seed.
+    """
+    if d_sep <= 0:
+        raise ValueError("The separation distance must be positive.")
+    step_size = step_size or max(default_step_size(grid), d_sep / MIN_STEPS_PER_SEPARATION)
+    d_test = d_test_ratio * d_sep
+    d_seed = SEED_TOLERANCE * d_sep
+    spacing = min(d_test / 2.0, d_sep / 4.0)
+    lag = 2.0 * d_sep
+    min_length = d_sep if min_length is None else min_length
+
+    if seeds is None:
+        xs = np.arange(grid.xmin + d_sep / 2.0, grid.xmax, 2.0 * d_sep)
+        ys = np.arange(grid.ymin + d_sep / 2.0, grid.ymax, 2.0 * d_sep)
+        lattice_x, lattice_y = np.meshgrid(xs, ys)
+        seeds = np.column_stack((lattice_x.ravel(), lattice_y.ravel()))
+        centre = len(seeds) // 2
+        seeds = np.concatenate((seeds[centre:centre + 1], seeds))
+    fallback = deque(map(tuple, np.asarray(seeds, dtype=float).reshape(-1, 2)))
+    candidates = deque()
+    accepted = SpatialHash(d_sep)
+    lines = []
+
+    while candidates or fallback:
+        queue, batch_size = (candidates, BATCH_SIZE) if candidates else (fallback, 1)
+        batch = []
+        while queue and len(batch) < batch_size:
+            x, y = queue.popleft()
+            if grid.contains(x, y) and not accepted.near(x, y, d_seed):
+                batch.append((x, y))
+        if not batch:
+            continue
+
+        seeds_xy = np.concatenate((batch, batch))
+
+        def stop(step, ids, x, y, dist):
+            """Ends lines that reached an accepted line or closed a loop back to their seed."""
+            closed = (np.hypot(x - seeds_xy[ids, 0], y - seeds_xy[ids, 1]) < d_test) & (np.abs(dist) > lag)
+            return closed | np.array([accepted.near(px, py, d_test) for px, py in zip(x, y)], dtype=bool)
+
+        halves = trace_flowlines(grid, seeds_xy, step_size, max_steps, max_time,
+                                 np.repeat([False, True], len(batch)), stop=stop)
+        forward, backward = halves[:len(batch)], halves[len(batch):]
+        for (x, y), forward_rows, backward_rows in zip(batch, forward, backward):
+            if not len(forward_rows) or accepted.near(x, y, d_seed):
+                continue
+            own = SpatialHash(d_sep)
+            forward_rows = truncate(forward_rows, spacing, d_test, accepted, own, 1.0, lag)
+            backward_rows = truncate(backward_rows, spacing, d_test, accepted, own, -1.0, lag)
+            line = join_halves(backward_rows, forward_rows)
+            if len(line) < 2 or abs(line[-1, 2] - line[0, 2]) < min_length:
+                continue
+            points, _, _ = resample(np.column_stack((line[:, :2], line[:, 2] - line[0, 2], line[:, 3:])), spacing)
+            accepted.insert_many(points)
+            lines.append(line)
+            candidates.extend(map(tuple, spawn_candidates(points, d_sep, spacing)))
+    return lines
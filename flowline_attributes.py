@@ -0,0 +1,72 @@
+import numpy as np
+
+from .flowline_engine import stack_rows
+
+DERIVED_FIELDS = ["speed", "heading", "curvature", "strain_rate"]
+VELOCITY_FIELDS = ["speed", "strain_rate"]
+
+
+def derived_field_names(field_names):
+    """Derived fields available for an output format; speed and strain rate need the v_x/v_y columns."""
+    has_velocity = "v_x" in field_names and "v_y" in field_names
+    return [name for name in DERIVED_FIELDS if has_velocity or name not in VELOCITY_FIELDS]
+
+
+def neighbours(lengths):
+    """Indices of the previous and next vertex on the same flowline, clamped at the flowline ends."""
+    n = int(np.sum(lengths))
+    starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    ends = starts + np.repeat(lengths, lengths) - 1
+    index = np.arange(n)
+    return np.maximum(index - 1, starts), np.minimum(index + 1, ends)
+
+
+def derived_columns(rows, lengths, field_names):
+    """Computes the derived fields for the stacked rows of several flowlines with the given lengths.
+
+    heading is the flow azimuth in degrees clockwise from the grid's y axis, curvature the signed turning
+    rate (1 / map unit, positive to the left of the flow), and strain_rate the along-flow derivative of the
+    speed (1 / time unit). Values that need a neighbour the vertex does not have are NaN.
+    """
+    rows = np.asarray(rows, dtype=float).reshape(len(rows), -1)
+    previous, following = neighbours(np.asarray(lengths, dtype=np.intp))
+    xy = rows[:, :2]
+    chord = xy[following] - xy[previous]
+    has_velocity = "v_x" in field_names and "v_y" in field_names
+    if has_velocity:
+        velocity = rows[:, [field_names.index("v_x"), field_names.index("v_y")]]
+        speed = np.hypot(velocity[:, 0], velocity[:, 1])
+        direction = velocity
+    else:
+        direction = chord
+    heading = np.degrees(np.arctan2(direction[:, 0], direction[:, 1])) % 360.0
+    heading[np.hypot(direction[:, 0], direction[:, 1]) == 0] = np.nan
+
+    incoming = xy - xy[previous]
+    outgoing = xy[following] - xy
+    turn = np.arctan2(incoming[:, 0] * outgoing[:, 1] - incoming[:, 1] * outgoing[:, 0],
+                      np.sum(incoming * outgoing, axis=1))
+    span = 0.5 * (np.hypot(incoming[:, 0], incoming[:, 1]) + np.hypot(outgoing[:, 0], outgoing[:, 1]))
+    interior = (previous < np.arange(len(rows))) & (following > np.arange(len(rows))) & (span > 0)
+    curvature = np.full(len(rows), np.nan)
+    curvature[interior] = turn[interior] / span[interior]
+
+    columns = {"heading": heading}
+    if has_velocity:
+        # along-flow distance between the neighbours, so the sign follows the flow for backward traces too
+        along = np.sum(chord * velocity, axis=1) / np.where(speed > 0, speed, np.nan)
+        along[np.abs(along) == 0] = np.nan
+        columns["speed"] = speed
+        columns["strain_rate"] = (speed[following] - speed[previous]) / along
+        curvature *= np.sign(np.sum(chord * velocity, axis=1))
+    columns["curvature"] = curvature
+    return np.column_stack([columns[name] for name in derived_field_names(field_names)])
+
+
+def add_derived_attributes(streamlines, field_names):
+    """Appends the derived columns to each flowline's rows, computed in one pass over all flowlines."""
+    if not len(streamlines):
+        return []
+    rows, lengths = stack_rows(streamlines, len(field_names))
+    derived = np.hstack((rows, derived_columns(rows, lengths, field_names)))
+    return np.split(derived, np.cumsum(lengths)[:-1])
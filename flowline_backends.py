@@ -0,0 +1,257 @@
+import abc
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from osgeo import gdal
+
+from .flowline_engine import MAX_STEPS, OUTPUT_COLUMNS, VelocityGrid, trace_flowlines
+from .flowline_jit import jit_available, trace_flowlines_jit
+
+CALIBRATION_KEY = "grd2stream/engine_calibration"
+CALIBRATION_VERSION = 2
+CALIBRATION_SEEDS = 32
+CALIBRATION_STEPS = 2000
+
+
+class GridPair:
+    """The two velocity components as engines consume them: an in-process VelocityGrid or two files for grd2stream.
+
+    Both are callables, so an engine only pays for the representation it uses.
+    """
+
+    def __init__(self, velocity_grid, paths):
+        self.velocity_grid = velocity_grid
+        self.paths = paths
+
+    @classmethod
+    def in_memory(cls, grid, directory):
+        """Pair for a grid held in memory; the files for grd2stream are written to directory on first use."""
+        files = []
+
+        def paths():
+            if not files:
+                files.extend(write_grid_files(grid, directory))
+            return files
+
+        return cls(lambda: grid, paths)
+
+
+class TracingEngine(abc.ABC):
+    """Traces fixed-step RK4 flowlines: grids + seeds + parameters -> one array per seed with OUTPUT_COLUMNS.
+
+    params holds step_size, max_steps, max_time and backward with the meaning of trace_flowlines().
+    """
+
+    name = None
+    description = None
+
+    def available(self):
+        return True
+
+    def capabilities(self):
+        return {
+            "available": self.available(),
+            "in_process": True,
+            "compact_grids": True,
+            "time_budget": True,
+            "progressive": False,
+            "area_of_interest": False,
+            "description": self.description,
+        }
+
+    @abc.abstractmethod
+    def trace(self, grids, seeds, params):
+        """Returns one array of OUTPUT_COLUMNS rows per seed."""
+
+
+class NumpyEngine(TracingEngine):
+    name = "numpy"
+    description = "In-process RK4, vectorized over all seeds with NumPy"
+
+    def trace(self, grids, seeds, params):
+        return trace_flowlines(grids.velocity_grid(), seeds, **params)
+
+
+class JitEngine(TracingEngine):
+    name = "numba"
+    description = "In-process RK4 compiled per seed with numba"
+
+    def available(self):
+        return jit_available()
+
+    def trace(self, grids, seeds, params):
+        return trace_flowlines_jit(grids.velocity_grid(), seeds, **params)
+
+
+class Grd2streamEngine(TracingEngine):
+    """The grd2stream binary; run(paths, seeds, params) returns its rows per flowline with all output columns."""
+
+    name = "grd2stream"
+    description = "grd2stream binary in the GMT6 conda environment (reference implementation)"
+
+    def __init__(self, executable, run):
+        self.executable = executable
+        self.run = run
+
+    def available(self):
+        return platform.system() != "Windows" and os.path.exists(self.executable)
+
+    def capabilities(self):
+        capabilities = super().capabilities()
+        capabilities.update(in_process=False, compact_grids=False, time_budget=False, progressive=True,
+                            area_of_interest=True)
+        return capabilities
+
+    def trace(self, grids, seeds, params):
+        seeds = np.asarray(seeds, dtype=float).reshape(-1, 2)
+        streamlines = self.run(grids.paths(), seeds, params)
+        if len(streamlines) != len(seeds):
+            raise RuntimeError(f"grd2stream returned {len(streamlines)} flowlines for {len(seeds)} seeds.")
+        return [np.asarray(rows, dtype=float).reshape(-1, len(OUTPUT_COLUMNS)) for rows in streamlines]
+
+
+def calibration_grid():
+    """Circular field u = y, v = -x on [-3, 3] x [-3, 3] with 0.01 spacing, as in grd2stream's validation example."""
+    nodes = np.linspace(-3.0, 3.0, 601)
+    x, y = np.meshgrid(nodes, nodes)
+    return VelocityGrid(y, -x, -3.0, -3.0, 0.01, 0.01)
+
+
+def write_grid_files(grid, directory):
+    """Writes both components of a grid as netCDF files grd2stream can read and returns their paths."""
+    geotransform = (grid.xmin - grid.x_inc / 2, grid.x_inc, 0.0, grid.ymax + grid.y_inc / 2, 0.0, -grid.y_inc)
+    paths = []
+    for name, values in (("vx", grid.vx), ("vy", grid.vy)):
+        dataset = gdal.GetDriverByName("MEM").Create("", grid.nx, grid.ny, 1, gdal.GDT_Float64)
+        dataset.SetGeoTransform(geotransform)
+        dataset.GetRasterBand(1).WriteArray(np.asarray(values, dtype=np.float64)[::-1])
+        path = os.path.join(directory, f"{name}.nc")
+        if gdal.Translate(path, dataset, format="netCDF") is None:
+            raise RuntimeError(f"Could not write calibration grid '{path}'.")
+        paths.append(path)
+    return tuple(paths)
+
+
+class EngineSelector:
+    """Picks the fastest available engine for a job from a calibration benchmark stored in settings.
+
+    Every engine traces one and CALIBRATION_SEEDS circular flowlines once, which gives its fixed
+    overhead and its time per vertex; decoding the benchmark grid files gives the time per grid
+    byte an in-process engine spends loading grids. A job of n seeds that first needs grid_bytes
+    decoded is then predicted to take overhead + n * max_steps * per_vertex + grid_bytes * per_grid_byte.
+    The benchmark is repeated when the set of available engines changes.
+    """
+
+    def __init__(self, engines, settings, key=CALIBRATION_KEY):
+        self.engines = engines
+        self.settings = settings
+        self.key = key
+
+    def available(self):
+        return [engine for engine in self.engines if engine.available()]
+
+    def signature(self):
+        return {"version": CALIBRATION_VERSION, "engines": [engine.name for engine in self.available()]}
+
+    def timings(self):
+        """Stored {engine name: {"overhead": s, "per_vertex": s}} of the current engines, or None."""
+        try:
+            stored = json.loads(self.settings.value(self.key, "") or "{}")
+        except ValueError:
+            return None
+        if stored.get("signature") != self.signature():
+            return None
+        return stored.get("timings")
+
+    def calibrated(self):
+        return len(self.available()) < 2 or self.timings() is not None
+
+    def calibrate(self):
+        grid = calibration_grid()
+        seeds = np.column_stack((np.linspace(0.25, 2.75, CALIBRATION_SEEDS), np.zeros(CALIBRATION_SEEDS)))
+        params = {"step_size": None, "max_steps": CALIBRATION_STEPS, "max_time": None, "backward": False}
+        directory = tempfile.mkdtemp(prefix="grd2stream_calibration_")
+        grids = GridPair.in_memory(grid, directory)
+        timings = {}
+        try:
+            per_grid_byte = 0.0
+            if any(engine.capabilities()["in_process"] for engine in self.available()):
+                try:
+                    # the faster of two reads, so opening the driver for the first time is not counted
+                    seconds, grid_bytes = min(timed_decode(grids.paths()) for _ in range(2))
+                    per_grid_byte = seconds / grid_bytes
+                    print(f"Grid decoding: {per_grid_byte * (1 << 20) * 1e3:.3g} ms/MiB")
+                except Exception as e:
+                    print(f"Calibration of grid decoding failed: {e}")
+            for engine in self.available():
+                print(f"Calibrating engine '{engine.name}': {engine.capabilities()}")
+                try:
+                    warm_up(engine, grids, seeds, params)
+                    small, small_vertices = timed_trace(engine, grids, seeds[:1], params)
+                    large, large_vertices = timed_trace(engine, grids, seeds, params)
+                except Exception as e:
+                    print(f"Calibration of engine '{engine.name}' failed: {e}")
+                    continue
+                per_vertex = max((large - small) / max(large_vertices - small_vertices, 1), 0.0)
+                timings[engine.name] = {"overhead": max(small - small_vertices * per_vertex, 0.0),
+                                        "per_vertex": per_vertex,
+                                        "per_grid_byte": per_grid_byte if engine.capabilities()["in_process"] else 0.0}
+                print(f"Engine '{engine.name}': {timings[engine.name]['overhead'] * 1e3:.1f} ms overhead, "
+                      f"{1.0 / per_vertex if per_vertex else float('inf'):.3g} vertices/s")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        self.settings.setValue(self.key, json.dumps({"signature": self.signature(), "timings": timings}))
+        return timings
+
+    def select(self, n_seeds, max_steps=None, required=(), grid_bytes=0):
+        """The available engine predicted to trace n_seeds fastest; calibrates first if needed.
+
+        Only engines with all required capabilities are considered, unless none has them.
+        grid_bytes is what an in-process engine would have to decode before tracing.
+        """
+        engines = self.available()
+        capable = [engine for engine in engines if all(engine.capabilities()[name] for name in required)]
+        engines = capable or engines
+        if len(engines) < 2:
+            return engines[0] if engines else NumpyEngine()
+        timings = self.timings()
+        if timings is None:
+            timings = self.calibrate()
+        vertices = n_seeds * (max_steps or MAX_STEPS)
+        predicted = {engine.name: timings[engine.name]["overhead"] + vertices * timings[engine.name]["per_vertex"]
+                     + grid_bytes * timings[engine.name]["per_grid_byte"]
+                     for engine in engines if engine.name in timings}
+        if not predicted:
+            return engines[-1]
+        return min(engines, key=lambda engine: predicted.get(engine.name, float("inf")))
+
+
+def warm_up(engine, grids, seeds, params):
+    """Runs an in-process engine for two steps, so grid loading and compilation stay out of its timings."""
+    if engine.capabilities()["in_process"]:
+        engine.trace(grids, seeds[:1], dict(params, max_steps=2))
+
+
+def timed_decode(paths):
+    """Wall time to decode grid files into float64 arrays, as GridCache.read_band() does, and the bytes decoded."""
+    start = time.perf_counter()
+    grid_bytes = 0
+    for path in paths:
+        dataset = gdal.Open(path)
+        if dataset is None:
+            raise RuntimeError(f"Could not open calibration grid '{path}'.")
+        grid_bytes += dataset.GetRasterBand(1).ReadAsArray().astype(np.float64).nbytes
+        dataset = None
+    return time.perf_counter() - start, grid_bytes
+
+
+def timed_trace(engine, grids, seeds, params):
+    """Wall time of one engine run and the number of vertices it returned."""
+    start = time.perf_counter()
+    streamlines = engine.trace(grids, seeds, params)
+    return time.perf_counter() - start, sum(len(streamline) for streamline in streamlines)
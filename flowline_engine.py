@@ -0,0 +1,337 @@
+import time
+
+import numpy as np
+
+MAX_STEPS = 10000
+ON_GRID_EPS = 1e-3
+
+OUTPUT_COLUMNS = ["x", "y", "dist", "v_x", "v_y", "time"]
+
+# Dormand-Prince 5(4) tableau; the last row of A holds the 5th-order weights (first same as last).
+DOPRI_A = [
+    [],
+    [1 / 5],
+    [3 / 40, 9 / 40],
+    [44 / 45, -56 / 15, 32 / 9],
+    [19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729],
+    [9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656],
+    [35 / 384, 0.0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84],
+]
+DOPRI_E = np.array([71 / 57600, 0.0, -71 / 16695, 71 / 1920, -17253 / 339200, 22 / 525, -1 / 40])
+
+
+def ascending_nodes(arrays, geotransform):
+    """Flips GDAL-ordered arrays to ascending x and y; returns them with the first node and the node spacing."""
+    x_inc, y_inc = geotransform[1], geotransform[5]
+    xmin = geotransform[0] + 0.5 * x_inc
+    ymin = geotransform[3] + 0.5 * y_inc
+    ny, nx = arrays[0].shape
+    if y_inc < 0:
+        arrays = [array[::-1] for array in arrays]
+        ymin = geotransform[3] + (ny - 0.5) * y_inc
+    if x_inc < 0:
+        arrays = [array[:, ::-1] for array in arrays]
+        xmin = geotransform[0] + (nx - 0.5) * x_inc
+    return [np.ascontiguousarray(array) for array in arrays], xmin, ymin, abs(x_inc), abs(y_inc)
+
+
+class VelocityGrid:
+    """Both velocity components on regular nodes with ascending x and y, i.e. the memory layout of grd2stream."""
+
+    def __init__(self, vx, vy, xmin, ymin, x_inc, y_inc, values=None):
+        if vx.shape != vy.shape:
+            raise ValueError("Velocity components must have the same shape.")
+        self.ny, self.nx = vx.shape
+        if self.nx < 2 or self.ny < 2:
+            raise ValueError("Velocity grids need at least 2x2 nodes.")
+        self.vx = vx
+        self.vy = vy
+        self.xmin = xmin
+        self.ymin = ymin
+        self.x_inc = x_inc
+        self.y_inc = y_inc
+        self.xmax = xmin + (self.nx - 1) * x_inc
+        self.ymax = ymin + (self.ny - 1) * y_inc
+        self.values = np.stack((vx, vy), axis=-1).reshape(-1, 2) if values is None else values
+        self.corner_offsets = np.array([0, self.nx, 1, self.nx + 1], dtype=np.intp)
+
+    @classmethod
+    def from_values(cls, values, nx, ny, xmin, ymin, x_inc, y_inc):
+        """Wraps an interleaved (nx * ny, 2) node array without copying it, e.g. one in shared memory."""
+        values = values.reshape(-1, 2)
+        return cls(values[:, 0].reshape(ny, nx), values[:, 1].reshape(ny, nx), xmin, ymin, x_inc, y_inc, values)
+
+    @classmethod
+    def from_geotransform(cls, vx, vy, geotransform):
+        """Builds a grid from GDAL-ordered (north-up) arrays, using pixel centres as nodes."""
+        (vx, vy), xmin, ymin, x_inc, y_inc = ascending_nodes((vx, vy), geotransform)
+        return cls(vx, vy, xmin, ymin, x_inc, y_inc)
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+    def contains(self, x, y):
+        return (x >= self.xmin) & (x <= self.xmax) & (y >= self.ymin) & (y <= self.ymax)
+
+    def interpolate(self, x, y):
+        """Bilinear velocity at (x, y) in the precision of the grid's values, NaN if any surrounding node is NaN.
+
+        Mirrors interp2() in grd2stream.c, including its pairing of the x fraction with the
+        (i, j) -> (i, j + 1) corners, so that results match the grd2stream binary. Non-finite
+        coordinates, e.g. a stage position after NoData, give NaN instead of an invalid node index.
+        """
+        fx = (x - self.xmin) / self.x_inc
+        fy = (y - self.ymin) / self.y_inc
+        finite = np.isfinite(fx) & np.isfinite(fy)
+        if not finite.all():
+            fx = np.where(finite, fx, 0.0)
+            fy = np.where(finite, fy, 0.0)
+        ix = np.minimum(np.maximum(fx, 0), self.nx - 2).astype(np.intp)
+        iy = np.minimum(np.maximum(fy, 0), self.ny - 2).astype(np.intp)
+        tx = (fx - ix)[:, None].astype(self.values.dtype, copy=False)
+        ty = (fy - iy)[:, None].astype(self.values.dtype, copy=False)
+        corners = self.values[(iy * self.nx + ix)[:, None] + self.corner_offsets]
+        v00, v10, v01, v11 = corners[:, 0], corners[:, 1], corners[:, 2], corners[:, 3]
+        p = v00 + tx * (v10 - v00)
+        v = p + ty * (v01 + tx * (v11 - v01) - p)
+        on_grid = (np.abs(tx) < ON_GRID_EPS) & (np.abs(ty) < ON_GRID_EPS)
+        if on_grid.any():
+            v = np.where(on_grid, v00, v)
+        if not finite.all():
+            v = np.where(finite[:, None], v, np.nan)
+        return v[:, 0], v[:, 1]
+
+    def decimated(self, factor):
+        if factor <= 1:
+            return self
+        return VelocityGrid(
+            np.ascontiguousarray(self.vx[::factor, ::factor]),
+            np.ascontiguousarray(self.vy[::factor, ::factor]),
+            self.xmin, self.ymin, self.x_inc * factor, self.y_inc * factor
+        )
+
+
+def default_step_size(grid):
+    return min(grid.x_inc, grid.y_inc) / 5.0
+
+
+def trace_flowlines(grid, seeds, step_size=None, max_steps=None, max_time=None, backward=False, time_budget=None,
+                    stop=None, stop_interval=16):
+    """Traces all seeds at once with grd2stream's RK4 scheme.
+
+    Returns one (n, 6) array per seed with the columns of OUTPUT_COLUMNS; seeds outside the
+    grid yield an empty array, just as grd2stream skips them. backward may also be one flag per
+    seed. With a time_budget (in seconds),
+    integration stops early once it is used up, which truncates the flowlines. stop(step, ids, x, y, dist)
+    is called every stop_interval steps with the active seeds and returns a mask of those to end.
+    """
+    seeds = np.asarray(seeds, dtype=float).reshape(-1, 2)
+    n_seeds = len(seeds)
+    max_steps = MAX_STEPS if max_steps is None else int(max_steps)
+    direction = np.where(np.broadcast_to(backward, (n_seeds,)), -1.0, 1.0)
+    min_inc = min(grid.x_inc, grid.y_inc)
+
+    x0, y0 = seeds[:, 0].copy(), seeds[:, 1].copy()
+    x, y = x0.copy(), y0.copy()
+    dist = np.zeros(n_seeds)
+    itime = np.zeros(n_seeds)
+    delta = np.full(n_seeds, step_size or default_step_size(grid), dtype=float)
+    active = grid.contains(x0, y0)
+
+    deadline = time.perf_counter() + time_budget if time_budget else None
+    ids_per_step, rows_per_step = [], []
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for step in range(max_steps):
+            if stop is not None and step and not step % stop_interval:
+                ids = np.flatnonzero(active)
+                active[ids[stop(step, ids, x[ids], y[ids], dist[ids])]] = False
+            ids = np.flatnonzero(active)
+            if not len(ids) or (deadline and time.perf_counter() > deadline):
+                break
+            xi, yi = x[ids], y[ids]
+            vxi, vyi = grid.interpolate(xi, yi)
+            ids_per_step.append(ids)
+            rows_per_step.append(np.column_stack((xi, yi, dist[ids], vxi, vyi, itime[ids])))
+
+            uv = np.hypot(vxi, vyi)
+            ok = np.isfinite(uv) & (uv > 0.0)
+            d = delta[ids]
+            if max_time is not None:
+                time_excess = itime[ids] + d / uv - max_time
+                d = np.where(time_excess > 0.0, (d / uv - time_excess) * uv, d)
+                ok &= time_excess != 0.0
+            ok &= d > 0.0
+            delta[ids] = d
+
+            sign = direction[ids]
+            dx0 = sign * d * vxi / uv
+            dy0 = sign * d * vyi / uv
+            ok &= grid.contains(x0[ids] + dx0, y0[ids] + dy0)
+
+            # a stage position that is NaN after NoData interpolates to NaN, which ends the seed here as in grd2stream.c
+            vx1, vy1 = grid.interpolate(xi + dx0 / 2.0, yi + dy0 / 2.0)
+            uv1 = np.hypot(vx1, vy1)
+            ok &= np.isfinite(uv1) & (uv1 > 0.0)
+            dx1 = sign * d * vx1 / uv1
+            dy1 = sign * d * vy1 / uv1
+
+            vx2, vy2 = grid.interpolate(xi + dx1 / 2.0, yi + dy1 / 2.0)
+            uv2 = np.hypot(vx2, vy2)
+            ok &= np.isfinite(uv2) & (uv2 > 0.0)
+            dx2 = sign * d * vx2 / uv2
+            dy2 = sign * d * vy2 / uv2
+
+            vx3, vy3 = grid.interpolate(xi + dx2, yi + dy2)
+            uv3 = np.hypot(vx3, vy3)
+            ok &= np.isfinite(uv3) & (uv3 > 0.0)
+            dx3 = sign * d * vx3 / uv3
+            dy3 = sign * d * vy3 / uv3
+
+            dx = dx0 / 6.0 + dx1 / 3.0 + dx2 / 3.0 + dx3 / 6.0
+            dy = dy0 / 6.0 + dy1 / 3.0 + dy2 / 3.0 + dy3 / 6.0
+            ok &= grid.contains(xi + dx, yi + dy)
+            ok &= np.hypot(dx, dy) * 1000.0 >= min_inc
+
+            moving = ids[ok]
+            x[moving] += dx[ok]
+            y[moving] += dy[ok]
+            dist[moving] += sign[ok] * d[ok]
+            itime[moving] += d[ok] / uv[ok]
+            active[ids[~ok]] = False
+
+    return split_rows(ids_per_step, rows_per_step, n_seeds)
+
+
+def trace_flowlines_adaptive(grid, seeds, rtol=1e-3, atol=None, min_step=None, max_step=None, max_steps=None,
+                             max_time=None, backward=False):
+    """Traces all seeds with an embedded Dormand-Prince 5(4) scheme and per-seed step size control.
+
+    The local error of each step, in map units, must stay below atol + rtol * step length; atol
+    defaults to a thousandth of a grid cell and the step is kept within [min_step, max_step]
+    (a fiftieth of a cell and two cells by default). Seeds that would leave the grid or hit NoData
+    retry with smaller steps before they stop. Returns the flowlines as trace_flowlines() does and
+    a dict with per-seed arrays "accepted", "rejected", "min_step" and "max_step".
+    """
+    seeds = np.asarray(seeds, dtype=float).reshape(-1, 2)
+    n_seeds = len(seeds)
+    max_steps = MAX_STEPS if max_steps is None else int(max_steps)
+    direction = np.where(np.broadcast_to(backward, (n_seeds,)), -1.0, 1.0)
+    min_inc = min(grid.x_inc, grid.y_inc)
+    atol = min_inc * 1e-3 if atol is None else atol
+    min_step = min_inc / 50.0 if min_step is None else min_step
+    max_step = 2.0 * min_inc if max_step is None else max_step
+
+    x, y = seeds[:, 0].copy(), seeds[:, 1].copy()
+    dist = np.zeros(n_seeds)
+    itime = np.zeros(n_seeds)
+    h = np.full(n_seeds, min(max(default_step_size(grid), min_step), max_step))
+    active = grid.contains(x, y)
+    vx, vy = np.full(n_seeds, np.nan), np.full(n_seeds, np.nan)
+    if active.any():
+        vx[active], vy[active] = grid.interpolate(x[active], y[active])
+    accepted = np.zeros(n_seeds, dtype=np.int64)
+    rejected = np.zeros(n_seeds, dtype=np.int64)
+    smallest = np.full(n_seeds, np.inf)
+    largest = np.zeros(n_seeds)
+    emitted = np.zeros(n_seeds, dtype=bool)
+
+    ids_per_step, rows_per_step = [], []
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        for _ in range(4 * max_steps):
+            ids = np.flatnonzero(active & (accepted < max_steps))
+            if not len(ids):
+                break
+            new = ids[~emitted[ids]]
+            if len(new):
+                ids_per_step.append(new)
+                rows_per_step.append(np.column_stack((x[new], y[new], dist[new], vx[new], vy[new], itime[new])))
+                emitted[new] = True
+
+            xi, yi, hi, sign = x[ids], y[ids], h[ids], direction[ids]
+            uv = np.hypot(vx[ids], vy[ids])
+            alive = np.isfinite(uv) & (uv > 0.0)
+            if max_time is not None:
+                remaining = max_time - itime[ids]
+                alive &= remaining > 0.0
+                hi = np.minimum(hi, remaining * uv)
+
+            slopes = [(sign * vx[ids] / uv, sign * vy[ids] / uv, 1.0 / uv)]
+            valid = alive.copy()
+            for a in DOPRI_A[1:]:
+                px = xi + hi * sum(a_j * k[0] for a_j, k in zip(a, slopes))
+                py = yi + hi * sum(a_j * k[1] for a_j, k in zip(a, slopes))
+                valid &= grid.contains(px, py)
+                kvx, kvy = grid.interpolate(px, py)
+                kuv = np.hypot(kvx, kvy)
+                valid &= np.isfinite(kuv) & (kuv > 0.0)
+                slopes.append((sign * kvx / kuv, sign * kvy / kuv, 1.0 / kuv))
+            new_x, new_y = px, py
+            new_t = itime[ids] + hi * sum(a_j * k[2] for a_j, k in zip(DOPRI_A[-1], slopes))
+            error_x = hi * sum(e * k[0] for e, k in zip(DOPRI_E, slopes))
+            error_y = hi * sum(e * k[1] for e, k in zip(DOPRI_E, slopes))
+            error = np.hypot(error_x, error_y) / (atol + rtol * hi)
+            error = np.where(valid, error, np.inf)
+
+            at_minimum = hi <= min_step * (1.0 + 1e-12)
+            accept = valid & ((error <= 1.0) | at_minimum)
+            stop = ~alive | (~valid & at_minimum)
+            factor = np.clip(0.9 * np.power(np.maximum(error, 1e-10), -0.2), 0.2, 5.0)
+            factor = np.where(valid, factor, 0.25)
+
+            moving = ids[accept]
+            x[moving], y[moving] = new_x[accept], new_y[accept]
+            dist[moving] += sign[accept] * hi[accept]
+            itime[moving] = new_t[accept]
+            vx[moving], vy[moving] = kvx[accept], kvy[accept]
+            accepted[moving] += 1
+            smallest[moving] = np.minimum(smallest[moving], hi[accept])
+            largest[moving] = np.maximum(largest[moving], hi[accept])
+            emitted[moving] = False
+            rejected[ids[~accept & ~stop]] += 1
+            h[ids] = np.clip(hi * factor, min_step, max_step)
+            active[ids[stop]] = False
+
+    stats = {"accepted": accepted, "rejected": rejected, "min_step": smallest, "max_step": largest}
+    return split_rows(ids_per_step, rows_per_step, n_seeds), stats
+
+
+def trace_bidirectional(grid, seeds, step_size=None, max_steps=None, max_time=None, time_budget=None):
+    """Traces every seed downstream and upstream in one pass and joins both halves at the seed.
+
+    dist and time are negative on the upstream half, so each flowline runs from its upstream end
+    to its downstream end.
+    """
+    seeds = np.asarray(seeds, dtype=float).reshape(-1, 2)
+    n_seeds = len(seeds)
+    backward = np.repeat([False, True], n_seeds)
+    halves = trace_flowlines(grid, np.concatenate((seeds, seeds)), step_size, max_steps, max_time, backward, time_budget)
+    return [join_halves(halves[n_seeds + i], halves[i]) for i in range(n_seeds)]
+
+
+def join_halves(backward, forward):
+    """Joins the backward and forward half of a flowline at the seed; time is negative on the backward half."""
+    if not len(backward):
+        return forward
+    backward = backward[::-1].copy()
+    backward[:, 5] *= -1.0
+    return np.concatenate((backward[:-1], forward)) if len(forward) else backward
+
+
+def split_rows(ids_per_step, rows_per_step, n_seeds):
+    """Regroups per-step rows of many seeds into one array per seed, in step order."""
+    if not ids_per_step:
+        return [np.empty((0, len(OUTPUT_COLUMNS))) for _ in range(n_seeds)]
+    ids = np.concatenate(ids_per_step)
+    rows = np.concatenate(rows_per_step)
+    order = np.argsort(ids, kind="stable")
+    counts = np.bincount(ids, minlength=n_seeds)
+    return np.split(rows[order], np.cumsum(counts)[:-1])
+
+
+def stack_rows(streamlines, n_columns):
+    """Stacks the first n_columns of every flowline's rows into one array; returns it with the flowline lengths."""
+    arrays = [np.asarray(streamline, dtype=float).reshape(-1, n_columns) if not len(streamline)
+              else np.asarray(streamline, dtype=float)[:, :n_columns] for streamline in streamlines]
+    lengths = np.array([len(rows) for rows in arrays], dtype=np.intp)
+    return (np.concatenate(arrays) if arrays else np.empty((0, n_columns))), lengths
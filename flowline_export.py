@@ -0,0 +1,93 @@
+import json
+import struct
+
+import numpy as np
+from osgeo import osr
+
+from .flowline_engine import stack_rows
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as parquet
+except ImportError:
+    pa = None
+
+EXPORT_FILTER = "GeoParquet (*.parquet);;Arrow IPC (*.arrow *.feather)"
+GEOPARQUET_VERSION = "1.0.0"
+
+
+def export_available():
+    return pa is not None
+
+
+def crs_projjson(wkt):
+    """PROJJSON of a CRS for GeoParquet metadata, or None if it is unknown or GDAL cannot convert it."""
+    if not wkt:
+        return None
+    srs = osr.SpatialReference(wkt=wkt)
+    if not hasattr(srs, "ExportToPROJJSON"):
+        return None
+    return json.loads(srs.ExportToPROJJSON())
+
+
+def linestring_wkb(xy):
+    """Little-endian WKB LineString of an (n, 2) coordinate array."""
+    return struct.pack("<BII", 1, 2, len(xy)) + np.ascontiguousarray(xy, dtype="<f8").tobytes()
+
+
+def flowline_table(streamlines, field_names, flowline_columns=None, metadata=None, crs=None):
+    """Arrow table with one row per flowline, built straight from the vertex arrays.
+
+    Every output column becomes a list<double> column sharing one offsets buffer, so a reader gets
+    the flat vertex values plus flowline offsets; geometry holds the flowline as WKB LineString.
+    flowline_columns adds per-flowline values (e.g. merged_into), metadata is stored as JSON
+    under the 'grd2stream' schema key next to the GeoParquet 'geo' key.
+    """
+    if pa is None:
+        raise RuntimeError("Exporting flowlines requires the pyarrow package.")
+    rows, lengths = stack_rows(streamlines, len(field_names))
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    offsets = pa.array(offsets, type=pa.int64())
+
+    columns = {
+        "seed_id": pa.array(np.arange(1, len(lengths) + 1, dtype=np.int64)),
+        "n_vertices": pa.array(lengths.astype(np.int64)),
+    }
+    for name, values in (flowline_columns or {}).items():
+        columns[name] = pa.array(values)
+    columns["geometry"] = pa.array(
+        [linestring_wkb(rows[start:end, :2]) for start, end in zip(offsets.to_numpy()[:-1], offsets.to_numpy()[1:])],
+        type=pa.binary()
+    )
+    for i, name in enumerate(field_names):
+        columns[name] = pa.LargeListArray.from_arrays(offsets, pa.array(rows[:, i], type=pa.float64()))
+
+    geometry_metadata = {"encoding": "WKB", "geometry_types": ["LineString"], "crs": crs}
+    if len(rows):
+        finite = rows[np.isfinite(rows[:, :2]).all(axis=1), :2]
+        if len(finite):
+            geometry_metadata["bbox"] = [float(v) for v in (*finite.min(axis=0), *finite.max(axis=0))]
+    schema_metadata = {
+        "geo": json.dumps({
+            "version": GEOPARQUET_VERSION,
+            "primary_column": "geometry",
+            "columns": {"geometry": geometry_metadata},
+        }),
+        "grd2stream": json.dumps(metadata or {}),
+    }
+    table = pa.table(columns)
+    return table.replace_schema_metadata(schema_metadata)
+
+
+def export_flowlines(path, streamlines, field_names, flowline_columns=None, metadata=None, crs=None):
+    """Writes flowlines as GeoParquet (.parquet) or Arrow IPC (.arrow / .feather) and returns the row count."""
+    table = flowline_table(streamlines, field_names, flowline_columns, metadata, crs)
+    if path.lower().endswith(".parquet"):
+        parquet.write_table(table, path, compression="zstd")
+    elif path.lower().endswith((".arrow", ".feather")):
+        feather.write_feather(table, path, compression="zstd")
+    else:
+        raise ValueError(f"Unknown export format for '{path}'; use .parquet, .arrow or .feather.")
+    return table.num_rows
@@ -0,0 +1,175 @@
+import math
+import time
+
+import numpy as np
+
+from .flowline_engine import MAX_STEPS, ON_GRID_EPS, OUTPUT_COLUMNS, default_step_size, join_halves, trace_flowlines
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# steps per seed between two checks of a time budget
+BUDGET_STEPS = 256
+
+
+def jit_available():
+    return numba is not None
+
+
+def interp2(values, nx, ny, xmin, ymin, x_inc, y_inc, eps, frac, x, y):
+    """Scalar VelocityGrid.interpolate(): same corner pairing and arithmetic in the precision of values.
+
+    Non-finite coordinates give NaN, which stops the seed in advance(); numba does not check bounds,
+    so they must never become node indices.
+    """
+    fx = (x - xmin) / x_inc
+    fy = (y - ymin) / y_inc
+    if not (math.isfinite(fx) and math.isfinite(fy)):
+        frac[0] = math.nan
+        return frac[0], frac[0]
+    ix = int(min(max(fx, 0.0), nx - 2))
+    iy = int(min(max(fy, 0.0), ny - 2))
+    # storing into frac casts the fractions to the grid's dtype, as astype() does in the NumPy engine
+    frac[0] = fx - ix
+    frac[1] = fy - iy
+    tx = frac[0]
+    ty = frac[1]
+    base = iy * nx + ix
+    if abs(tx) < eps and abs(ty) < eps:
+        return values[base, 0], values[base, 1]
+    v00x, v00y = values[base, 0], values[base, 1]
+    v10x, v10y = values[base + nx, 0], values[base + nx, 1]
+    v01x, v01y = values[base + 1, 0], values[base + 1, 1]
+    v11x, v11y = values[base + nx + 1, 0], values[base + nx + 1, 1]
+    px = v00x + tx * (v10x - v00x)
+    py = v00y + tx * (v10y - v00y)
+    return (px + ty * (v01x + tx * (v11x - v01x) - px),
+            py + ty * (v01y + tx * (v11y - v01y) - py))
+
+
+def advance(values, nx, ny, xmin, ymin, x_inc, y_inc, state, x0, y0, sign, max_time, out):
+    """Takes up to len(out) RK4 steps of one seed, exactly as trace_flowlines() does.
+
+    state holds x, y, dist, time and step size and is updated in place; every step writes its
+    start row to out. Returns the number of rows written and whether the seed is still moving.
+    """
+    xmax = xmin + (nx - 1) * x_inc
+    ymax = ymin + (ny - 1) * y_inc
+    min_inc = min(x_inc, y_inc)
+    frac = np.empty(2, dtype=values.dtype)
+    frac[0] = ON_GRID_EPS
+    eps = frac[0]
+    x, y, dist, itime, d = state[0], state[1], state[2], state[3], state[4]
+    for n in range(len(out)):
+        vx, vy = interp2(values, nx, ny, xmin, ymin, x_inc, y_inc, eps, frac, x, y)
+        out[n, 0] = x
+        out[n, 1] = y
+        out[n, 2] = dist
+        out[n, 3] = vx
+        out[n, 4] = vy
+        out[n, 5] = itime
+
+        ok = True
+        uv = np.hypot(vx, vy)
+        if not (math.isfinite(uv) and uv > 0.0):
+            ok = False
+        if not math.isnan(max_time):
+            time_excess = itime + d / uv - max_time
+            if time_excess > 0.0:
+                d = (d / uv - time_excess) * uv
+            if time_excess == 0.0:
+                ok = False
+        if not d > 0.0:
+            ok = False
+        state[4] = d
+
+        dx0 = sign * d * vx / uv
+        dy0 = sign * d * vy / uv
+        if not (xmin <= x0 + dx0 <= xmax and ymin <= y0 + dy0 <= ymax):
+            ok = False
+        if not ok:
+            return n + 1, False
+
+        vx1, vy1 = interp2(values, nx, ny, xmin, ymin, x_inc, y_inc, eps, frac, x + dx0 / 2.0, y + dy0 / 2.0)
+        uv1 = np.hypot(vx1, vy1)
+        dx1 = sign * d * vx1 / uv1
+        dy1 = sign * d * vy1 / uv1
+        vx2, vy2 = interp2(values, nx, ny, xmin, ymin, x_inc, y_inc, eps, frac, x + dx1 / 2.0, y + dy1 / 2.0)
+        uv2 = np.hypot(vx2, vy2)
+        dx2 = sign * d * vx2 / uv2
+        dy2 = sign * d * vy2 / uv2
+        vx3, vy3 = interp2(values, nx, ny, xmin, ymin, x_inc, y_inc, eps, frac, x + dx2, y + dy2)
+        uv3 = np.hypot(vx3, vy3)
+        dx3 = sign * d * vx3 / uv3
+        dy3 = sign * d * vy3 / uv3
+        if not (math.isfinite(uv1) and uv1 > 0.0 and math.isfinite(uv2) and uv2 > 0.0
+                and math.isfinite(uv3) and uv3 > 0.0):
+            return n + 1, False
+
+        dx = dx0 / 6.0 + dx1 / 3.0 + dx2 / 3.0 + dx3 / 6.0
+        dy = dy0 / 6.0 + dy1 / 3.0 + dy2 / 3.0 + dy3 / 6.0
+        if not (xmin <= x + dx <= xmax and ymin <= y + dy <= ymax) or not np.hypot(dx, dy) * 1000.0 >= min_inc:
+            return n + 1, False
+
+        x += dx
+        y += dy
+        dist += sign * d
+        itime += d / uv
+        state[0], state[1], state[2], state[3] = x, y, dist, itime
+    return len(out), True
+
+
+if numba is not None:
+    # NumPy's error model makes a zero speed give inf/NaN, as in the NumPy engine, instead of raising ZeroDivisionError
+    interp2 = numba.njit(cache=True, nogil=True, error_model="numpy")(interp2)
+    advance = numba.njit(cache=True, nogil=True, error_model="numpy")(advance)
+
+
+def trace_flowlines_jit(grid, seeds, step_size=None, max_steps=None, max_time=None, backward=False,
+                        time_budget=None):
+    """trace_flowlines() with the RK4 loop of each seed compiled by numba; identical results.
+
+    Falls back to trace_flowlines() if numba is not installed. With a time_budget all seeds
+    advance BUDGET_STEPS at a time, so they are truncated after about the same number of steps.
+    """
+    if numba is None:
+        return trace_flowlines(grid, seeds, step_size, max_steps, max_time, backward, time_budget)
+    seeds = np.asarray(seeds, dtype=float).reshape(-1, 2)
+    n_seeds = len(seeds)
+    max_steps = MAX_STEPS if max_steps is None else int(max_steps)
+    direction = np.where(np.broadcast_to(backward, (n_seeds,)), -1.0, 1.0)
+    delta = float(step_size or default_step_size(grid))
+    max_time = math.nan if max_time is None else float(max_time)
+    values = np.ascontiguousarray(grid.values)
+
+    states = [np.array([x, y, 0.0, 0.0, delta]) for x, y in seeds]
+    rows = [[] for _ in range(n_seeds)]
+    active = list(np.flatnonzero(grid.contains(seeds[:, 0], seeds[:, 1])))
+    chunk = min(BUDGET_STEPS, max_steps) if time_budget else max_steps
+    out = np.empty((max(chunk, 1), len(OUTPUT_COLUMNS)))
+    deadline = time.perf_counter() + time_budget if time_budget else None
+    taken = 0
+    while active and taken < max_steps and not (deadline and time.perf_counter() > deadline):
+        n_steps = min(chunk, max_steps - taken)
+        still_active = []
+        for i in active:
+            count, moving = advance(values, grid.nx, grid.ny, grid.xmin, grid.ymin, grid.x_inc, grid.y_inc,
+                                    states[i], seeds[i, 0], seeds[i, 1], direction[i], max_time, out[:n_steps])
+            rows[i].append(out[:count].copy())
+            if moving:
+                still_active.append(i)
+        active = still_active
+        taken += n_steps
+    return [np.concatenate(parts) if parts else np.empty((0, len(OUTPUT_COLUMNS))) for parts in rows]
+
+
+def trace_bidirectional_jit(grid, seeds, step_size=None, max_steps=None, max_time=None, time_budget=None):
+    """trace_bidirectional() on the compiled kernel."""
+    seeds = np.asarray(seeds, dtype=float).reshape(-1, 2)
+    n_seeds = len(seeds)
+    backward = np.repeat([False, True], n_seeds)
+    halves = trace_flowlines_jit(grid, np.concatenate((seeds, seeds)), step_size, max_steps, max_time, backward,
+                                 time_budget)
+    return [join_halves(halves[n_seeds + i], halves[i]) for i in range(n_seeds)]
@@ -0,0 +1,133 @@
+import os
+
+from qgis.PyQt.QtCore import QObject, QProcess, QProcessEnvironment, QTimer, pyqtSignal
+
+from .flowline_layer import vertex_features
+
+
+class StreamlineParser:
+    """Incrementally parses grd2stream output into (seed_id, row) pairs as text arrives."""
+
+    def __init__(self):
+        self.remainder = ""
+        self.seed_id = 0
+
+    def feed(self, text):
+        lines = (self.remainder + text).split("\n")
+        self.remainder = lines.pop()
+        return self.parse_lines(lines)
+
+    def flush(self):
+        lines = [self.remainder] if self.remainder else []
+        self.remainder = ""
+        return self.parse_lines(lines)
+
+    def parse_lines(self, lines):
+        rows = []
+        for line in lines:
+            line = line.strip()
+            if line.startswith(">"):
+                self.seed_id += 1
+                continue
+            if not line or line.startswith("#"):
+                continue
+            rows.append((max(self.seed_id, 1), list(map(float, line.split()))))
+        return rows
+
+
+class Grd2StreamJob(QObject):
+    """Runs a grd2stream command in the background and emits parsed rows while it is running."""
+
+    rows_ready = pyqtSignal(list)
+    finished = pyqtSignal(bool, str)
+
+    def __init__(self, cmd, seed_file_path=None, parent=None):
+        super().__init__(parent)
+        self.cmd = cmd
+        self.seed_file_path = seed_file_path
+        self.parser = StreamlineParser()
+        self.stderr = ""
+        self.process = QProcess(self)
+        self.process.setProcessEnvironment(QProcessEnvironment.systemEnvironment())
+        self.process.readyReadStandardOutput.connect(self.read_output)
+        self.process.readyReadStandardError.connect(self.read_error)
+        self.process.finished.connect(self.process_finished)
+        self.process.errorOccurred.connect(self.process_error)
+
+    def start(self):
+        print(f"Executing Command: {self.cmd}")
+        self.process.start("bash", ["-c", self.cmd])
+
+    def cancel(self):
+        if self.process.state() != QProcess.NotRunning:
+            self.process.kill()
+
+    def read_output(self):
+        text = bytes(self.process.readAllStandardOutput()).decode(errors="replace")
+        rows = self.parser.feed(text)
+        if rows:
+            self.rows_ready.emit(rows)
+
+    def read_error(self):
+        self.stderr += bytes(self.process.readAllStandardError()).decode(errors="replace")
+
+    def process_finished(self, exit_code, exit_status):
+        self.read_output()
+        self.read_error()
+        rows = self.parser.flush()
+        if rows:
+            self.rows_ready.emit(rows)
+        self.cleanup()
+        if exit_status != QProcess.NormalExit or exit_code != 0:
+            print(f"Command failed with error: {self.stderr}")
+            self.finished.emit(False, self.stderr.strip() or f"grd2stream exited with code {exit_code}")
+        else:
+            self.finished.emit(True, "")
+
+    def process_error(self, error):
+        if error == QProcess.FailedToStart:
+            self.cleanup()
+            self.finished.emit(False, "Could not start grd2stream.")
+
+    def cleanup(self):
+        if self.seed_file_path:
+            try:
+                os.unlink(self.seed_file_path)
+            except OSError as e:
+                print(f"Error during cleanup: {e}")
+            self.seed_file_path = None
+
+
+class ProgressiveLayerWriter(QObject):
+    """Buffers incoming rows and writes them to a layer at a fixed rate, so repaints are coalesced."""
+
+    def __init__(self, layer, n_fields, extra_attributes=None, refresh_interval=250, parent=None):
+        super().__init__(parent)
+        self.layer = layer
+        self.n_fields = n_fields
+        self.extra_attributes = extra_attributes
+        self.pending = []
+        self.vertex_count = 0
+        self.timer = QTimer(self)
+        self.timer.setInterval(refresh_interval)
+        self.timer.timeout.connect(self.flush)
+
+    def start(self):
+        self.timer.start()
+
+    def add_rows(self, rows):
+        self.pending.extend(rows)
+
+    def flush(self):
+        if not self.pending:
+            return
+        rows, self.pending = self.pending, []
+        features = vertex_features(rows, self.n_fields, self.extra_attributes)
+        self.layer.dataProvider().addFeatures(features)
+        self.vertex_count += len(features)
+        self.layer.updateExtents()
+        self.layer.triggerRepaint()
+
+    def finish(self):
+        self.timer.stop()
+        self.flush()
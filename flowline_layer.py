@@ -0,0 +1,96 @@
+from qgis.PyQt.QtCore import QVariant
+from qgis.core import QgsFeature, QgsField, QgsGeometry, QgsPointXY, QgsProject, QgsVectorLayer
+
+LAYER_KEY_PROPERTY = "grd2stream/layer_key"
+LAST_RUN_PROPERTY = "grd2stream/last_run_id"
+
+RUN_FIELDS = [
+    ("run_id", "integer"),
+    ("seed_id", "integer"),
+    ("backward", "integer"),
+    ("step_size", "double"),
+    ("max_steps", "integer"),
+    ("max_time", "double"),
+    ("merged_into", "integer"),
+    ("merge_vertex", "integer"),
+    ("bidirectional", "integer"),
+    ("accepted_steps", "integer"),
+    ("rejected_steps", "integer"),
+]
+
+
+def create_point_layer(name, fields):
+    """Creates a memory point layer in the project CRS with the given (name, type) fields."""
+    uri_fields = "&".join(f"field={field_name}:{field_type}" for field_name, field_type in fields)
+    uri = f"point?crs={QgsProject.instance().crs().authid()}&{uri_fields}"
+    layer = QgsVectorLayer(uri, name, "memory")
+    if not layer.isValid():
+        raise RuntimeError("Failed to create flowline layer.")
+    return layer
+
+
+def find_flowline_layer(layer_key):
+    for layer in QgsProject.instance().mapLayers().values():
+        if isinstance(layer, QgsVectorLayer) and layer.customProperty(LAYER_KEY_PROPERTY) == layer_key:
+            return layer
+    return None
+
+
+def flowline_layer(layer_key, name, field_names):
+    """Returns the persistent flowline layer for layer_key, creating and indexing it on first use."""
+    layer = find_flowline_layer(layer_key)
+    if layer is not None:
+        add_missing_fields(layer, RUN_FIELDS)
+        return layer
+    layer = create_point_layer(name, [(field_name, "double") for field_name in field_names] + RUN_FIELDS)
+    layer.dataProvider().createSpatialIndex()
+    layer.setCustomProperty(LAYER_KEY_PROPERTY, layer_key)
+    layer.setCustomProperty(LAST_RUN_PROPERTY, 0)
+    QgsProject.instance().addMapLayer(layer)
+    return layer
+
+
+def add_missing_fields(layer, fields):
+    """Adds (name, type) fields that a layer created by an earlier plugin version does not have yet."""
+    variant_types = {"integer": QVariant.Int, "double": QVariant.Double}
+    missing = [QgsField(name, variant_types[field_type]) for name, field_type in fields
+               if layer.fields().indexOf(name) == -1]
+    if missing:
+        layer.dataProvider().addAttributes(missing)
+        layer.updateFields()
+
+
+def next_run_id(layer):
+    run_id = int(layer.customProperty(LAST_RUN_PROPERTY, 0)) + 1
+    layer.setCustomProperty(LAST_RUN_PROPERTY, run_id)
+    return run_id
+
+
+def streamline_features(streamlines, n_fields, extra_attributes=None, first_seed_id=1):
+    """Builds one point feature per vertex; extra_attributes(seed_id) is appended to each vertex's attributes."""
+    rows = [(seed_id, row) for seed_id, streamline in enumerate(streamlines, first_seed_id) for row in streamline]
+    return vertex_features(rows, n_fields, extra_attributes)
+
+
+def vertex_features(rows, n_fields, extra_attributes=None):
+    """Builds point features from (seed_id, row) pairs; NaN values are stored as NULL."""
+    features = []
+    extra_cache = {}
+    for seed_id, row in rows:
+        if len(row) < n_fields:
+            continue
+        if seed_id not in extra_cache:
+            extra_cache[seed_id] = extra_attributes(seed_id) if extra_attributes else []
+        feature = QgsFeature()
+        feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(row[0], row[1])))
+        feature.setAttributes([None if value != value else value for value in row[:n_fields]] + extra_cache[seed_id])
+        features.append(feature)
+    return features
+
+
+def append_features(layer, features):
+    """Adds all features in a single provider call and refreshes the layer."""
+    if not layer.dataProvider().addFeatures(features)[0]:
+        raise RuntimeError(f"Failed to add features to layer '{layer.name()}'.")
+    layer.updateExtents()
+    layer.triggerRepaint()
@@ -0,0 +1,60 @@
+from qgis.gui import QgsMapToolEmitPoint
+from qgis.PyQt.QtCore import Qt, QTimer
+
+from .flowline_preview import FlowlinePreview
+
+
+class FlowlineTraceTool(QgsMapToolEmitPoint):
+    """Traces a preview flowline under the cursor while it moves; a left click emits canvasClicked to commit it.
+
+    tracer(x, y) returns the flowlines for a seed at (x, y). It runs on the GUI thread, so a trace
+    cannot be cancelled once started; mouse moves are debounced to the latest cursor position and
+    the tracer's time budget (HOVER_TIME_BUDGET) bounds how long each trace blocks the canvas.
+    """
+
+    def __init__(self, canvas, tracer, debounce_interval=10):
+        super().__init__(canvas)
+        self.tracer = tracer
+        self.preview = None
+        self.pending_point = None
+        self.last_error = None
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(debounce_interval)
+        self.timer.timeout.connect(self.update_preview)
+
+    def canvasMoveEvent(self, event):
+        self.pending_point = self.toMapCoordinates(event.pos())
+        self.timer.start()
+
+    def update_preview(self):
+        point, self.pending_point = self.pending_point, None
+        if point is None:
+            return
+        try:
+            streamlines = self.tracer(point.x(), point.y())
+        except Exception as e:
+            # report each kind of failure once instead of on every mouse move, e.g. while over NoData
+            if str(e) != self.last_error:
+                print(f"Preview failed: {e}")
+                self.last_error = str(e)
+            return
+        self.last_error = None
+        if self.preview is None:
+            self.preview = FlowlinePreview(self.canvas())
+        self.preview.show(streamlines)
+
+    def canvasReleaseEvent(self, event):
+        if event.button() == Qt.RightButton:
+            self.canvas().unsetMapTool(self)
+            return
+        self.timer.stop()
+        super().canvasReleaseEvent(event)
+
+    def deactivate(self):
+        self.timer.stop()
+        self.pending_point = None
+        if self.preview:
+            self.preview.clear()
+            self.preview = None
+        super().deactivate()
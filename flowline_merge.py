@@ -0,0 +1,49 @@
+import numpy as np
+
+from .flowline_engine import default_step_size, trace_flowlines
+from .spatial_hash import OccupancyGrid, SpatialHash
+
+
+def trace_with_merging(grid, seeds, tolerance, step_size=None, max_steps=None, max_time=None, backward=False):
+    """Traces all seeds at once, ending each flowline where it comes within tolerance of another one.
+
+    The positions of all flowlines are indexed while they are integrated. When two flowlines meet,
+    the one that arrives later (or, at the same time, the one with the higher index) stops, so the
+    shared tail is traced and stored once. Merges never form a cycle, so following them from any
+    flowline ends at one that was traced to its end. Returns one (n, 6) array per seed and, per seed, the
+    (flowline index, vertex index) it merged into or None.
+    """
+    if tolerance <= 0:
+        raise ValueError("The merge tolerance must be positive.")
+    step_size = step_size or default_step_size(grid)
+    traced = SpatialHash(tolerance)
+    occupancy = OccupancyGrid((grid.xmin, grid.ymin, grid.xmax, grid.ymax), tolerance)
+    merges = [None] * len(np.asarray(seeds, dtype=float).reshape(-1, 2))
+
+    def leads_to(target, seed_id):
+        """True if flowline target ends in seed_id when following its merges."""
+        while target is not None:
+            if target == seed_id:
+                return True
+            merge = merges[target]
+            target = merge[0] if merge else None
+        return False
+
+    def stop(step, ids, x, y, dist):
+        points = np.column_stack((x, y))
+        ended = np.zeros(len(ids), dtype=bool)
+        for k in np.flatnonzero(occupancy.test(points))[::-1]:
+            seed_id = ids[k]
+            hit = traced.find(x[k], y[k], tolerance, lambda value: not leads_to(value[0], seed_id))
+            if hit:
+                ended[k] = True
+                merges[seed_id] = hit[2]
+        kept = ~ended
+        traced.insert_many(points[kept], [(int(seed_id), step) for seed_id in ids[kept]])
+        occupancy.add(points[kept])
+        return ended
+
+    stop_interval = max(int(tolerance / (2.0 * step_size)), 1)
+    streamlines = trace_flowlines(grid, seeds, step_size, max_steps, max_time, backward,
+                                  stop=stop, stop_interval=stop_interval)
+    return streamlines, merges
@@ -3,15 +3,90 @@ import platform
 import subprocess
 import tempfile
 
+import numpy as np
 from qgis.PyQt.QtGui import QIcon
-from qgis._core import QgsFeature, QgsGeometry, QgsPointXY
-from qgis.core import QgsVectorLayer, QgsProject, Qgis, QgsRasterLayer
-from qgis.gui import QgsMapToolEmitPoint
-from qgis.PyQt.QtWidgets import (QApplication, QCheckBox, QDialog, QFormLayout, QGroupBox, QHBoxLayout, QLabel, QLineEdit,
-                             QMessageBox, QProgressDialog, QPushButton, QRadioButton, QVBoxLayout)
+from qgis.core import QgsApplication, QgsProject, Qgis, QgsSettings
+from qgis.PyQt.QtWidgets import (QApplication, QCheckBox, QDialog, QFormLayout, QGroupBox, QHBoxLayout, QInputDialog,
+                             QLabel, QLineEdit, QMessageBox, QProgressDialog, QPushButton, QRadioButton, QVBoxLayout)
 from qgis.PyQt.QtCore import Qt
 
 from .dialog_preset import PresetManager, SavePresetDialog
+from .disk_grid_cache import DEFAULT_DISK_BUDGET, DiskGridCache
+from .grid_cache import GridCache
+from .flowline_job import Grd2StreamJob, ProgressiveLayerWriter
+from .evenly_spaced import evenly_spaced_flowlines
+from .flowline_attributes import add_derived_attributes, derived_field_names
+from .flowline_backends import EngineSelector, Grd2streamEngine, GridPair, JitEngine, NumpyEngine
+from .flowline_engine import join_halves, trace_flowlines_adaptive
+from .flowline_export import crs_projjson, export_flowlines
+from .flowline_jit import trace_bidirectional_jit, trace_flowlines_jit
+from .flowline_layer import append_features, create_point_layer, flowline_layer, next_run_id, streamline_features
+from .flowline_map_tool import FlowlineTraceTool
+from .flowline_merge import trace_with_merging
+from .flowline_preview import FlowlinePreview, preview_parameters
+from .flowline_simplify import simplify_streamlines
+from .grid_validation import seeds_in_domain, validate_grid_pair
+from .layer_index import ProjectLayerIndex
+from .raster_sampling import add_sampled_columns
+from .seed_order import restore_order, spatial_order
+from .shared_grids import PARALLEL_MIN_SEEDS, trace_parallel, worker_count
+
+HOVER_TIME_BUDGET = 0.025
+
+
+def split_streamlines(output):
+    """Splits grd2stream output into one list of numeric rows per streamline."""
+    streamlines = []
+    current = []
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith(">"):
+            if current:
+                streamlines.append(current)
+            current = []
+            continue
+        if not line or line.startswith("#"):
+            continue
+        current.append(list(map(float, line.split())))
+    if current:
+        streamlines.append(current)
+    return streamlines
+
+
+def join_streamlines(streamlines):
+    """Formats streamlines back into grd2stream's multi-segment output."""
+    lines = []
+    for streamline in streamlines:
+        lines.append(">")
+        lines.extend(" ".join(repr(value) for value in row) for row in streamline)
+    return "\n".join(lines) + "\n"
+
+
+def write_seed_file(seeds):
+    """Writes seed points to a temporary file in grd2stream's "x y" format and returns its path."""
+    with tempfile.NamedTemporaryFile(delete=False, mode='w', suffix=".txt") as temp_file:
+        np.savetxt(temp_file, np.asarray(seeds, dtype=float).reshape(-1, 2), fmt="%.17g")
+        return temp_file.name
+
+
+def restore_output_order(output, order):
+    """Reorders grd2stream output for seeds written in spatial_order() back to the original seed order."""
+    if np.array_equal(order, np.arange(len(order))):
+        return output
+    streamlines = split_streamlines(output)
+    if len(streamlines) != len(order):
+        print(f"Expected {len(order)} flowlines but got {len(streamlines)}, keeping grd2stream's order.")
+        return output
+    return join_streamlines(restore_order(streamlines, order))
+
+
+def leaves_window(vertex, window_bounds, grid_bounds, tolerance):
+    """True if a flowline ending at vertex stopped at a window edge that is not an edge of the full grid."""
+    x, y = vertex[0], vertex[1]
+    for value, window_edge, grid_edge in zip((x, y, x, y), window_bounds, grid_bounds):
+        if abs(value - window_edge) <= tolerance and abs(window_edge - grid_edge) > tolerance:
+            return True
+    return False
 
 
 class CoordinateInputDialog(QDialog):
@@ -63,18 +138,50 @@ class FlowlineModule:
         self.coordinate = None
         self.map_tool = None
         self.backward_steps = False
+        self.bidirectional = False
         self.step_size = None
         self.max_integration_time = None
         self.max_steps = None
         self.output_format = None
+        self.aoi_mode = None
+        self.append_mode = True
+        self.preview_mode = False
+        self.merge_tolerance = None
+        self.adaptive_mode = False
+        self.adaptive_options = {}
+        self.simplify_tolerance = None
+        self.simplify_method = "douglas-peucker"
+        self.derived_attributes = False
+        self.sample_rasters = []
+        self.export_path = None
+        self.export_only = False
+        self.compact_grids = False
         self.system = platform.system()
         self.miniconda_path = os.path.expanduser("~/miniconda3")
         self.conda_path = os.path.join(self.miniconda_path, "bin", "conda")
         if self.system in ["Linux", "Darwin"]:
             self.configure_environment()
-        self.preset_manager = PresetManager(os.path.dirname(os.path.dirname(__file__)))
+        self.preset_manager = PresetManager(QgsApplication.qgisSettingsDirPath(), os.path.dirname(os.path.dirname(__file__)))
         self.last_used_preset = None
         self.last_executed_command = None
+        self.grid_cache = GridCache(disk_cache=DiskGridCache(
+            os.path.join(QgsApplication.qgisSettingsDirPath(), "grd2stream", "grid_cache"),
+            QgsSettings().value("grd2stream/disk_cache_budget_mb", DEFAULT_DISK_BUDGET >> 20, type=int) << 20
+        ))
+        self.engine_selector = EngineSelector(
+            [Grd2streamEngine(self.grd2stream_executable(), self.grd2stream_rows), JitEngine(), NumpyEngine()],
+            QgsSettings()
+        )
+        self.layer_index = ProjectLayerIndex()
+        self.active_jobs = []
+        self.refresh_interval = 250
+
+    def unload(self):
+        for job, writer in list(self.active_jobs):
+            job.cancel()
+        self.grid_cache.clear()
+        self.preset_manager.close()
+        self.layer_index.disconnect()
 
     def show_download_popup(self, message="Downloading..."):
         self.progress_dialog = QProgressDialog(message, None, 0, 0, self.iface.mainWindow())
@@ -109,10 +216,24 @@ class FlowlineModule:
             'band_1': self.selected_band_1,
             'band_2': self.selected_band_2,
             'backward_steps': self.backward_steps,
+            'bidirectional': self.bidirectional,
             'step_size': self.step_size,
             'max_integration_time': self.max_integration_time,
             'max_steps': self.max_steps,
-            'output_format': self.output_format
+            'output_format': self.output_format,
+            'aoi_mode': self.aoi_mode,
+            'append_mode': self.append_mode,
+            'preview_mode': self.preview_mode,
+            'merge_tolerance': self.merge_tolerance,
+            'adaptive_mode': self.adaptive_mode,
+            'adaptive_options': self.adaptive_options,
+            'simplify_tolerance': self.simplify_tolerance,
+            'simplify_method': self.simplify_method,
+            'derived_attributes': self.derived_attributes,
+            'sample_rasters': self.sample_rasters,
+            'export_path': self.export_path,
+            'export_only': self.export_only,
+            'compact_grids': self.compact_grids
         }
         dialog = SavePresetDialog(self.preset_manager, preset_data)
         dialog.exec_()
@@ -125,8 +246,12 @@ class FlowlineModule:
         try:
             raster_1_source = preset_data.get('raster_1_source')
             raster_2_source = preset_data.get('raster_2_source')
-            self.selected_raster_1 = QgsRasterLayer(raster_1_source, preset_data.get('raster_1_name'))
-            self.selected_raster_2 = QgsRasterLayer(raster_2_source, preset_data.get('raster_2_name'))
+            self.selected_raster_1 = self.layer_index.resolve(
+                raster_1_source, preset_data.get('raster_1_name'), preset_data.get('band_1', 1)
+            )
+            self.selected_raster_2 = self.layer_index.resolve(
+                raster_2_source, preset_data.get('raster_2_name'), preset_data.get('band_2', 1)
+            )
             if not self.selected_raster_1.isValid() or not self.selected_raster_2.isValid():
                 QMessageBox.warning(
                     None,
@@ -137,76 +262,26 @@ class FlowlineModule:
             self.selected_band_1 = preset_data.get('band_1', 1)
             self.selected_band_2 = preset_data.get('band_2', 1)
             self.backward_steps = preset_data.get('backward_steps', False)
+            self.bidirectional = preset_data.get('bidirectional', False)
             self.step_size = preset_data.get('step_size')
             self.max_integration_time = preset_data.get('max_integration_time')
             self.max_steps = preset_data.get('max_steps')
             self.output_format = preset_data.get('output_format')
+            self.aoi_mode = preset_data.get('aoi_mode')
+            self.append_mode = preset_data.get('append_mode', True)
+            self.preview_mode = preset_data.get('preview_mode', False)
+            self.merge_tolerance = preset_data.get('merge_tolerance')
+            self.adaptive_mode = preset_data.get('adaptive_mode', False)
+            self.adaptive_options = preset_data.get('adaptive_options') or {}
+            self.simplify_tolerance = preset_data.get('simplify_tolerance')
+            self.simplify_method = preset_data.get('simplify_method', "douglas-peucker")
+            self.derived_attributes = preset_data.get('derived_attributes', False)
+            self.sample_rasters = preset_data.get('sample_rasters') or []
+            self.export_path = preset_data.get('export_path')
+            self.export_only = preset_data.get('export_only', False)
+            self.compact_grids = preset_data.get('compact_grids', False)
             self.last_used_preset = preset_name
 
-            if self.system == "Windows":
-                raster_path_1 = self.selected_raster_1.source()
-                raster_path_2 = self.selected_raster_2.source()
-
-                for prefix in ["NETCDF:", "HDF5:", "GRIB:"]:
-                    if raster_path_1.startswith(prefix):
-                        raster_path_1 = raster_path_1[len(prefix):].strip()
-                    if raster_path_2.startswith(prefix):
-                        raster_path_2 = raster_path_2[len(prefix):].strip()
-
-                if ":" in raster_path_1:
-                    file_path, variable = raster_path_1.rsplit(":", 1)
-                    raster_path_1 = f"{file_path}?{variable}"
-                if ":" in raster_path_2:
-                    file_path, variable = raster_path_2.rsplit(":", 1)
-                    raster_path_2 = f"{file_path}?{variable}"
-
-                cmd = f'grd2stream "{raster_path_1}" "{raster_path_2}"'
-                if self.backward_steps:
-                    cmd += " -b"
-                if self.step_size:
-                    cmd += f" -d {self.step_size}"
-                if self.max_integration_time:
-                    cmd += f" -T {self.max_integration_time}"
-                if self.max_steps:
-                    cmd += f" -n {self.max_steps}"
-                if self.output_format:
-                    cmd += f" {self.output_format}"
-                cmd += ' -f "<seed_file_path>"'
-            else:
-                gmt6_env_path = os.path.join(self.miniconda_path, "envs", "GMT6")
-                grd2stream_path = os.path.join(gmt6_env_path, "bin", "grd2stream")
-                raster_path_1 = self.selected_raster_1.source()
-                raster_path_2 = self.selected_raster_2.source()
-
-                for prefix in ["NETCDF:", "HDF5:", "GRIB:"]:
-                    if raster_path_1.startswith(prefix):
-                        raster_path_1 = raster_path_1[len(prefix):].strip()
-                    if raster_path_2.startswith(prefix):
-                        raster_path_2 = raster_path_2[len(prefix):].strip()
-
-                if ":" in raster_path_1:
-                    file_path, variable = raster_path_1.rsplit(":", 1)
-                    raster_path_1 = f"{file_path}?{variable}"
-                if ":" in raster_path_2:
-                    file_path, variable = raster_path_2.rsplit(":", 1)
-                    raster_path_2 = f"{file_path}?{variable}"
-
-                cmd = f'"{self.conda_path}" run -n GMT6 "{grd2stream_path}" "{raster_path_1}" "{raster_path_2}"'
-                if self.backward_steps:
-                    cmd += " -b"
-                if self.step_size:
-                    cmd += f" -d {self.step_size}"
-                if self.max_integration_time:
-                    cmd += f" -T {self.max_integration_time}"
-                if self.max_steps:
-                    cmd += f" -n {self.max_steps}"
-                if self.output_format:
-                    cmd += f" {self.output_format}"
-                cmd += ' -f "<seed_file_path>"'
-
-            self.preset_command_template = cmd
-            print(f"Preset Command Template: {cmd}")
-
             self.iface.messageBar().pushMessage(
                 "Success",
                 f"Preset '{preset_name}' loaded successfully. Choose how to select a coordinate.",
@@ -420,10 +495,24 @@ class FlowlineModule:
             self.selected_band_2 = getattr(dialog, "selected_band_2", 1)
 
             self.backward_steps = dialog.backward_steps
+            self.bidirectional = dialog.bidirectional
             self.step_size = dialog.step_size
             self.max_integration_time = dialog.max_integration_time
             self.max_steps = dialog.max_steps
             self.output_format = dialog.output_format
+            self.aoi_mode = dialog.aoi_mode
+            self.append_mode = dialog.append_mode
+            self.preview_mode = dialog.preview_mode
+            self.merge_tolerance = dialog.merge_tolerance
+            self.adaptive_mode = dialog.adaptive_mode
+            self.adaptive_options = dialog.adaptive_options
+            self.simplify_tolerance = dialog.simplify_tolerance
+            self.simplify_method = dialog.simplify_method
+            self.derived_attributes = dialog.derived_attributes
+            self.sample_rasters = dialog.sample_rasters
+            self.export_path = dialog.export_path
+            self.export_only = dialog.export_only
+            self.compact_grids = dialog.compact_grids
 
             self.last_used_preset = None
 
@@ -438,15 +527,31 @@ class FlowlineModule:
     def use_last_settings(self):
         if self.selected_raster_1 and self.selected_raster_2:
             preset_data = {
+                'raster_1_source': self.selected_raster_1.source(),
                 'raster_1_name': self.selected_raster_1.name(),
+                'raster_2_source': self.selected_raster_2.source(),
                 'raster_2_name': self.selected_raster_2.name(),
                 'band_1': self.selected_band_1,
                 'band_2': self.selected_band_2,
                 'backward_steps': self.backward_steps,
+                'bidirectional': self.bidirectional,
                 'step_size': self.step_size,
                 'max_steps': self.max_steps,
                 'max_integration_time': self.max_integration_time,
-                'output_format': self.output_format
+                'output_format': self.output_format,
+                'aoi_mode': self.aoi_mode,
+                'append_mode': self.append_mode,
+                'preview_mode': self.preview_mode,
+                'merge_tolerance': self.merge_tolerance,
+                'adaptive_mode': self.adaptive_mode,
+                'adaptive_options': self.adaptive_options,
+                'simplify_tolerance': self.simplify_tolerance,
+                'simplify_method': self.simplify_method,
+                'derived_attributes': self.derived_attributes,
+                'sample_rasters': self.sample_rasters,
+                'export_path': self.export_path,
+                'export_only': self.export_only,
+                'compact_grids': self.compact_grids
             }
             return preset_data
         else:
@@ -464,8 +569,12 @@ class FlowlineModule:
         map_radio = QRadioButton("Click on the map")
         map_radio.setChecked(True)  # Default
         manual_radio = QRadioButton("Enter coordinates manually")
+        generator_radio = QRadioButton("Generate seeds from a line or polygon layer")
+        evenly_spaced_radio = QRadioButton("Evenly spaced flowlines over the whole grid")
         method_layout.addWidget(map_radio)
         method_layout.addWidget(manual_radio)
+        method_layout.addWidget(generator_radio)
+        method_layout.addWidget(evenly_spaced_radio)
         layout.addWidget(method_group)
         button_layout = QHBoxLayout()
         ok_button = QPushButton("OK")
@@ -478,8 +587,12 @@ class FlowlineModule:
         if dialog.exec_() == QDialog.Accepted:
             if map_radio.isChecked():
                 self.prompt_for_coordinate()
-            else:
+            elif manual_radio.isChecked():
                 self.prompt_for_manual_coordinate()
+            elif generator_radio.isChecked():
+                self.prompt_for_seed_generation()
+            else:
+                self.prompt_for_separation()
 
     def prompt_for_coordinate(self):
         if self.map_tool:
@@ -487,12 +600,12 @@ class FlowlineModule:
                 self.map_tool.canvasClicked.disconnect(self.coordinate_selected)
             except Exception:
                 pass
-        self.map_tool = QgsMapToolEmitPoint(self.iface.mapCanvas())
+        self.map_tool = FlowlineTraceTool(self.iface.mapCanvas(), self.hover_tracer())
         self.map_tool.canvasClicked.connect(self.coordinate_selected)
         self.iface.mapCanvas().setMapTool(self.map_tool)
         self.iface.messageBar().pushMessage(
             "Info",
-            "Click on the map to select a seed point for your flowline.",
+            "Move the cursor to preview flowlines. Click on the map to select a seed point for your flowline.",
             level=Qgis.Info,
             duration=5
         )
@@ -510,6 +623,31 @@ class FlowlineModule:
             )
             self.run_grd2stream(verbose=True)
 
+    def prompt_for_seed_generation(self):
+        from .dialog_seeds import SeedGeneratorDialog
+        dialog = SeedGeneratorDialog(self.iface.mainWindow(), self.selected_raster_1.crs())
+
+        if dialog.exec_() == QDialog.Accepted:
+            self.iface.messageBar().pushMessage(
+                "Info",
+                f"Generated {len(dialog.seeds)} seed points.",
+                level=Qgis.Info,
+                duration=5
+            )
+            self.run_grd2stream(seeds=dialog.seeds)
+
+    def prompt_for_separation(self):
+        metadata = self.grid_cache.metadata(self.selected_raster_1.source(), self.selected_band_1)
+        default_separation = 20 * min(metadata.x_inc, metadata.y_inc)
+        d_sep, ok = QInputDialog.getDouble(
+            self.iface.mainWindow(),
+            "Evenly Spaced Flowlines",
+            "Separation distance between flowlines (in map units of the grids):",
+            default_separation, 0.0, 1e12, 6
+        )
+        if ok and d_sep > 0:
+            self.run_evenly_spaced(d_sep)
+
     def coordinate_selected(self, point):
         self.coordinate = (point.x(), point.y())
         self.iface.mapCanvas().unsetMapTool(self.map_tool)
@@ -522,14 +660,15 @@ class FlowlineModule:
         )
         self.run_grd2stream(verbose=True)
 
-    def run_grd2stream(self, verbose=False):
+    def run_grd2stream(self, verbose=False, seeds=None):
+        """Traces flowlines from the selected coordinate, or from all given seeds in one batch."""
         try:
             if not self.selected_raster_1 or not self.selected_raster_2:
                 raise ValueError("Two raster layers must be selected.")
-            if not self.coordinate:
-                raise ValueError("A coordinate must be selected.")
-
-            x, y = self.coordinate
+            if seeds is None:
+                if not self.coordinate:
+                    raise ValueError("A coordinate must be selected.")
+                seeds = [self.coordinate]
 
             if self.system == "Windows":
                 raster_path_1 = self.selected_raster_1.source()
@@ -561,13 +700,18 @@ class FlowlineModule:
                     cmd += f" {self.output_format}"
 
                 self.last_executed_command = cmd
+                if len(seeds) == 1:
+                    x, y = seeds[0]
+                    seed_description = f"seed point at: x={x}, y={y}"
+                else:
+                    seed_description = f"{len(seeds)} seed points in seed.txt"
                 print(f"Windows Command (not executed): {cmd}")
-                print(f"Seed point coordinates: x={x}, y={y}")
+                print(f"Seed points: {seed_description}")
 
                 QMessageBox.information(
                     None,
                     "Command Information",
-                    f"On Windows, grd2stream command execution is not available.\n\nThe command that would be executed is:\n\n{cmd}\n\nWith seed point at: x={x}, y={y}"
+                    f"On Windows, grd2stream command execution is not available.\n\nThe command that would be executed is:\n\n{cmd}\n\nWith {seed_description}"
                 )
 
                 self.iface.messageBar().pushMessage(
@@ -578,44 +722,255 @@ class FlowlineModule:
                 )
                 return
 
-            with tempfile.NamedTemporaryFile(delete=False, mode='w') as temp_file:
-                seed_file_path = temp_file.name
-                temp_file.write(f"{x} {y}\n")
+            seeds = self.validate_inputs(seeds)
+            preview = self.show_preview(seeds) if self.preview_mode else None
+
+            if self.adaptive_mode:
+                self.run_adaptive(seeds, preview)
+                return
+
+            if self.bidirectional:
+                self.run_bidirectional(seeds, preview)
+                return
+
+            if self.merge_tolerance and len(seeds) > 1:
+                self.run_merged(seeds, preview)
+                return
 
-            raster_path_1 = self.selected_raster_1.source()
-            raster_path_2 = self.selected_raster_2.source()
+            engine = self.select_engine(seeds)
+            if not isinstance(engine, Grd2streamEngine):
+                self.run_engine(engine, seeds, preview)
+                return
 
-            for prefix in ["NETCDF:", "HDF5:", "GRIB:"]:
-                if raster_path_1.startswith(prefix):
-                    raster_path_1 = raster_path_1[len(prefix):].strip()
-                if raster_path_2.startswith(prefix):
-                    raster_path_2 = raster_path_2[len(prefix):].strip()
+            raster_path_1 = self.grid_path(self.selected_raster_1.source())
+            raster_path_2 = self.grid_path(self.selected_raster_2.source())
+            if not self.aoi_mode and self.streams_progressively():
+                self.start_progressive_run(raster_path_1, raster_path_2, seeds, preview)
+                return
 
-            if ":" in raster_path_1:
-                file_path, variable = raster_path_1.rsplit(":", 1)
-                raster_path_1 = f"{file_path}?{variable}"
-            if ":" in raster_path_2:
-                file_path, variable = raster_path_2.rsplit(":", 1)
-                raster_path_2 = f"{file_path}?{variable}"
+            try:
+                if self.aoi_mode:
+                    output = self.run_grd2stream_in_aoi(seeds, verbose)
+                else:
+                    output = self.execute_grd2stream(raster_path_1, raster_path_2, seeds, verbose)
+            finally:
+                if preview:
+                    preview.clear()
+            self.load_streamline_from_output(output)
 
-            if hasattr(self, 'preset_command_template') and self.preset_command_template is not None:
-                cmd = self.preset_command_template.replace('<seed_file_path>', seed_file_path)
+            self.iface.messageBar().pushMessage(
+                "Success",
+                "grd2stream executed. Results loaded as a layer.",
+                level=Qgis.Info,
+                duration=5
+            )
+
+        except Exception as e:
+            print(f"Error in run_grd2stream: {e}")
+            self.iface.messageBar().pushMessage(
+                "Error", f"Unexpected error: {e}", level=Qgis.Critical, duration=5
+            )
+
+    def run_evenly_spaced(self, d_sep):
+        """Places flowlines about d_sep apart over the whole grid with the in-process integrator."""
+        self.show_download_popup("Placing evenly spaced flowlines...")
+        try:
+            self.validate_grids()
+            grid = self.velocity_grid()
+            streamlines = evenly_spaced_flowlines(
+                grid, d_sep, step_size=self.step_size, max_steps=self.max_steps, max_time=self.max_integration_time
+            )
+            streamlines, _ = self.finish_streamlines(streamlines)
+            destination = self.store_streamlines(streamlines)
+            self.iface.messageBar().pushMessage(
+                "Success",
+                f"Placed {len(streamlines)} evenly spaced flowlines in {destination}.",
+                level=Qgis.Info,
+                duration=5
+            )
+        except Exception as e:
+            print(f"Error in run_evenly_spaced: {e}")
+            self.iface.messageBar().pushMessage(
+                "Error", f"Unexpected error: {e}", level=Qgis.Critical, duration=5
+            )
+        finally:
+            self.hide_download_popup()
+
+    def run_adaptive(self, seeds, preview=None):
+        """Traces the seeds with the adaptive RK45 integrator, in both directions if requested."""
+        try:
+            grid = self.velocity_grid()
+            order = spatial_order(seeds)
+            ordered = seeds[order]
+            n_seeds = len(ordered)
+            if self.bidirectional:
+                halves, halves_stats = self.trace_adaptive(
+                    grid, np.concatenate((ordered, ordered)), np.repeat([False, True], n_seeds)
+                )
+                streamlines = [join_halves(halves[n_seeds + i], halves[i]) for i in range(n_seeds)]
+                stats = {key: values[:n_seeds] + values[n_seeds:] for key, values in halves_stats.items()
+                         if key in ("accepted", "rejected")}
+                stats["min_step"] = np.minimum(halves_stats["min_step"][:n_seeds], halves_stats["min_step"][n_seeds:])
+                stats["max_step"] = np.maximum(halves_stats["max_step"][:n_seeds], halves_stats["max_step"][n_seeds:])
             else:
-                gmt6_env_path = os.path.join(self.miniconda_path, "envs", "GMT6")
-                grd2stream_path = os.path.join(gmt6_env_path, "bin", "grd2stream")
+                streamlines, stats = self.trace_adaptive(grid, ordered, self.backward_steps)
+            streamlines, _ = self.finish_streamlines(restore_order(streamlines, order))
+            stats = {key: np.asarray(restore_order(list(values), order)) for key, values in stats.items()}
+        finally:
+            if preview:
+                preview.clear()
+        destination = self.store_streamlines(streamlines, step_stats=stats)
+        used = np.isfinite(stats["min_step"])
+        step_range = (f", step sizes {stats['min_step'][used].min():.6g} to {stats['max_step'][used].max():.6g}"
+                      if used.any() else "")
+        summary = (f"{int(stats['accepted'].sum())} steps accepted, {int(stats['rejected'].sum())} rejected"
+                   f"{step_range}")
+        print(f"Adaptive integration: {summary}")
+        self.iface.messageBar().pushMessage(
+            "Success",
+            f"Traced {len(streamlines)} flowlines into {destination} ({summary}).",
+            level=Qgis.Info,
+            duration=5
+        )
 
-                cmd = f'"{self.conda_path}" run -n GMT6 "{grd2stream_path}" "{raster_path_1}" "{raster_path_2}" -f "{seed_file_path}"'
-                if self.backward_steps:
-                    cmd += " -b"
-                if self.step_size:
-                    cmd += f" -d {self.step_size}"
-                if self.max_integration_time:
-                    cmd += f" -T {self.max_integration_time}"
-                if self.max_steps:
-                    cmd += f" -n {self.max_steps}"
-                if self.output_format:
-                    cmd += f" {self.output_format}"
+    def grid_dtype(self):
+        return np.float32 if self.compact_grids else np.float64
+
+    def velocity_grid(self, factor=1):
+        """The selected velocity pair for the in-process integrator, in the configured precision."""
+        return self.grid_cache.velocity_grid(
+            self.selected_raster_1.source(), self.selected_band_1,
+            self.selected_raster_2.source(), self.selected_band_2, factor, self.grid_dtype()
+        )
 
+    def trace_adaptive(self, grid, seeds, backward):
+        """Runs the adaptive integrator on the seeds, in worker processes for large batches."""
+        kwargs = dict(max_steps=self.max_steps, max_time=self.max_integration_time, backward=backward,
+                      **self.adaptive_options)
+        chunks = self.trace_in_workers("adaptive", seeds, **kwargs)
+        if chunks is None:
+            return trace_flowlines_adaptive(grid, seeds, **kwargs)
+        streamlines = [streamline for chunk_streamlines, _ in chunks for streamline in chunk_streamlines]
+        stats = {key: np.concatenate([chunk_stats[key] for _, chunk_stats in chunks]) for key in chunks[0][1]}
+        return streamlines, stats
+
+    def trace_in_workers(self, tracer, seeds, **kwargs):
+        """Traces a large batch in worker processes that share one copy of the velocity grid.
+
+        Returns the per-chunk results of the tracer, or None if the batch is too small or only one
+        core is available, in which case the caller traces in-process.
+        """
+        if len(seeds) < PARALLEL_MIN_SEEDS or worker_count() < 2:
+            return None
+        handle, _ = self.grid_cache.shared_velocity_grid(
+            self.selected_raster_1.source(), self.selected_band_1,
+            self.selected_raster_2.source(), self.selected_band_2, self.grid_dtype()
+        )
+        print(f"Tracing {len(seeds)} seeds in {worker_count()} worker processes on shared grid {handle.name}")
+        return trace_parallel(self.grid_cache.shared_grids, handle, tracer, seeds, **kwargs)
+
+    def run_bidirectional(self, seeds, preview=None):
+        """Traces each seed upstream and downstream from a single grid load and stores one joined flowline per seed."""
+        try:
+            grid = self.velocity_grid()
+            order = spatial_order(seeds)
+            chunks = self.trace_in_workers(
+                "bidirectional", seeds[order], step_size=self.step_size, max_steps=self.max_steps,
+                max_time=self.max_integration_time
+            )
+            if chunks is not None:
+                streamlines = [streamline for chunk in chunks for streamline in chunk]
+            else:
+                streamlines = trace_bidirectional_jit(
+                    grid, seeds[order], self.step_size, self.max_steps, self.max_integration_time
+                )
+            streamlines, _ = self.finish_streamlines(restore_order(streamlines, order))
+        finally:
+            if preview:
+                preview.clear()
+        destination = self.store_streamlines(streamlines)
+        self.iface.messageBar().pushMessage(
+            "Success",
+            f"Traced {len(streamlines)} flowlines in both directions into {destination}.",
+            level=Qgis.Info,
+            duration=5
+        )
+
+    def run_merged(self, seeds, preview=None):
+        """Traces a batch of seeds with the in-process integrator, storing shared downstream paths once."""
+        try:
+            grid = self.velocity_grid()
+            order = spatial_order(seeds)
+            streamlines, merges = trace_with_merging(
+                grid, seeds[order], self.merge_tolerance, self.step_size, self.max_steps,
+                self.max_integration_time, self.backward_steps
+            )
+            streamlines = restore_order(streamlines, order)
+            merges = restore_order([(int(order[merge[0]]), merge[1]) if merge else None for merge in merges], order)
+            streamlines, merges = self.finish_streamlines(streamlines, merges)
+        finally:
+            if preview:
+                preview.clear()
+        destination = self.store_streamlines(streamlines, merges)
+        merged = sum(merge is not None for merge in merges)
+        self.iface.messageBar().pushMessage(
+            "Success",
+            f"Traced {len(streamlines)} flowlines, {merged} of them merged into others, in {destination}.",
+            level=Qgis.Info,
+            duration=5
+        )
+
+    def grid_path(self, raster_path):
+        for prefix in ["NETCDF:", "HDF5:", "GRIB:"]:
+            if raster_path.startswith(prefix):
+                raster_path = raster_path[len(prefix):].strip()
+        if ":" in raster_path:
+            file_path, variable = raster_path.rsplit(":", 1)
+            raster_path = f"{file_path}?{variable}"
+        return raster_path
+
+    def grd2stream_executable(self):
+        return os.path.join(self.miniconda_path, "envs", "GMT6", "bin", "grd2stream")
+
+    def trace_parameters(self):
+        """The integration parameters of the current settings, in the form tracing engines take them."""
+        return {
+            'step_size': self.step_size,
+            'max_steps': self.max_steps,
+            'max_time': self.max_integration_time,
+            'backward': self.backward_steps,
+        }
+
+    def grd2stream_command(self, raster_path_1, raster_path_2, seed_file_path, params=None, all_columns=False):
+        """grd2stream command line for the current settings, or for params with all output columns (-t)."""
+        params = params or self.trace_parameters()
+        cmd = f'"{self.conda_path}" run -n GMT6 "{self.grd2stream_executable()}" "{raster_path_1}" "{raster_path_2}" -f "{seed_file_path}"'
+        if params['backward']:
+            cmd += " -b"
+        if params['step_size']:
+            cmd += f" -d {params['step_size']}"
+        if params['max_time']:
+            cmd += f" -T {params['max_time']}"
+        if params['max_steps']:
+            cmd += f" -n {params['max_steps']}"
+        if all_columns:
+            cmd += " -t"
+        elif self.output_format:
+            cmd += f" {self.output_format}"
+        return cmd
+
+    def execute_grd2stream(self, raster_path_1, raster_path_2, seeds, verbose=False, params=None, all_columns=False):
+        """Runs grd2stream for the given seed points and returns its raw output, in the order of the seeds.
+
+        The seeds are passed to grd2stream along a Hilbert curve, so consecutive flowlines read nearby
+        parts of the grids.
+        """
+        seeds = np.asarray(seeds, dtype=float).reshape(-1, 2)
+        order = spatial_order(seeds)
+        seed_file_path = write_seed_file(seeds[order])
+
+        try:
+            cmd = self.grd2stream_command(raster_path_1, raster_path_2, seed_file_path, params, all_columns)
             self.last_executed_command = cmd
             print(f"Executing Command: {cmd}")
 
@@ -635,26 +990,252 @@ class FlowlineModule:
             if verbose or result.returncode == 0:
                 print("Raw Output:\n", result.stdout)
 
-            self.load_streamline_from_output(result.stdout)
+            return restore_output_order(result.stdout, order)
+        finally:
+            try:
+                os.unlink(seed_file_path)
+            except Exception as e:
+                print(f"Error during cleanup: {e}")
+
+    def grd2stream_rows(self, paths, seeds, params):
+        """Runs grd2stream on two grid files for the Grd2streamEngine; returns the rows of each flowline."""
+        return split_streamlines(self.execute_grd2stream(paths[0], paths[1], seeds, params=params, all_columns=True))
+
+    def grid_pair(self):
+        source_1 = self.selected_raster_1.source()
+        source_2 = self.selected_raster_2.source()
+        return GridPair(self.velocity_grid, lambda: (self.grid_path(source_1), self.grid_path(source_2)))
+
+    def select_engine(self, seeds):
+        """The fastest available tracing engine for this many seeds; the engines are benchmarked once on first use.
+
+        Engines that cannot apply the area of interest or progressive display, when these are in
+        use, are only chosen if no engine can, and in-process engines are charged for decoding
+        the grids unless they are already cached.
+        """
+        if not self.engine_selector.calibrated():
+            self.show_download_popup("Benchmarking tracing engines...")
+            try:
+                self.engine_selector.calibrate()
+            finally:
+                self.hide_download_popup()
+        required = self.required_capabilities()
+        grid_bytes = self.grid_cache.velocity_grid_decode_bytes(
+            self.selected_raster_1.source(), self.selected_band_1,
+            self.selected_raster_2.source(), self.selected_band_2, dtype=self.grid_dtype()
+        )
+        engine = self.engine_selector.select(len(seeds), self.max_steps, required, grid_bytes)
+        print(f"Tracing {len(seeds)} seed(s) with the '{engine.name}' engine "
+              f"(requires {', '.join(required) or 'nothing'}, {grid_bytes >> 20} MiB of grids to decode)")
+        return engine
+
+    def required_capabilities(self):
+        """Engine capabilities the current settings need: area_of_interest or progressive."""
+        if self.aoi_mode:
+            return ["area_of_interest"]
+        if self.streams_progressively():
+            return ["progressive"]
+        return []
+
+    def run_engine(self, engine, seeds, preview=None):
+        """Traces the seeds with an in-process engine and stores the flowlines as a grd2stream run would.
+
+        An in-process engine only runs with an area of interest or progressive display if no
+        engine supporting them is available; they are then reported as not applied.
+        """
+        labels = {"area_of_interest": "area of interest", "progressive": "progressive display"}
+        not_applied = [labels[name] for name in self.required_capabilities() if not engine.capabilities()[name]]
+        try:
+            order = spatial_order(seeds)
+            streamlines = engine.trace(self.grid_pair(), seeds[order], self.trace_parameters())
+            streamlines, _ = self.finish_streamlines(restore_order(streamlines, order))
+        finally:
+            if preview:
+                preview.clear()
+        destination = self.store_streamlines(streamlines)
+        note = (f" The grd2stream binary is not available, so {' and '.join(not_applied)} "
+                f"could not be used." if not_applied else "")
+        if not_applied:
+            print(f"Not applied with the '{engine.name}' engine: {', '.join(not_applied)}")
+        self.iface.messageBar().pushMessage(
+            "Success",
+            f"Traced {len(streamlines)} flowlines with the {engine.name} engine into {destination}.{note}",
+            level=Qgis.Info,
+            duration=10 if not_applied else 5
+        )
 
+    def validate_grids(self):
+        """Checks that both velocity bands (and any sampled rasters) can be combined; returns the first band's metadata."""
+        metadata_1 = self.grid_cache.metadata(self.selected_raster_1.source(), self.selected_band_1)
+        metadata_2 = self.grid_cache.metadata(self.selected_raster_2.source(), self.selected_band_2)
+        problems = validate_grid_pair(metadata_1, metadata_2)
+        if problems:
+            raise ValueError(f"Incompatible grids: {'; '.join(problems)}.")
+        for raster in self.sample_rasters:
+            if not self.grid_cache.metadata(raster['source'], raster['band']).same_crs(metadata_1):
+                raise ValueError(f"Sampled raster '{raster['name']}' is not in the CRS of the velocity grids.")
+        return metadata_1
+
+    def validate_inputs(self, seeds):
+        """Checks the grid pair and drops seeds outside the grid before grd2stream is launched."""
+        metadata_1 = self.validate_grids()
+
+        seeds = np.asarray(seeds, dtype=float).reshape(-1, 2)
+        inside = seeds_in_domain(seeds, metadata_1)
+        if not inside.any():
+            xmin, ymin, xmax, ymax = metadata_1.extent
+            raise ValueError(
+                f"No seed point lies within the grid (xmin={xmin:.3f}, xmax={xmax:.3f}, ymin={ymin:.3f}, ymax={ymax:.3f})."
+            )
+        if not inside.all():
             self.iface.messageBar().pushMessage(
-                "Success",
-                "grd2stream executed. Results loaded as a layer.",
-                level=Qgis.Info,
+                "Warning",
+                f"Skipped {int((~inside).sum())} seed point(s) outside the grid.",
+                level=Qgis.Warning,
                 duration=5
             )
-
-        except Exception as e:
-            print(f"Error in run_grd2stream: {e}")
-            self.iface.messageBar().pushMessage(
-                "Error", f"Unexpected error: {e}", level=Qgis.Critical, duration=5
+        return seeds[inside]
+
+    def preview_grid(self):
+        """Returns the cached decimated grid pair with the step size and step count scaled to it."""
+        source_1 = self.selected_raster_1.source()
+        factor = self.grid_cache.preview_factor(source_1)
+        grid = self.velocity_grid(factor)
+        step_size, max_steps = preview_parameters(grid, factor, self.step_size, self.max_steps)
+        return grid, step_size, max_steps
+
+    def show_preview(self, seeds):
+        """Traces the seeds on a decimated copy of both grids and draws the result until the full run replaces it."""
+        try:
+            grid, step_size, max_steps = self.preview_grid()
+            preview = FlowlinePreview(self.iface.mapCanvas())
+            preview.trace(
+                grid, seeds, step_size, max_steps, self.max_integration_time, self.backward_steps, self.bidirectional
             )
-        finally:
-            if self.system != "Windows" and 'seed_file_path' in locals() and seed_file_path:
+        except Exception as e:
+            print(f"Preview failed: {e}")
+            return None
+        QApplication.processEvents()
+        return preview
+
+    def hover_tracer(self):
+        """Returns a function tracing a single seed on the preview grid within HOVER_TIME_BUDGET.
+
+        The preview grid is read on the first call, i.e. the first mouse move over the canvas, so
+        opening the map tool never waits for it; a grid that cannot be read fails every later call.
+        """
+        loaded = []
+        max_time = self.max_integration_time
+        backward = self.backward_steps
+        bidirectional = self.bidirectional
+
+        def trace(x, y):
+            if not loaded:
                 try:
-                    os.unlink(seed_file_path)
+                    loaded.append(self.preview_grid())
                 except Exception as e:
-                    print(f"Error during cleanup: {e}")
+                    loaded.append(RuntimeError(f"Hover preview unavailable: {e}"))
+            if isinstance(loaded[0], Exception):
+                raise loaded[0]
+            grid, step_size, max_steps = loaded[0]
+            if bidirectional:
+                return trace_bidirectional_jit(
+                    grid, [(x, y)], step_size, max_steps, max_time, time_budget=HOVER_TIME_BUDGET
+                )
+            return trace_flowlines_jit(
+                grid, [(x, y)], step_size, max_steps, max_time, backward, time_budget=HOVER_TIME_BUDGET
+            )
+
+        return trace
+
+    def start_progressive_run(self, raster_path_1, raster_path_2, seeds, preview=None):
+        """Runs grd2stream in the background and appends flowline vertices to the layer while it is running."""
+        order = spatial_order(seeds)
+        seed_ids = order + 1
+        seed_file_path = write_seed_file(seeds[order])
+
+        cmd = self.grd2stream_command(raster_path_1, raster_path_2, seed_file_path)
+        self.last_executed_command = cmd
+        field_names = self.output_field_names()
+        layer, extra_attributes = self.target_layer(field_names)
+        writer = ProgressiveLayerWriter(layer, len(field_names), extra_attributes, self.refresh_interval)
+        job = Grd2StreamJob(cmd, seed_file_path)
+        job.rows_ready.connect(
+            lambda rows: writer.add_rows([(int(seed_ids[min(seed_id, len(seed_ids)) - 1]), row) for seed_id, row in rows])
+        )
+
+        def job_finished(success, error):
+            writer.finish()
+            if preview:
+                preview.clear()
+            self.active_jobs.remove((job, writer))
+            if success:
+                self.iface.messageBar().pushMessage(
+                    "Success",
+                    f"grd2stream executed. {writer.vertex_count} vertices loaded into layer '{layer.name()}'.",
+                    level=Qgis.Info,
+                    duration=5
+                )
+            else:
+                self.iface.messageBar().pushMessage(
+                    "Error", f"Command failed: {error}", level=Qgis.Critical, duration=5
+                )
+
+        job.finished.connect(job_finished)
+        self.active_jobs.append((job, writer))
+        writer.start()
+        job.start()
+
+    def area_of_interest(self, seeds):
+        """Returns the extent (xmin, ymin, xmax, ymax) around the seeds that a flowline can reach."""
+        xs = [x for x, _ in seeds]
+        ys = [y for _, y in seeds]
+        if self.aoi_mode == "canvas":
+            extent = self.iface.mapCanvas().extent()
+            return (min(extent.xMinimum(), min(xs)), min(extent.yMinimum(), min(ys)),
+                    max(extent.xMaximum(), max(xs)), max(extent.yMaximum(), max(ys)))
+        step_size = self.step_size or self.grid_cache.default_step_size(self.selected_raster_1.source())
+        margin = (self.max_steps or 10000) * step_size
+        return min(xs) - margin, min(ys) - margin, max(xs) + margin, max(ys) + margin
+
+    def run_grd2stream_in_aoi(self, seeds, verbose=False):
+        """Runs grd2stream on cached subgrids around the seeds, re-running flowlines that leave the subgrid."""
+        source_1 = self.selected_raster_1.source()
+        source_2 = self.selected_raster_2.source()
+        full_path_1 = self.grid_path(source_1)
+        full_path_2 = self.grid_path(source_2)
+
+        geotransform_1, x_size_1, y_size_1 = self.grid_cache.grid_info(source_1)
+        geotransform_2, x_size_2, y_size_2 = self.grid_cache.grid_info(source_2)
+        window = self.grid_cache.window_for_extent(source_1, *self.area_of_interest(seeds))
+        if window is None or (geotransform_1, x_size_1, y_size_1) != (geotransform_2, x_size_2, y_size_2):
+            return self.execute_grd2stream(full_path_1, full_path_2, seeds, verbose)
+
+        subgrid_1 = self.grid_cache.subgrid(source_1, self.selected_band_1, window)
+        subgrid_2 = self.grid_cache.subgrid(source_2, self.selected_band_2, window)
+        print(f"Area of interest: pixel window {window} of {x_size_1}x{y_size_1}")
+        output = self.execute_grd2stream(subgrid_1, subgrid_2, seeds, verbose)
+
+        window_bounds = self.grid_cache.window_bounds(source_1, window)
+        grid_bounds = self.grid_cache.window_bounds(source_1, None)
+        tolerance = 2 * (self.step_size or self.grid_cache.default_step_size(source_1))
+        streamlines = split_streamlines(output)
+        exited = [i for i, streamline in enumerate(streamlines)
+                  if leaves_window(streamline[-1], window_bounds, grid_bounds, tolerance)]
+
+        if not exited:
+            return output
+        print(f"{len(exited)} flowline(s) left the area of interest, re-running on the full grids.")
+        exited_seeds = [tuple(streamlines[i][0][:2]) for i in exited]
+        full_output = self.execute_grd2stream(full_path_1, full_path_2, exited_seeds, verbose)
+        rerun = split_streamlines(full_output)
+        if len(rerun) != len(exited):
+            print(f"Expected {len(exited)} re-run flowlines but got {len(rerun)}, keeping the area-of-interest results.")
+            return output
+        # put the re-run flowlines back at their seeds' positions, which become the seed_id values
+        for i, streamline in zip(exited, rerun):
+            streamlines[i] = streamline
+        return join_streamlines(streamlines)
 
     def load_streamline_from_output(self, output):
         """Parses grd2stream output and loads it as a vector layer in QGIS."""
@@ -662,51 +1243,158 @@ class FlowlineModule:
             return
 
         try:
-            features = []
-
-            format_fields = {
-                None: ["x", "y", "dist"],
-                "-l": ["x", "y", "dist", "v_x", "v_y"],
-                "-t": ["x", "y", "dist", "v_x", "v_y", "time"]
-            }
-            field_names = format_fields.get(self.output_format, ["x", "y", "dist"])
-
-            for line in output.splitlines():
-                line = line.strip()
-                if not line or line.startswith("#") or line.startswith(">"):
-                    continue
-
-                parts = list(map(float, line.split()))
-                if len(parts) < len(field_names):
-                    continue
-
-                x, y = parts[:2]
-                attributes = parts
-
-                feature = QgsFeature()
-                feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(x, y)))
-                feature.setAttributes(attributes)
-                features.append(feature)
-
-            field_types = ["double"] * len(field_names)
-            uri_fields = "&".join(f"field={name}:{ftype}" for name, ftype in zip(field_names, field_types))
-            uri = f"point?crs={QgsProject.instance().crs().authid()}&{uri_fields}"
-
-            layer_name = "Streamline"
-            layer = QgsVectorLayer(uri, layer_name, "memory")
-            provider = layer.dataProvider()
-            provider.addFeatures(features)
-
-            if not layer.isValid():
-                raise RuntimeError("Failed to load output as a vector layer.")
-
-            QgsProject.instance().addMapLayer(layer)
+            streamlines, _ = self.finish_streamlines(split_streamlines(output))
+            destination = self.store_streamlines(streamlines)
 
             self.iface.messageBar().pushMessage(
-                "Success", f"Layer '{layer_name}' successfully loaded.", level=Qgis.Info, duration=5
+                "Success", f"Flowlines successfully loaded into {destination}.", level=Qgis.Info, duration=5
             )
 
         except Exception as e:
             self.iface.messageBar().pushMessage(
                 "Error", f"Failed to load output as layer: {e}", level=Qgis.Critical, duration=5
             )
+
+    def simplify(self, streamlines, merges=None):
+        """Decimates the flowlines to the simplification tolerance, if one is set, before they become features.
+
+        Vertices that other flowlines merged into are retained, and merges are renumbered to the kept vertices.
+        """
+        if not self.simplify_tolerance:
+            return streamlines, merges
+        keep = None
+        if merges:
+            keep = [[] for _ in streamlines]
+            for merge in merges:
+                if merge:
+                    keep[merge[0]].append(merge[1])
+        before = sum(len(streamline) for streamline in streamlines)
+        streamlines, retained = simplify_streamlines(streamlines, self.simplify_tolerance, self.simplify_method, keep)
+        if merges:
+            merges = [(merge[0], int(np.searchsorted(retained[merge[0]], merge[1]))) if merge else None
+                      for merge in merges]
+        after = sum(len(streamline) for streamline in streamlines)
+        print(f"Simplified flowlines from {before} to {after} vertices ({self.simplify_method}, "
+              f"tolerance {self.simplify_tolerance}).")
+        return streamlines, merges
+
+    def streams_progressively(self):
+        """True if rows can go into the layer as grd2stream prints them, i.e. no stage needs whole flowlines."""
+        return not (self.simplify_tolerance or self.derived_attributes or self.sample_rasters or self.export_path)
+
+    def finish_streamlines(self, streamlines, merges=None):
+        """Adds derived and sampled attributes and simplifies the flowlines, as enabled, before they become features."""
+        field_names = self.format_field_names()
+        if self.derived_attributes:
+            streamlines = add_derived_attributes(streamlines, field_names)
+            field_names = field_names + derived_field_names(field_names)
+        if self.sample_rasters:
+            grids = [self.grid_cache.scalar_grid(raster['source'], raster['band']) for raster in self.sample_rasters]
+            streamlines = add_sampled_columns(streamlines, len(field_names), grids)
+        return self.simplify(streamlines, merges)
+
+    def store_streamlines(self, streamlines, merges=None, step_stats=None):
+        """Exports finished flowlines to the export file and/or adds them to the target layer; returns where they went."""
+        field_names = self.output_field_names()
+        destinations = []
+        if self.export_path:
+            export_flowlines(
+                self.export_path, streamlines, field_names, self.flowline_columns(merges, step_stats),
+                self.run_metadata(), crs_projjson(self.selected_raster_1.crs().toWkt())
+            )
+            print(f"Exported {len(streamlines)} flowlines to {self.export_path}")
+            destinations.append(f"file '{self.export_path}'")
+        if not (self.export_path and self.export_only):
+            layer, extra_attributes = self.target_layer(field_names, merges, step_stats)
+            append_features(layer, streamline_features(streamlines, len(field_names), extra_attributes))
+            destinations.append(f"layer '{layer.name()}'")
+        return " and ".join(destinations)
+
+    def flowline_columns(self, merges=None, step_stats=None):
+        """Per-flowline export columns mirroring the merge and step attributes of the flowline layer."""
+        columns = {}
+        if merges:
+            columns["merged_into"] = [merge[0] + 1 if merge else None for merge in merges]
+            columns["merge_vertex"] = [int(merge[1]) if merge else None for merge in merges]
+        if step_stats:
+            columns["accepted_steps"] = np.asarray(step_stats["accepted"], dtype=np.int64)
+            columns["rejected_steps"] = np.asarray(step_stats["rejected"], dtype=np.int64)
+        return columns
+
+    def run_metadata(self):
+        return {
+            'raster_1_source': self.selected_raster_1.source(),
+            'raster_2_source': self.selected_raster_2.source(),
+            'band_1': self.selected_band_1,
+            'band_2': self.selected_band_2,
+            'backward_steps': bool(self.backward_steps),
+            'bidirectional': bool(self.bidirectional),
+            'step_size': self.step_size,
+            'max_steps': self.max_steps,
+            'max_integration_time': self.max_integration_time,
+            'adaptive_mode': self.adaptive_mode,
+            'adaptive_options': self.adaptive_options,
+            'merge_tolerance': self.merge_tolerance,
+            'simplify_tolerance': self.simplify_tolerance,
+            'simplify_method': self.simplify_method,
+            'sample_rasters': self.sample_rasters,
+            'preset': self.last_used_preset,
+        }
+
+    def output_field_names(self):
+        field_names = self.format_field_names()
+        if self.derived_attributes:
+            field_names = field_names + derived_field_names(field_names)
+        return field_names + [raster['field'] for raster in self.sample_rasters]
+
+    def format_field_names(self):
+        format_fields = {
+            None: ["x", "y", "dist"],
+            "-l": ["x", "y", "dist", "v_x", "v_y"],
+            "-t": ["x", "y", "dist", "v_x", "v_y", "time"]
+        }
+        return format_fields.get(self.output_format, ["x", "y", "dist"])
+
+    def target_layer(self, field_names, merges=None, step_stats=None):
+        """Returns the layer a run writes to and the function providing its per-seed extra attributes.
+
+        merges holds, per seed, the (flowline index, vertex index) its flowline merged into or None;
+        step_stats the per-seed "accepted" and "rejected" step counts of an adaptive run.
+        """
+        if not self.append_mode:
+            layer = create_point_layer("Streamline", [(name, "double") for name in field_names])
+            QgsProject.instance().addMapLayer(layer)
+            return layer, None
+
+        layer = flowline_layer(self.flowline_layer_key(), self.flowline_layer_name(), field_names)
+        run_id = next_run_id(layer)
+        step_size = None if self.adaptive_mode else self.step_size
+        run_attributes = [int(bool(self.backward_steps)), step_size, self.max_steps, self.max_integration_time]
+
+        def extra_attributes(seed_id):
+            merge = merges[seed_id - 1] if merges else None
+            merge_attributes = [merge[0] + 1, int(merge[1])] if merge else [None, None]
+            step_attributes = ([int(step_stats["accepted"][seed_id - 1]), int(step_stats["rejected"][seed_id - 1])]
+                               if step_stats else [None, None])
+            return ([run_id, seed_id] + run_attributes + merge_attributes + [int(bool(self.bidirectional))]
+                    + step_attributes)
+
+        return layer, extra_attributes
+
+    def flowline_layer_key(self):
+        if self.last_used_preset:
+            key = f"preset:{self.last_used_preset}"
+        else:
+            key = (f"grids:{self.selected_raster_1.source()}#{self.selected_band_1}"
+                   f"|{self.selected_raster_2.source()}#{self.selected_band_2}")
+        key = f"{key}|{self.output_format or ''}"
+        if self.derived_attributes:
+            key = f"{key}|derived"
+        if self.sample_rasters:
+            key = f"{key}|sampled:{','.join(raster['field'] for raster in self.sample_rasters)}"
+        return key
+
+    def flowline_layer_name(self):
+        if self.last_used_preset:
+            return f"Streamlines ({self.last_used_preset})"
+        return f"Streamlines ({self.selected_raster_1.name()} / {self.selected_raster_2.name()})"
@@ -0,0 +1,54 @@
+import math
+
+from qgis.core import QgsGeometry, QgsPointXY, QgsWkbTypes
+from qgis.gui import QgsRubberBand
+from qgis.PyQt.QtCore import Qt
+from qgis.PyQt.QtGui import QColor
+
+from .flowline_engine import MAX_STEPS, default_step_size
+from .flowline_jit import trace_bidirectional_jit, trace_flowlines_jit
+
+PREVIEW_COLOR = QColor(255, 140, 0, 200)
+
+
+def preview_parameters(grid, factor, step_size=None, max_steps=None):
+    """Scales step size and step count to a grid decimated by factor, so the preview covers the same length."""
+    full_step_size = step_size or default_step_size(grid) / factor
+    return full_step_size * factor, int(math.ceil((max_steps or MAX_STEPS) / factor))
+
+
+def flowline_geometry(streamlines):
+    """Multi-polyline through the vertices of each traced flowline, skipping those with fewer than two."""
+    lines = [[QgsPointXY(row[0], row[1]) for row in streamline] for streamline in streamlines if len(streamline) > 1]
+    return QgsGeometry.fromMultiPolylineXY(lines)
+
+
+class FlowlinePreview:
+    """Draws provisional flowlines as a rubber band on the map canvas until the real result replaces them."""
+
+    def __init__(self, canvas, color=PREVIEW_COLOR, width=2):
+        self.canvas = canvas
+        self.rubber_band = QgsRubberBand(canvas, QgsWkbTypes.LineGeometry)
+        self.rubber_band.setColor(color)
+        self.rubber_band.setWidth(width)
+        self.rubber_band.setLineStyle(Qt.DashLine)
+
+    def trace(self, grid, seeds, step_size, max_steps, max_time=None, backward=False, bidirectional=False):
+        """Traces the seeds on grid and shows the result; returns the traced flowlines."""
+        if bidirectional:
+            streamlines = trace_bidirectional_jit(grid, seeds, step_size, max_steps, max_time)
+        else:
+            streamlines = trace_flowlines_jit(grid, seeds, step_size, max_steps, max_time, backward)
+        self.show(streamlines)
+        return streamlines
+
+    def show(self, streamlines):
+        self.rubber_band.setToGeometry(flowline_geometry(streamlines), None)
+        self.rubber_band.show()
+
+    def clear(self):
+        if self.rubber_band is None:
+            return
+        self.rubber_band.reset(QgsWkbTypes.LineGeometry)
+        self.canvas.scene().removeItem(self.rubber_band)
+        self.rubber_band = None
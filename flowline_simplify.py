@@ -0,0 +1,98 @@
+import numpy as np
+
+SIMPLIFY_METHODS = [
+    ("douglas-peucker", "Douglas–Peucker (max. offset)"),
+    ("visvalingam", "Visvalingam–Whyatt (min. area)"),
+]
+
+
+def segment_ids(kept, n):
+    """Index into kept of the retained vertex at or before each of the n vertices."""
+    return np.searchsorted(kept, np.arange(n), side="right") - 1
+
+
+def douglas_peucker(xy, tolerance, keep):
+    """Douglas–Peucker splitting all open segments of a flowline at once per pass."""
+    n = len(xy)
+    retained = keep.copy()
+    while True:
+        kept = np.flatnonzero(retained)
+        segment = np.minimum(segment_ids(kept, n), len(kept) - 2)
+        start, end = xy[kept[segment]], xy[kept[segment + 1]]
+        direction = end - start
+        length = np.hypot(direction[:, 0], direction[:, 1])
+        offset = xy - start
+        cross = np.abs(direction[:, 0] * offset[:, 1] - direction[:, 1] * offset[:, 0])
+        distance = np.where(length > 0, cross / np.where(length > 0, length, 1.0),
+                            np.hypot(offset[:, 0], offset[:, 1]))
+        distance[retained] = 0.0
+        furthest = np.zeros(len(kept) - 1)
+        np.maximum.at(furthest, segment, distance)
+        split = (distance > tolerance) & (distance == furthest[segment])
+        if not split.any():
+            return kept
+        candidates = np.flatnonzero(split)
+        _, first = np.unique(segment[candidates], return_index=True)
+        retained[candidates[first]] = True
+
+
+def visvalingam(xy, tolerance, keep):
+    """Visvalingam–Whyatt removing non-adjacent local minima of the effective area per pass."""
+    threshold = tolerance * tolerance
+    retained = np.ones(len(xy), dtype=bool)
+    while True:
+        kept = np.flatnonzero(retained)
+        if len(kept) < 3:
+            return kept
+        a, b, c = xy[kept[:-2]], xy[kept[1:-1]], xy[kept[2:]]
+        area = np.full(len(kept), np.inf)
+        area[1:-1] = 0.5 * np.abs((b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (c[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1]))
+        area[keep[kept]] = np.inf
+        candidate = np.zeros(len(kept), dtype=bool)
+        candidate[1:-1] = (area[1:-1] < threshold) & (area[1:-1] <= area[:-2]) & (area[1:-1] <= area[2:])
+        if not candidate.any():
+            return kept
+        # of each run of adjacent candidates only every other one goes, so no two neighbours vanish together
+        run_start = np.maximum.accumulate(np.where(candidate & ~np.r_[False, candidate[:-1]], np.arange(len(kept)), 0))
+        candidate &= (np.arange(len(kept)) - run_start) % 2 == 0
+        retained[kept[candidate]] = False
+
+
+def retained_vertices(xy, tolerance, method="douglas-peucker", keep=None):
+    """Indices of the vertices a flowline keeps when simplified to tolerance (in map units).
+
+    Douglas–Peucker keeps every vertex further than tolerance from the simplified line;
+    Visvalingam–Whyatt drops vertices whose triangle with their neighbours is smaller than tolerance².
+    The end points and the vertex indices in keep are always retained.
+    """
+    xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+    if len(xy) < 3:
+        return np.arange(len(xy))
+    protected = np.zeros(len(xy), dtype=bool)
+    protected[[0, -1]] = True
+    if keep is not None and len(keep):
+        protected[np.asarray(keep, dtype=np.intp)] = True
+    if method == "douglas-peucker":
+        return douglas_peucker(xy, tolerance, protected)
+    if method == "visvalingam":
+        return visvalingam(xy, tolerance, protected)
+    raise ValueError(f"Unknown simplification method '{method}'.")
+
+
+def simplify_streamlines(streamlines, tolerance, method="douglas-peucker", keep=None):
+    """Drops vertices from each flowline; the retained rows keep all their columns, including dist and time.
+
+    keep optionally holds, per flowline, vertex indices that must survive. Returns the simplified
+    flowlines and, per flowline, the indices of its retained vertices.
+    """
+    simplified, retained = [], []
+    for i, streamline in enumerate(streamlines):
+        rows = np.asarray(streamline, dtype=float)
+        if not len(rows):
+            simplified.append(rows)
+            retained.append(np.arange(0))
+            continue
+        indices = retained_vertices(rows[:, :2], tolerance, method, keep[i] if keep else None)
+        simplified.append(rows[indices])
+        retained.append(indices)
+    return simplified, retained
@@ -167,6 +167,9 @@ class Grd2Stream:
             self.flowline_action.triggered.disconnect()
             self.toolbar.removeAction(self.flowline_action)
 
+        if self.flowline_module:
+            self.flowline_module.unload()
+
         if hasattr(self, 'help_action'):
             self.iface.pluginHelpMenu().removeAction(self.help_action)
             self.help_action = None
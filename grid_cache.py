@@ -0,0 +1,267 @@
+import hashlib
+import math
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+from osgeo import gdal, osr
+
+from .disk_grid_cache import source_file
+from .flowline_engine import VelocityGrid
+from .raster_sampling import ScalarGrid
+from .shared_grids import SharedGridRegistry
+
+VELOCITY_GRID_BUDGET = 2 << 30
+MAX_SCALAR_GRIDS = 8
+
+
+class RasterMetadata:
+    """Extent, resolution, CRS, NoData and data type of one raster band, as grd2stream will see it."""
+
+    def __init__(self, source, band, geotransform, x_size, y_size, crs_wkt, nodata, dtype):
+        self.source = source
+        self.band = band
+        self.geotransform = geotransform
+        self.x_size = x_size
+        self.y_size = y_size
+        self.crs_wkt = crs_wkt
+        self.nodata = nodata
+        self.dtype = dtype
+        self.x_inc = abs(geotransform[1])
+        self.y_inc = abs(geotransform[5])
+        x_0 = geotransform[0] + 0.5 * geotransform[1]
+        x_1 = geotransform[0] + (x_size - 0.5) * geotransform[1]
+        y_0 = geotransform[3] + 0.5 * geotransform[5]
+        y_1 = geotransform[3] + (y_size - 0.5) * geotransform[5]
+        self.extent = (min(x_0, x_1), min(y_0, y_1), max(x_0, x_1), max(y_0, y_1))
+
+    def same_crs(self, other):
+        if not self.crs_wkt or not other.crs_wkt:
+            return self.crs_wkt == other.crs_wkt
+        crs_1 = osr.SpatialReference(wkt=self.crs_wkt)
+        crs_2 = osr.SpatialReference(wkt=other.crs_wkt)
+        return bool(crs_1.IsSame(crs_2))
+
+
+def source_mtime(source):
+    """Modification time of the file behind a GDAL source (also 'NETCDF:"file":var'), or None if there is none."""
+    path = source_file(source)
+    return os.path.getmtime(path) if path else None
+
+
+def grid_meta(grid, **extra):
+    """Node geometry of a grid as JSON-serializable keyword arguments for rebuilding it from cached values."""
+    return dict(xmin=grid.xmin, ymin=grid.ymin, x_inc=grid.x_inc, y_inc=grid.y_inc, **extra)
+
+
+class GridCache:
+    """Extracts and caches subgrids of velocity rasters for an area of interest."""
+
+    def __init__(self, cache_dir=None, disk_cache=None):
+        self.cache_dir = cache_dir
+        self.disk_cache = disk_cache
+        self.subgrids = {}
+        self.grid_info_cache = {}
+        self.metadata_cache = {}
+        self.velocity_grids = OrderedDict()
+        self.scalar_grids = OrderedDict()
+        self.shared_grids = SharedGridRegistry()
+
+    def ensure_cache_dir(self):
+        if not self.cache_dir or not os.path.isdir(self.cache_dir):
+            self.cache_dir = tempfile.mkdtemp(prefix="grd2stream_cache_")
+        return self.cache_dir
+
+    def grid_info(self, source):
+        """Returns (geotransform, x_size, y_size) of a GDAL-readable source."""
+        key = (source, source_mtime(source))
+        if key not in self.grid_info_cache:
+            dataset = gdal.Open(source)
+            if dataset is None:
+                raise RuntimeError(f"Could not open raster '{source}' with GDAL.")
+            self.grid_info_cache[key] = (dataset.GetGeoTransform(), dataset.RasterXSize, dataset.RasterYSize)
+            dataset = None
+        return self.grid_info_cache[key]
+
+    def metadata(self, source, band=1):
+        """Reads the metadata of a band once per source modification and caches it."""
+        mtime = source_mtime(source)
+        key = (source, band, mtime)
+        if key not in self.metadata_cache:
+            dataset = gdal.Open(source)
+            if dataset is None:
+                raise RuntimeError(f"Could not open raster '{source}' with GDAL.")
+            if band > dataset.RasterCount:
+                raise RuntimeError(f"Raster '{source}' has no band {band}.")
+            raster_band = dataset.GetRasterBand(band)
+            self.metadata_cache[key] = RasterMetadata(
+                source,
+                band,
+                dataset.GetGeoTransform(),
+                dataset.RasterXSize,
+                dataset.RasterYSize,
+                dataset.GetProjection(),
+                raster_band.GetNoDataValue(),
+                gdal.GetDataTypeName(raster_band.DataType)
+            )
+            dataset = None
+        return self.metadata_cache[key]
+
+    def default_step_size(self, source):
+        geotransform, _, _ = self.grid_info(source)
+        return min(abs(geotransform[1]), abs(geotransform[5])) / 5.0
+
+    def window_for_extent(self, source, xmin, ymin, xmax, ymax, padding=1):
+        """Returns the pixel window (x_off, y_off, x_size, y_size) covering an extent, or None if it spans the grid."""
+        geotransform, x_size, y_size = self.grid_info(source)
+        cols = sorted(((xmin - geotransform[0]) / geotransform[1], (xmax - geotransform[0]) / geotransform[1]))
+        rows = sorted(((ymin - geotransform[3]) / geotransform[5], (ymax - geotransform[3]) / geotransform[5]))
+        col_0 = max(int(math.floor(cols[0])) - padding, 0)
+        col_1 = min(int(math.ceil(cols[1])) + padding, x_size)
+        row_0 = max(int(math.floor(rows[0])) - padding, 0)
+        row_1 = min(int(math.ceil(rows[1])) + padding, y_size)
+        if col_1 - col_0 < 2 or row_1 - row_0 < 2:
+            return None
+        if col_0 == 0 and row_0 == 0 and col_1 == x_size and row_1 == y_size:
+            return None
+        return col_0, row_0, col_1 - col_0, row_1 - row_0
+
+    def window_bounds(self, source, window):
+        """Returns the node extent (xmin, ymin, xmax, ymax) of a window as seen by grd2stream."""
+        geotransform, x_size, y_size = self.grid_info(source)
+        if window is None:
+            window = (0, 0, x_size, y_size)
+        x_off, y_off, width, height = window
+        x_0 = geotransform[0] + (x_off + 0.5) * geotransform[1]
+        x_1 = geotransform[0] + (x_off + width - 0.5) * geotransform[1]
+        y_0 = geotransform[3] + (y_off + 0.5) * geotransform[5]
+        y_1 = geotransform[3] + (y_off + height - 0.5) * geotransform[5]
+        return min(x_0, x_1), min(y_0, y_1), max(x_0, x_1), max(y_0, y_1)
+
+    def subgrid(self, source, band, window):
+        """Writes the window of a band to a netCDF grid readable by grd2stream and returns its path."""
+        mtime = source_mtime(source)
+        key = (source, band, tuple(window), mtime)
+        path = self.subgrids.get(key)
+        if path and os.path.exists(path):
+            return path
+        # named after the key, so a new extraction never overwrites the file of another cached window
+        name = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        path = os.path.join(self.ensure_cache_dir(), f"subgrid_{name}.nc")
+        result = gdal.Translate(path, source, format="netCDF", srcWin=list(window), bandList=[band])
+        if result is None:
+            raise RuntimeError(f"Could not extract subgrid from '{source}'.")
+        result = None
+        self.subgrids[key] = path
+        return path
+
+    def read_band(self, source, band, factor=1, dtype=np.float64):
+        """Reads a band as float64 (or dtype) with NoData as NaN, decimated by factor (GDAL uses overviews where available)."""
+        dataset = gdal.Open(source)
+        if dataset is None:
+            raise RuntimeError(f"Could not open raster '{source}' with GDAL.")
+        x_size = max(dataset.RasterXSize // factor, 2)
+        y_size = max(dataset.RasterYSize // factor, 2)
+        raster_band = dataset.GetRasterBand(band)
+        values = raster_band.ReadAsArray(buf_xsize=x_size, buf_ysize=y_size).astype(dtype)
+        nodata = raster_band.GetNoDataValue()
+        if nodata is not None:
+            values[values == nodata] = np.nan
+        geotransform = list(dataset.GetGeoTransform())
+        geotransform[1] *= dataset.RasterXSize / x_size
+        geotransform[5] *= dataset.RasterYSize / y_size
+        dataset = None
+        return values, geotransform
+
+    def velocity_grid_key(self, source_1, band_1, source_2, band_2, factor=1, dtype=np.float64):
+        mtimes = (source_mtime(source_1), source_mtime(source_2))
+        return source_1, band_1, source_2, band_2, factor, np.dtype(dtype).str, mtimes
+
+    def velocity_grid_decode_bytes(self, source_1, band_1, source_2, band_2, factor=1, dtype=np.float64):
+        """Bytes velocity_grid() has to decode for this pair: 0 if it is held in memory or on disk."""
+        if self.velocity_grid_key(source_1, band_1, source_2, band_2, factor, dtype) in self.velocity_grids:
+            return 0
+        disk_key = ("velocity", source_1, band_1, source_2, band_2, factor, np.dtype(dtype).str)
+        if self.disk_cache and self.disk_cache.load(disk_key, (source_1, source_2)):
+            return 0
+        metadata = self.metadata(source_1, band_1)
+        nodes = max(metadata.x_size // factor, 2) * max(metadata.y_size // factor, 2)
+        return 2 * nodes * np.dtype(dtype).itemsize
+
+    def velocity_grid(self, source_1, band_1, source_2, band_2, factor=1, dtype=np.float64):
+        """Loads both velocity bands into memory for the in-process integrator, keeping grids up to a byte budget.
+
+        dtype float32 halves the memory of a grid; the integrator still accumulates positions in float64.
+        """
+        key = self.velocity_grid_key(source_1, band_1, source_2, band_2, factor, dtype)
+        if key in self.velocity_grids:
+            self.velocity_grids.move_to_end(key)
+            return self.velocity_grids[key]
+        disk_key = ("velocity", source_1, band_1, source_2, band_2, factor, np.dtype(dtype).str)
+        cached = self.disk_cache.load(disk_key, (source_1, source_2)) if self.disk_cache else None
+        if cached:
+            values, meta = cached
+            grid = VelocityGrid.from_values(values, **meta)
+        else:
+            vx, geotransform = self.read_band(source_1, band_1, factor, dtype)
+            vy, _ = self.read_band(source_2, band_2, factor, dtype)
+            grid = VelocityGrid.from_geotransform(vx, vy, geotransform)
+            if self.disk_cache:
+                self.disk_cache.store(disk_key, (source_1, source_2), grid.values, grid_meta(grid, nx=grid.nx, ny=grid.ny))
+        self.velocity_grids[key] = grid
+        while (len(self.velocity_grids) > 1
+               and sum(cached.nbytes for cached in self.velocity_grids.values()) > VELOCITY_GRID_BUDGET):
+            evicted, _ = self.velocity_grids.popitem(last=False)
+            self.shared_grids.release(evicted)
+        return grid
+
+    def shared_velocity_grid(self, source_1, band_1, source_2, band_2, dtype=np.float64):
+        """Moves a velocity grid into shared memory for worker processes; returns its handle and the grid.
+
+        The cached grid is replaced by the shared one, so the parent process keeps a single copy.
+        """
+        grid = self.velocity_grid(source_1, band_1, source_2, band_2, dtype=dtype)
+        key = self.velocity_grid_key(source_1, band_1, source_2, band_2, dtype=dtype)
+        handle, shared_grid = self.shared_grids.share(key, grid)
+        self.velocity_grids[key] = shared_grid
+        return handle, shared_grid
+
+    def scalar_grid(self, source, band):
+        """Loads an auxiliary band for sampling along flowlines, keeping the last few like the velocity grids."""
+        mtime = source_mtime(source)
+        key = (source, band, mtime)
+        if key in self.scalar_grids:
+            self.scalar_grids.move_to_end(key)
+            return self.scalar_grids[key]
+        disk_key = ("scalar", source, band)
+        cached = self.disk_cache.load(disk_key, (source,)) if self.disk_cache else None
+        if cached:
+            values, meta = cached
+            grid = ScalarGrid(values, **meta)
+        else:
+            values, geotransform = self.read_band(source, band)
+            grid = ScalarGrid.from_geotransform(values, geotransform)
+            if self.disk_cache:
+                self.disk_cache.store(disk_key, (source,), grid.values, grid_meta(grid))
+        self.scalar_grids[key] = grid
+        while len(self.scalar_grids) > MAX_SCALAR_GRIDS:
+            self.scalar_grids.popitem(last=False)
+        return grid
+
+    def preview_factor(self, source, max_nodes=1000000):
+        """Decimation factor that keeps a preview grid below max_nodes nodes."""
+        _, x_size, y_size = self.grid_info(source)
+        return max(2, int(math.ceil(math.sqrt(x_size * y_size / max_nodes))))
+
+    def clear(self):
+        self.shared_grids.close()
+        if self.cache_dir and os.path.isdir(self.cache_dir):
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+        self.cache_dir = None
+        self.subgrids = {}
+        self.grid_info_cache = {}
+        self.metadata_cache = {}
+        self.velocity_grids = OrderedDict()
+        self.scalar_grids = OrderedDict()
@@ -0,0 +1,31 @@
+import numpy as np
+
+
+def validate_grid_pair(metadata_1, metadata_2, rtol=1e-6):
+    """Returns a list of reasons why grd2stream cannot combine the two bands (empty if compatible)."""
+    problems = []
+    if not metadata_1.same_crs(metadata_2):
+        problems.append("the grids use different coordinate reference systems")
+    if (metadata_1.x_size, metadata_1.y_size) != (metadata_2.x_size, metadata_2.y_size):
+        problems.append(
+            f"the grids have different sizes ({metadata_1.x_size}x{metadata_1.y_size} vs. "
+            f"{metadata_2.x_size}x{metadata_2.y_size})"
+        )
+    resolution_1 = np.array([metadata_1.x_inc, metadata_1.y_inc])
+    resolution_2 = np.array([metadata_2.x_inc, metadata_2.y_inc])
+    if not np.allclose(resolution_1, resolution_2, rtol=rtol, atol=0.0):
+        problems.append(
+            f"the grids have different resolutions ({metadata_1.x_inc} x {metadata_1.y_inc} vs. "
+            f"{metadata_2.x_inc} x {metadata_2.y_inc})"
+        )
+    elif not np.allclose(metadata_1.extent, metadata_2.extent, rtol=0.0, atol=rtol * resolution_1.min()):
+        problems.append("the grids cover different extents")
+    return problems
+
+
+def seeds_in_domain(seeds, metadata):
+    """Boolean mask of the seeds that lie on the grid, using the same bounds test as grd2stream."""
+    seeds = np.asarray(seeds, dtype=float).reshape(-1, 2)
+    xmin, ymin, xmax, ymax = metadata.extent
+    x, y = seeds[:, 0], seeds[:, 1]
+    return np.isfinite(x) & np.isfinite(y) & (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)
@@ -0,0 +1,61 @@
+import os
+
+from qgis.core import QgsProject, QgsProviderRegistry, QgsRasterLayer
+
+
+def normalized_source(source, provider="gdal"):
+    """Returns a comparable key for a raster source URI, independent of quoting and path spelling."""
+    if not source:
+        return None
+    parts = QgsProviderRegistry.instance().decodeUri(provider, source)
+    path = parts.get("path")
+    if not path:
+        return source.strip()
+    path = os.path.normcase(os.path.abspath(os.path.normpath(path.strip('"'))))
+    layer_name = parts.get("layerName") or ""
+    return f"{path}|{layer_name}"
+
+
+class ProjectLayerIndex:
+    """Index of the raster layers open in the project, keyed by normalized source URI."""
+
+    def __init__(self, project=None):
+        self.project = project or QgsProject.instance()
+        self.layers = None
+        self.project.layersAdded.connect(self.invalidate)
+        self.project.layersRemoved.connect(self.invalidate)
+        self.project.cleared.connect(self.invalidate)
+
+    def invalidate(self, *args):
+        self.layers = None
+
+    def rebuild(self):
+        self.layers = {}
+        for layer in self.project.mapLayers().values():
+            if isinstance(layer, QgsRasterLayer) and layer.isValid():
+                key = normalized_source(layer.source(), layer.providerType())
+                self.layers.setdefault(key, layer)
+
+    def find(self, source, band=1):
+        """Returns the open project layer for source that provides band, or None."""
+        if self.layers is None:
+            self.rebuild()
+        layer = self.layers.get(normalized_source(source))
+        if layer is None or band > layer.bandCount():
+            return None
+        return layer
+
+    def resolve(self, source, name, band=1):
+        """Returns an open project layer for source, opening a new layer only if there is no match."""
+        layer = self.find(source, band)
+        if layer is not None:
+            print(f"Reusing project layer '{layer.name()}' for {source}")
+            return layer
+        return QgsRasterLayer(source, name)
+
+    def disconnect(self):
+        for signal in (self.project.layersAdded, self.project.layersRemoved, self.project.cleared):
+            try:
+                signal.disconnect(self.invalidate)
+            except TypeError:
+                pass
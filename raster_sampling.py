@@ -0,0 +1,66 @@
+import re
+
+import numpy as np
+
+from .flowline_engine import ascending_nodes, stack_rows
+
+
+class ScalarGrid:
+    """One auxiliary raster band (e.g. ice thickness) on regular nodes with ascending x and y."""
+
+    def __init__(self, values, xmin, ymin, x_inc, y_inc):
+        self.ny, self.nx = values.shape
+        if self.nx < 2 or self.ny < 2:
+            raise ValueError("Sampled grids need at least 2x2 nodes.")
+        self.values = values
+        self.xmin = xmin
+        self.ymin = ymin
+        self.x_inc = x_inc
+        self.y_inc = y_inc
+        self.xmax = xmin + (self.nx - 1) * x_inc
+        self.ymax = ymin + (self.ny - 1) * y_inc
+
+    @classmethod
+    def from_geotransform(cls, values, geotransform):
+        (values,), xmin, ymin, x_inc, y_inc = ascending_nodes((values,), geotransform)
+        return cls(values, xmin, ymin, x_inc, y_inc)
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+    def sample(self, x, y):
+        """Bilinear values at (x, y) in a single gather; NaN outside the nodes or next to a NaN node."""
+        fx = (np.asarray(x, dtype=float) - self.xmin) / self.x_inc
+        fy = (np.asarray(y, dtype=float) - self.ymin) / self.y_inc
+        inside = (fx >= 0) & (fx <= self.nx - 1) & (fy >= 0) & (fy <= self.ny - 1)
+        ix = np.clip(fx, 0, self.nx - 2).astype(np.intp)
+        iy = np.clip(fy, 0, self.ny - 2).astype(np.intp)
+        tx = np.clip(fx - ix, 0.0, 1.0)
+        ty = np.clip(fy - iy, 0.0, 1.0)
+        flat = self.values.reshape(-1)
+        base = iy * self.nx + ix
+        corners = flat[base[:, None] + np.array([0, 1, self.nx, self.nx + 1], dtype=np.intp)]
+        bottom = corners[:, 0] + tx * (corners[:, 1] - corners[:, 0])
+        top = corners[:, 2] + tx * (corners[:, 3] - corners[:, 2])
+        return np.where(inside, bottom + ty * (top - bottom), np.nan)
+
+
+def sample_field_name(layer_name, band, taken):
+    """Attribute name for a sampled band, e.g. 'thickness_b1', made unique against the names in taken."""
+    base = re.sub(r"\W+", "_", layer_name).strip("_").lower() or "raster"
+    name = f"{base}_b{band}"
+    suffix = 2
+    while name in taken:
+        name = f"{base}_b{band}_{suffix}"
+        suffix += 1
+    return name
+
+
+def add_sampled_columns(streamlines, n_columns, grids):
+    """Appends one column per grid, sampled at all vertices of all flowlines with one gather per grid."""
+    if not len(streamlines):
+        return []
+    rows, lengths = stack_rows(streamlines, n_columns)
+    sampled = [grid.sample(rows[:, 0], rows[:, 1]) for grid in grids]
+    return np.split(np.column_stack([rows] + sampled), np.cumsum(lengths)[:-1])
@@ -0,0 +1,80 @@
+import numpy as np
+
+RING_TEST_BUDGET = 1 << 20
+
+
+def seeds_along_line(vertices, spacing):
+    """Evenly spaced seeds along a polyline, starting at its first vertex."""
+    vertices = np.asarray(vertices, dtype=float).reshape(-1, 2)
+    if spacing <= 0:
+        raise ValueError("Seed spacing must be positive.")
+    if len(vertices) < 2:
+        return vertices.copy()
+    segment_lengths = np.hypot(*np.diff(vertices, axis=0).T)
+    chainage = np.concatenate(([0.0], np.cumsum(segment_lengths)))
+    positions = np.arange(0.0, chainage[-1] + 1e-9 * spacing, spacing)
+    return np.column_stack((np.interp(positions, chainage, vertices[:, 0]),
+                            np.interp(positions, chainage, vertices[:, 1])))
+
+
+def points_in_rings(points, rings):
+    """Even-odd point-in-polygon test of all points against all rings (exterior rings and holes alike).
+
+    Only points inside a ring's bounding box are tested, in chunks of about RING_TEST_BUDGET
+    point-vertex pairs, so large catchment outlines stay within bounded memory.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    inside = np.zeros(len(points), dtype=bool)
+    for ring in rings:
+        ring = np.asarray(ring, dtype=float).reshape(-1, 2)
+        if not len(ring):
+            continue
+        x_0, y_0 = ring[:, 0], ring[:, 1]
+        x_1, y_1 = np.roll(x_0, -1), np.roll(y_0, -1)
+        candidates = np.flatnonzero(
+            (points[:, 0] >= x_0.min()) & (points[:, 0] <= x_0.max())
+            & (points[:, 1] >= y_0.min()) & (points[:, 1] <= y_0.max())
+        )
+        chunk = max(1, RING_TEST_BUDGET // len(ring))
+        for start in range(0, len(candidates), chunk):
+            ids = candidates[start:start + chunk]
+            x, y = points[ids, 0:1], points[ids, 1:2]
+            crosses = (y_0 > y) != (y_1 > y)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                x_cross = x_0 + (y - y_0) * (x_1 - x_0) / (y_1 - y_0)
+            inside[ids] ^= (np.count_nonzero(crosses & (x < x_cross), axis=1) % 2).astype(bool)
+    return inside
+
+
+def lattice(extent, spacing, hexagonal=False):
+    """Regular or hexagonal lattice of points covering extent (xmin, ymin, xmax, ymax)."""
+    if spacing <= 0:
+        raise ValueError("Seed spacing must be positive.")
+    xmin, ymin, xmax, ymax = extent
+    row_spacing = spacing * np.sqrt(3.0) / 2.0 if hexagonal else spacing
+    xs = np.arange(xmin, xmax + spacing, spacing)
+    ys = np.arange(ymin, ymax + row_spacing, row_spacing)
+    grid_x, grid_y = np.meshgrid(xs, ys)
+    if hexagonal:
+        grid_x[1::2] += spacing / 2.0
+    return np.column_stack((grid_x.ravel(), grid_y.ravel()))
+
+
+def seeds_in_polygon(rings, spacing, hexagonal=False):
+    """Lattice seeds inside a polygon given as a list of rings."""
+    extent = rings_extent(rings)
+    points = lattice(extent, spacing, hexagonal)
+    return points[points_in_rings(points, rings)]
+
+
+def stratified_random_seeds(rings, spacing, random_state=None):
+    """One uniformly random seed per lattice cell of size spacing, kept if it falls inside the polygon."""
+    rng = np.random.default_rng(random_state)
+    cells = lattice(rings_extent(rings), spacing)
+    points = cells + rng.random(cells.shape) * spacing
+    return points[points_in_rings(points, rings)]
+
+
+def rings_extent(rings):
+    vertices = np.concatenate([np.asarray(ring, dtype=float).reshape(-1, 2) for ring in rings])
+    return vertices[:, 0].min(), vertices[:, 1].min(), vertices[:, 0].max(), vertices[:, 1].max()
@@ -0,0 +1,59 @@
+import numpy as np
+
+CURVE_BITS = 16
+
+
+def quantize(seeds, bits=CURVE_BITS):
+    """Maps seed coordinates onto an integer lattice of 2**bits cells per axis over their bounding box."""
+    seeds = np.asarray(seeds, dtype=float).reshape(-1, 2)
+    lower = seeds.min(axis=0)
+    span = np.maximum(seeds.max(axis=0) - lower, np.finfo(float).tiny)
+    cells = (seeds - lower) / span * ((1 << bits) - 1)
+    return np.rint(cells).astype(np.int64)
+
+
+def morton_codes(seeds, bits=CURVE_BITS):
+    """Z-order codes obtained by interleaving the bits of the quantized coordinates."""
+    cells = quantize(seeds, bits)
+    codes = np.zeros(len(cells), dtype=np.int64)
+    for bit in range(bits):
+        codes |= ((cells[:, 0] >> bit) & 1) << (2 * bit)
+        codes |= ((cells[:, 1] >> bit) & 1) << (2 * bit + 1)
+    return codes
+
+
+def hilbert_codes(seeds, bits=CURVE_BITS):
+    """Distances along a Hilbert curve through the quantized coordinates (vectorized xy2d)."""
+    cells = quantize(seeds, bits)
+    x, y = cells[:, 0].copy(), cells[:, 1].copy()
+    codes = np.zeros(len(cells), dtype=np.int64)
+    n = 1 << bits
+    s = n >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        codes += s * s * ((3 * rx) ^ ry)
+        flip = ~ry & rx
+        x = np.where(flip, n - 1 - x, x)
+        y = np.where(flip, n - 1 - y, y)
+        swap = ~ry
+        x, y = np.where(swap, y, x), np.where(swap, x, y)
+        s >>= 1
+    return codes
+
+
+def spatial_order(seeds, curve="hilbert"):
+    """Permutation that visits the seeds along a space-filling curve, so neighbours are traced together."""
+    seeds = np.asarray(seeds, dtype=float).reshape(-1, 2)
+    if len(seeds) < 3:
+        return np.arange(len(seeds))
+    codes = hilbert_codes(seeds) if curve == "hilbert" else morton_codes(seeds)
+    return np.argsort(codes, kind="stable")
+
+
+def restore_order(items, order):
+    """Puts items produced in the order of spatial_order() back into the original seed order."""
+    restored = [None] * len(order)
+    for item, index in zip(items, order):
+        restored[index] = item
+    return restored
@@ -0,0 +1,169 @@
+import os
+import sys
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .flowline_engine import VelocityGrid, trace_flowlines_adaptive
+from .flowline_jit import trace_bidirectional_jit, trace_flowlines_jit
+
+PARALLEL_MIN_SEEDS = 256
+CHUNKS_PER_WORKER = 4
+TRACERS = {
+    "fixed": trace_flowlines_jit,
+    "bidirectional": trace_bidirectional_jit,
+    "adaptive": trace_flowlines_adaptive,
+}
+
+worker_grid = None
+
+
+class SharedGridHandle:
+    """Picklable reference to a velocity grid in shared memory; workers attach to it by name."""
+
+    def __init__(self, name, nx, ny, xmin, ymin, x_inc, y_inc, dtype):
+        self.name = name
+        self.nx = nx
+        self.ny = ny
+        self.xmin = xmin
+        self.ymin = ymin
+        self.x_inc = x_inc
+        self.y_inc = y_inc
+        self.dtype = dtype
+
+    def attach(self):
+        """Maps the segment and returns (segment, grid); the grid's arrays are views of the segment."""
+        try:
+            segment = shared_memory.SharedMemory(name=self.name, track=False)
+        except TypeError:
+            # before Python 3.13 attaching registers the segment again with the resource tracker,
+            # which pool workers share with the plugin process, so the segment still lives until unlinked
+            segment = shared_memory.SharedMemory(name=self.name)
+        values = np.ndarray((self.nx * self.ny, 2), dtype=self.dtype, buffer=segment.buf)
+        grid = VelocityGrid.from_values(values, self.nx, self.ny, self.xmin, self.ymin, self.x_inc, self.y_inc)
+        return segment, grid
+
+
+class SharedGridRegistry:
+    """Owns the shared-memory velocity grids and the worker pool tracing on them; close() releases everything."""
+
+    def __init__(self):
+        self.segments = {}
+        self.executor = None
+        self.executor_grid = None
+
+    def share(self, key, grid):
+        """Copies a grid into a new shared-memory segment once per key; returns (handle, grid backed by it)."""
+        if key in self.segments:
+            _, handle, shared_grid = self.segments[key]
+            return handle, shared_grid
+        segment = shared_memory.SharedMemory(create=True, size=max(grid.values.nbytes, 1))
+        values = np.ndarray(grid.values.shape, dtype=grid.values.dtype, buffer=segment.buf)
+        values[:] = grid.values
+        handle = SharedGridHandle(segment.name, grid.nx, grid.ny, grid.xmin, grid.ymin, grid.x_inc, grid.y_inc,
+                                  grid.values.dtype.str)
+        shared_grid = VelocityGrid.from_values(values, grid.nx, grid.ny, grid.xmin, grid.ymin, grid.x_inc, grid.y_inc)
+        self.segments[key] = (segment, handle, shared_grid)
+        return handle, shared_grid
+
+    def release(self, key):
+        entry = self.segments.pop(key, None)
+        if entry is None:
+            return
+        segment, handle, _ = entry
+        if self.executor_grid == handle.name:
+            self.shutdown_executor()
+        release_segment(segment)
+
+    def pool(self, handle, workers):
+        """Process pool whose workers have the handle's grid attached; reused while the grid stays the same."""
+        if self.executor is not None and self.executor_grid != handle.name:
+            self.shutdown_executor()
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=spawn_context(), initializer=attach_worker_grid, initargs=(handle,)
+            )
+            self.executor_grid = handle.name
+        return self.executor
+
+    def shutdown_executor(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+        self.executor = None
+        self.executor_grid = None
+
+    def close(self):
+        self.shutdown_executor()
+        for key in list(self.segments):
+            self.release(key)
+
+
+def release_segment(segment):
+    try:
+        segment.close()
+    except BufferError:
+        # a grid built on the segment is still referenced; the mapping goes away with it
+        pass
+    try:
+        segment.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def python_executable():
+    """The Python interpreter for worker processes; inside QGIS sys.executable is the QGIS binary."""
+    if os.path.basename(sys.executable).lower().startswith("python"):
+        return sys.executable
+    names = ["python.exe"] if sys.platform == "win32" else [f"python{sys.version_info[0]}.{sys.version_info[1]}",
+                                                             "python3"]
+    folders = [sys.exec_prefix] if sys.platform == "win32" else [os.path.join(sys.exec_prefix, "bin")]
+    for folder in folders:
+        for name in names:
+            path = os.path.join(folder, name)
+            if os.path.exists(path):
+                return path
+    raise RuntimeError("No Python interpreter found to start worker processes.")
+
+
+def spawn_context():
+    context = multiprocessing.get_context("spawn")
+    context.set_executable(python_executable())
+    return context
+
+
+def worker_count():
+    return max(1, (os.cpu_count() or 1) - 1)
+
+
+def attach_worker_grid(handle):
+    global worker_grid
+    worker_grid = handle.attach()
+
+
+def trace_chunk(tracer, seeds, kwargs):
+    _, grid = worker_grid
+    return TRACERS[tracer](grid, seeds, **kwargs)
+
+
+def trace_parallel(registry, handle, tracer, seeds, workers=None, **kwargs):
+    """Runs one of TRACERS over contiguous seed chunks in worker processes sharing the handle's grid.
+
+    Per-seed array arguments (e.g. backward) are split with the seeds. Returns the per-chunk results
+    in seed order; the caller joins them the way the tracer returns them.
+    """
+    workers = workers or worker_count()
+    seeds = np.asarray(seeds, dtype=float).reshape(-1, 2)
+    n_chunks = min(len(seeds), workers * CHUNKS_PER_WORKER)
+    if not n_chunks:
+        return []
+    bounds = np.cumsum([len(chunk) for chunk in np.array_split(np.arange(len(seeds)), n_chunks)])[:-1]
+    per_seed = {name: np.split(value, bounds) for name, value in kwargs.items()
+                if isinstance(value, np.ndarray) and len(value) == len(seeds)}
+    executor = registry.pool(handle, workers)
+    futures = []
+    for i, chunk in enumerate(np.split(seeds, bounds)):
+        chunk_kwargs = dict(kwargs, **{name: parts[i] for name, parts in per_seed.items()})
+        futures.append(executor.submit(trace_chunk, tracer, chunk, chunk_kwargs))
+    return [future.result() for future in futures]
@@ -0,0 +1,77 @@
+import math
+
+import numpy as np
+
+MAX_OCCUPANCY_CELLS = 1 << 22
+
+
+class SpatialHash:
+    """Uniform hash grid of points with an attached value, for constant-time neighbourhood queries."""
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def cell(self, x, y):
+        return int(math.floor(x / self.cell_size)), int(math.floor(y / self.cell_size))
+
+    def insert(self, x, y, value=None):
+        self.cells.setdefault(self.cell(x, y), []).append((x, y, value))
+
+    def insert_many(self, points, values=None):
+        for i, (x, y) in enumerate(points):
+            self.insert(x, y, None if values is None else values[i])
+
+    def neighbours(self, x, y):
+        """Yields (x, y, value) of all points in the 3x3 cells around (x, y)."""
+        i, j = self.cell(x, y)
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                yield from self.cells.get((i + di, j + dj), ())
+
+    def find(self, x, y, distance, accept=None):
+        """Returns the first (x, y, value) within distance of (x, y), or None; distance must not exceed the cell size."""
+        distance_2 = distance * distance
+        for point in self.neighbours(x, y):
+            px, py, value = point
+            if (px - x) ** 2 + (py - y) ** 2 < distance_2 and (accept is None or accept(value)):
+                return point
+        return None
+
+    def near(self, x, y, distance, accept=None):
+        return self.find(x, y, distance, accept) is not None
+
+
+class OccupancyGrid:
+    """Boolean raster over an extent marking cells near inserted points, as a vectorized pre-filter for SpatialHash.
+
+    Cells are at least cell_size wide, but coarser if the extent would need more than
+    MAX_OCCUPANCY_CELLS; a point within cell_size of an inserted one always tests True.
+    """
+
+    def __init__(self, extent, cell_size):
+        self.xmin, self.ymin, xmax, ymax = extent
+        area = max((xmax - self.xmin) * (ymax - self.ymin), 0.0)
+        self.cell_size = max(cell_size, math.sqrt(area / MAX_OCCUPANCY_CELLS))
+        self.nx = int(math.floor((xmax - self.xmin) / self.cell_size)) + 1
+        self.ny = int(math.floor((ymax - self.ymin) / self.cell_size)) + 1
+        self.mask = np.zeros((self.ny, self.nx), dtype=bool)
+
+    def indices(self, points):
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        i = np.floor((points[:, 0] - self.xmin) / self.cell_size).astype(np.intp)
+        j = np.floor((points[:, 1] - self.ymin) / self.cell_size).astype(np.intp)
+        return i, j
+
+    def add(self, points):
+        i, j = self.indices(points)
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                self.mask[np.clip(j + dj, 0, self.ny - 1), np.clip(i + di, 0, self.nx - 1)] = True
+
+    def test(self, points):
+        i, j = self.indices(points)
+        inside = (i >= 0) & (i < self.nx) & (j >= 0) & (j < self.ny)
+        result = np.zeros(len(i), dtype=bool)
+        result[inside] = self.mask[j[inside], i[inside]]
+        return result